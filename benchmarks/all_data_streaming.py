@@ -0,0 +1,60 @@
+"""
+Compare peak memory of parsing an all-data response in one go and of
+decoding it as it streams in.
+
+    $ python benchmarks/all_data_streaming.py --rows 50000
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue).
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from hubbleds.remote import LocalAPI
+from hubbleds.streaming import STREAM_CHUNK_SIZE, AllDataReader
+
+from measurement_decoding import make_payload
+
+
+def parse_whole(body: bytes):
+    return LocalAPI._decode_all_data(json.loads(body))
+
+
+def parse_streaming(body: bytes):
+    reader = AllDataReader()
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        reader.feed(body[start:start + STREAM_CHUNK_SIZE])
+    return reader.finish()
+
+
+def measure(parse, body: bytes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    table, _, _ = parse(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return table, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    body = json.dumps(make_payload(args.rows)).encode()
+    print(f"all-data response: {args.rows} measurements, {len(body) / 2**20:.1f} MiB")
+
+    parsers = (("json + from_records", parse_whole), ("streaming", parse_streaming))
+    for name, parse in parsers:
+        table, elapsed, peak = measure(parse, body)
+        print(
+            f"{name:>20}: {elapsed * 1000:8.1f} ms, peak {peak / 2**20:7.1f} MiB "
+            f"({len(table)} rows)"
+        )
+
+
+if __name__ == "__main__":
+    main()
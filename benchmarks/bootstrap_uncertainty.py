@@ -0,0 +1,57 @@
+"""
+Time the bootstrap of the class H0 and age for a single class and for a
+dataset the size of the all-data response.
+
+    $ python benchmarks/bootstrap_uncertainty.py --students 30 10000 --workers 4
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from hubbleds.bootstrap import BOOTSTRAP_RESAMPLES, bootstrap_hubble_fit
+
+
+def make_class(students: int, per_student: int = 5, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    rows = students * per_student
+    distances = rng.uniform(10, 400, rows)
+    velocities = distances * rng.normal(70, 10, students).repeat(per_student)
+    velocities += rng.normal(0, 500, rows)
+    return np.arange(students).repeat(per_student), distances, velocities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, nargs="+", default=[30, 10_000])
+    parser.add_argument("--resamples", type=int, default=BOOTSTRAP_RESAMPLES)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    for students in args.students:
+        ids, distances, velocities = make_class(students)
+        for resample in ("students", "galaxies"):
+            for workers in sorted({0, args.workers}):
+                start = time.perf_counter()
+                result = bootstrap_hubble_fit(
+                    ids, distances, velocities,
+                    n_resamples=args.resamples,
+                    resample=resample,
+                    workers=workers,
+                )
+                elapsed = time.perf_counter() - start
+                low, high = result.interval()
+                age_low, age_high = result.age_interval()
+                print(
+                    f"{students:>6} students, {resample:>8}, {workers} workers: "
+                    f"{elapsed * 1000:9.1f} ms  "
+                    f"H0 {result.h0:6.2f} [{low:6.2f}, {high:6.2f}]  "
+                    f"age {result.age:6.2f} [{age_low:6.2f}, {age_high:6.2f}] Gyr"
+                )
+
+
+if __name__ == "__main__":
+    main()
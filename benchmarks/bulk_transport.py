@@ -0,0 +1,63 @@
+"""
+Compare fetching and decoding the bulk read endpoints as JSON and as
+Arrow IPC, against the local stub server.
+
+    $ python benchmarks/bulk_transport.py --rows 50000
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue) and
+`pyarrow`.
+"""
+
+import argparse
+import time
+
+import httpx
+
+from hubbleds.remote import LocalAPI
+from hubbleds.transport import BULK_HEADERS, JSON, bulk_measurements, read_bulk_payload
+
+from stub_server import start_server
+
+ENDPOINTS = {
+    "all-data": LocalAPI._decode_all_data,
+    "class-measurements": bulk_measurements,
+}
+
+
+def fetch(client: httpx.Client, url: str, accept: str, decode) -> tuple[int, float]:
+    start = time.perf_counter()
+    r = client.get(url, headers={"Accept": accept})
+    r.raise_for_status()
+    decode(read_bulk_payload(r.headers, r.content))
+    return len(r.content), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    server = start_server(args.rows)
+    base_url = f"http://127.0.0.1:{server.server_port}/hubbles_law"
+    print(f"Fetching from the stub server ({args.rows} rows, best of {args.repeat})")
+
+    with httpx.Client() as client:
+        for endpoint, decode in ENDPOINTS.items():
+            url = f"{base_url}/{endpoint}"
+            for name, accept in (("JSON", JSON), ("Arrow", BULK_HEADERS["Accept"])):
+                results = [
+                    fetch(client, url, accept, decode) for _ in range(args.repeat)
+                ]
+                size = results[0][0]
+                best = min(elapsed for _, elapsed in results)
+                print(
+                    f"{endpoint:>20} {name:>6}: {best * 1000:8.1f} ms, "
+                    f"{size / 2**20:6.2f} MiB"
+                )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
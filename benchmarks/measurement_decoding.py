@@ -0,0 +1,133 @@
+"""
+Compare ways of decoding a large all-data measurement payload.
+
+    $ python benchmarks/measurement_decoding.py --rows 50000
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue).
+"""
+
+import argparse
+import random
+import time
+
+from hubbleds.decoding import decode_measurements
+from hubbleds.measurement_table import MeasurementTable
+from hubbleds.state import StudentMeasurement
+
+ELEMENTS = ["H-α", "Mg-I"]
+
+
+def make_payload(rows: int, galaxies: int = 1000, seed: int = 42) -> dict:
+    """
+    A synthetic `all-data` response with `rows` measurements, shaped like
+    the records the backend returns.
+    """
+    rng = random.Random(seed)
+    galaxy_records = [
+        {
+            "id": i,
+            "name": f"J{rng.randrange(10**9):09d}.fits",
+            "ra": rng.uniform(0, 360),
+            "decl": rng.uniform(-90, 90),
+            "z": rng.uniform(0.001, 0.1),
+            "type": "Sp",
+            "element": rng.choice(ELEMENTS),
+        }
+        for i in range(galaxies)
+    ]
+
+    measurements = []
+    for i in range(rows):
+        galaxy = galaxy_records[rng.randrange(galaxies)]
+        complete = rng.random() > 0.05
+        measurements.append({
+            "student_id": i // 5,
+            "class_id": (i // 5) // 25,
+            "rest_wave_unit": "angstrom",
+            "obs_wave_value": rng.uniform(6500, 7500),
+            "obs_wave_unit": "angstrom",
+            "velocity_value": rng.uniform(1000, 30000) if complete else None,
+            "velocity_unit": "km / s",
+            "ang_size_value": rng.uniform(10, 200),
+            "ang_size_unit": "arcsecond",
+            "est_dist_value": rng.uniform(10, 400) if complete else None,
+            "est_dist_unit": "Mpc",
+            "measurement_number": None,
+            "brightness": 1,
+            "galaxy": dict(galaxy),
+        })
+
+    students = rows // 5
+    student_data = [
+        {
+            "student_id": i,
+            "hubble_fit_value": rng.uniform(50, 100),
+            "age_value": rng.uniform(10, 20),
+        }
+        for i in range(students)
+    ]
+    class_data = [
+        {
+            "class_id": i,
+            "hubble_fit_value": rng.uniform(50, 100),
+            "age_value": rng.uniform(10, 20),
+        }
+        for i in range(students // 25 + 1)
+    ]
+
+    return {
+        "measurements": measurements,
+        "studentData": student_data,
+        "classData": class_data,
+    }
+
+
+def python_loop(records):
+    return [StudentMeasurement(**record) for record in records]
+
+
+def type_adapter(records):
+    return decode_measurements(records, trusted=False)
+
+
+def trusted_construct(records):
+    return decode_measurements(records, trusted=True)
+
+
+def columnar_table(records):
+    return MeasurementTable.from_records(records)
+
+
+DECODERS = {
+    "loop (current)": python_loop,
+    "TypeAdapter": type_adapter,
+    "trusted model_construct": trusted_construct,
+    "MeasurementTable": columnar_table,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = make_payload(args.rows)["measurements"]
+    print(f"Decoding {len(records)} measurement records (best of {args.repeat})")
+
+    baseline = None
+    for name, decode in DECODERS.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = decode(records)
+            timings.append(time.perf_counter() - start)
+        assert len(result) == len(records)
+
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{name:>25}: {best * 1000:9.1f} ms  ({baseline / best:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Local stand-in for the bulk read endpoints of the CosmicDS API
+(`all-data`, `class-measurements`, `sample-measurements`). Each endpoint
+serves Arrow when the `Accept` header asks for it (and `pyarrow` is
+installed), and JSON otherwise: a standard Arrow IPC stream for the
+single-table endpoints, and `ARROW_TABLES` for `all-data`.
+
+    $ python benchmarks/stub_server.py --rows 50000 --port 8765
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue).
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+from hubbleds.transport import (
+    ARROW_STREAM,
+    ARROW_STREAM_KEY,
+    ARROW_TABLES,
+    JSON,
+    pa,
+    write_arrow_stream,
+    write_arrow_tables,
+)
+
+from measurement_decoding import make_payload
+
+CLASS_SIZE = 125
+
+
+def _encode(payload: dict, arrow: bool = True) -> dict[str, bytes]:
+    bodies = {JSON: json.dumps(payload).encode()}
+    if arrow and pa is not None:
+        tables = {
+            key: pa.Table.from_pylist(records) for key, records in payload.items()
+        }
+        if list(tables) == [ARROW_STREAM_KEY]:
+            bodies[ARROW_STREAM] = write_arrow_stream(tables[ARROW_STREAM_KEY])
+        else:
+            bodies[ARROW_TABLES] = write_arrow_tables(tables)
+    return bodies
+
+
+class StubAPI:
+    """
+    Pre-encoded responses for each endpoint, in both formats.
+
+    Parameters
+    ----------
+    rows: int
+        Number of measurements in the `all-data` response
+    arrow: bool
+        Whether to offer Arrow at all, rather than only JSON like an API
+        without the binary transport
+    """
+
+    def __init__(self, rows: int, arrow: bool = True):
+        payload = make_payload(rows)
+        measurements = payload["measurements"]
+        self.responses = {
+            "all-data": _encode(payload, arrow),
+            "class-measurements": _encode(
+                {"measurements": measurements[:CLASS_SIZE]}, arrow
+            ),
+            "sample-measurements": _encode({"measurements": measurements[:2]}, arrow),
+        }
+
+    def response(self, path: str, accept: str) -> tuple[str, bytes] | None:
+        endpoint = next((name for name in self.responses if f"/{name}" in path), None)
+        if endpoint is None:
+            return None
+
+        bodies = self.responses[endpoint]
+        media_type = next(
+            (
+                name for name in (ARROW_STREAM, ARROW_TABLES)
+                if name in accept and name in bodies
+            ),
+            JSON,
+        )
+        return media_type, bodies[media_type]
+
+
+def make_handler(api: StubAPI):
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            response = api.response(self.path, self.headers.get("Accept", ""))
+            if response is None:
+                self.send_error(404)
+                return
+
+            media_type, body = response
+            self.send_response(200)
+            self.send_header("Content-Type", media_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(rows: int, port: int = 0, arrow: bool = True) -> ThreadingHTTPServer:
+    """
+    Start the stub server on a background thread. The base URL of the API
+    is `http://127.0.0.1:<server.server_port>`.
+    """
+    handler = make_handler(StubAPI(rows, arrow))
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    handler = make_handler(StubAPI(args.rows))
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Serving stub API on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
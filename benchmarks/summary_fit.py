@@ -0,0 +1,99 @@
+"""
+Compare the per-student Hubble fits of `make_summary_data` with the
+previous implementation, which fit each student with astropy in a Python
+loop.
+
+    $ python benchmarks/summary_fit.py --students 10000
+
+Requires the full `hubbleds` environment (solara, cosmicds, glue, astropy).
+"""
+
+import argparse
+from collections import defaultdict
+import time
+
+from glue.core import Data
+import numpy as np
+
+from hubbleds.utils import create_single_summary, make_summary_data
+
+
+def make_measurements(students: int, per_student: int = 5, seed: int = 42) -> Data:
+    """
+    Class measurements for `students` students, with about 5% of the rows
+    missing a distance or velocity.
+    """
+    rng = np.random.default_rng(seed)
+    rows = students * per_student
+    distances = rng.uniform(10, 400, rows)
+    velocities = distances * rng.normal(70, 10, students).repeat(per_student)
+    velocities += rng.normal(0, 500, rows)
+    distances[rng.random(rows) < 0.05] = np.nan
+    return Data(
+        student_id=np.arange(students).repeat(per_student),
+        est_dist_value=distances,
+        velocity_value=velocities,
+        label="Class Data",
+    )
+
+
+def legacy_make_summary_data(
+    measurement_data: Data, input_id_field: str = "id"
+) -> dict:
+    # `make_summary_data` before it was vectorized, minus the glue output.
+    #  NaN distances are skipped so that the fits can be compared.
+    dists = defaultdict(list)
+    vels = defaultdict(list)
+    d = measurement_data["est_dist_value"]
+    v = measurement_data["velocity_value"]
+    ids = set()
+
+    for i in range(measurement_data.size):
+        id_num = measurement_data[input_id_field][i]
+        ids.add(id_num)
+        dist = d[i]
+        vel = v[i]
+        if dist is not None and vel is not None and not np.isnan(dist):
+            dists[id_num].append(dist)
+            vels[id_num].append(vel)
+
+    summaries = {}
+    for id_num in ids:
+        summaries[id_num] = create_single_summary(dists[id_num], vels[id_num])
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_measurements(args.students)
+    print(f"Fitting {args.students} students ({data.size} measurements)")
+
+    start = time.perf_counter()
+    legacy = legacy_make_summary_data(data, "student_id")
+    legacy_time = time.perf_counter() - start
+    print(f"{'astropy loop':>16}: {legacy_time * 1000:10.1f} ms")
+
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        summary = make_summary_data(
+            data, input_id_field="student_id", output_id_field="id"
+        )
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    print(f"{'vectorized':>16}: {best * 1000:10.1f} ms ({legacy_time / best:.0f}x)")
+
+    ids = summary["id"]
+    expected = np.array([legacy[i][0] for i in ids])
+    hubbles = summary["hubble_fit_value"]
+    assert len(ids) == len(legacy)
+    np.testing.assert_array_equal(np.isnan(hubbles), np.isnan(expected))
+    print(f"Largest H0 difference: {np.nanmax(np.abs(hubbles - expected)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ from cosmicds.components import ScaffoldAlert
 from cosmicds.logger import setup_logger
 
 # hubbleds
-from hubbleds.remote import LOCAL_API
+from hubbleds.persistence import schedule_stage_state, schedule_story_state
+from hubbleds.hydration import load_stage_state
 from hubbleds.base_component_state import (
     transition_to,
     transition_previous,
@@ -45,22 +46,21 @@ def Page():
     loaded_component_state = solara.use_reactive(False)
     
     async def _load_component_state():
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
         logger.info("Finished loading component state")
         loaded_component_state.set(True)
     
     solara.lab.use_task(_load_component_state)
     
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-        logger.info("Wrote component state to database.")
-
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
     
     # === Setup Glue ===
     
@@ -135,7 +135,10 @@ def Page():
                 event_back_callback = lambda _: transition_previous(COMPONENT_STATE),
                 can_advance=COMPONENT_STATE.value.can_transition(next=True),
                 show=COMPONENT_STATE.value.is_current_step(Marker.mark3),
-                event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                event_fr_callback = lambda event: fr_callback(
+                    event, LOCAL_STATE, COMPONENT_STATE,
+                    lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                ),
                 state_view={
                     'free_response': get_free_response(LOCAL_STATE, COMPONENT_STATE,'fr-1')
                 }
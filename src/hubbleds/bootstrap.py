@@ -0,0 +1,194 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import getenv
+from typing import Any, Literal, Optional, Sequence
+
+import numpy as np
+
+from cosmicds.logger import setup_logger
+
+from hubbleds.hubble_fit import as_float_array, hubble_age
+
+logger = setup_logger("BOOTSTRAP")
+
+BOOTSTRAP_RESAMPLES = int(getenv("HUBBLEDS_BOOTSTRAP_RESAMPLES", 10_000))
+BOOTSTRAP_SEED = 42
+
+# Number of worker processes the resamples are spread over. With 0, they are
+#  computed in the calling process, which is fastest for a single class.
+BOOTSTRAP_WORKERS = int(getenv("HUBBLEDS_BOOTSTRAP_WORKERS", 0))
+
+# Upper bound on the number of draws held in memory at once. The resamples
+#  are computed in chunks of this many draws.
+BOOTSTRAP_CHUNK_DRAWS = 2 ** 21
+
+Resample = Literal["students", "galaxies"]
+
+
+class BootstrapResult:
+    """
+    Bootstrap distribution of the class Hubble constant (a line through the
+    origin fit to all of the class's measurements) and of the implied age of
+    the universe.
+
+    Parameters
+    ----------
+    h0: float
+        The fit to the measurements themselves, NaN if it can't be fit (all
+        distances are 0)
+    samples: np.ndarray
+        The fit to each resample, NaN for resamples whose distances are all
+        0. These are left out of the intervals and counted in `degenerate`.
+    """
+
+    def __init__(self, h0: float, samples: np.ndarray):
+        self.h0 = h0
+        self.samples = samples
+        self.age = float(hubble_age(h0))
+        self.age_samples = hubble_age(samples)
+        self.degenerate = int(np.count_nonzero(np.isnan(samples)))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        """
+        Percentile confidence interval for H0.
+        """
+        return _percentile_interval(self.samples, confidence)
+
+    def age_interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        """
+        Percentile confidence interval for the age (in Gyr).
+        """
+        return _percentile_interval(self.age_samples, confidence)
+
+    def summary(self, confidence: float = 0.95) -> dict[str, Any]:
+        return {
+            "h0": self.h0,
+            "h0_interval": self.interval(confidence),
+            "age": self.age,
+            "age_interval": self.age_interval(confidence),
+            "confidence": confidence,
+            "resamples": len(self),
+            "degenerate": self.degenerate,
+        }
+
+
+def _percentile_interval(samples: np.ndarray, confidence: float) -> tuple[float, float]:
+    tail = 50 * (1 - confidence)
+    if not np.isfinite(samples).any():
+        return np.nan, np.nan
+    low, high = np.nanpercentile(samples, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def _resample_slopes(seed: np.random.SeedSequence,
+                     size: int,
+                     sxy: np.ndarray,
+                     sxx: np.ndarray,
+                     offsets: np.ndarray,
+                     widths: np.ndarray) -> np.ndarray:
+    # Each of the `size` resamples draws position i from the `widths[i]`
+    #  values starting at `offsets[i]`, all in one draw, and fits the line
+    #  through the origin to the drawn sums. Resamples whose distances are
+    #  all 0 have no fit, and are NaN.
+    rng = np.random.default_rng(seed)
+    draws = rng.random((size, len(widths)))
+    draws *= widths
+    index = np.minimum(draws.astype(np.intp), widths - 1)
+    index += offsets
+    sxx_sums = sxx[index].sum(axis=1)
+    slopes = np.full(size, np.nan)
+    np.divide(sxy[index].sum(axis=1), sxx_sums, out=slopes, where=sxx_sums > 0)
+    return slopes
+
+
+def bootstrap_hubble_fit(ids: Sequence,
+                         distances: Sequence[float],
+                         velocities: Sequence[float],
+                         n_resamples: int = BOOTSTRAP_RESAMPLES,
+                         resample: Resample = "students",
+                         seed: Optional[int] = BOOTSTRAP_SEED,
+                         workers: int = BOOTSTRAP_WORKERS) -> BootstrapResult:
+    """
+    Bootstrap the Hubble constant of a set of measurements (e.g. a class).
+
+    Parameters
+    ----------
+    ids: Sequence
+        Student of each measurement
+    distances: Sequence[float]
+    velocities: Sequence[float]
+    n_resamples: int
+        Number of bootstrap resamples
+    resample: "students" | "galaxies"
+        Whether to resample whole students (with all of their measurements),
+        or the galaxies within each student, keeping the students fixed
+    seed: int | None
+        Seed of the resampling. The result depends only on the seed, the
+        data and `n_resamples`, not on `workers`. With None, each call
+        differs.
+    workers: int
+        Number of worker processes to spread the resamples over, e.g. for
+        the all-data set. With 0, they are computed in this process.
+
+    Returns
+    ----------
+    result: BootstrapResult
+        Measurements with a missing (None or NaN) distance, velocity or id
+        are ignored. If all distances are 0, H0 and every resample are NaN.
+    """
+    ids = np.asarray(ids)
+    x = as_float_array(distances)
+    y = as_float_array(velocities)
+    complete = np.isfinite(x) & np.isfinite(y)
+    if ids.dtype.kind == "f":
+        complete &= np.isfinite(ids)
+    elif ids.dtype == object:
+        complete &= np.array([i is not None for i in ids], dtype=bool)
+    ids, x, y = ids[complete], x[complete], y[complete]
+
+    sxx_total = (x * x).sum()
+    h0 = float((x * y).sum() / sxx_total) if sxx_total > 0 else np.nan
+    if not len(x) or n_resamples <= 0:
+        return BootstrapResult(h0, np.empty(0))
+
+    _, groups = np.unique(ids, return_inverse=True)
+    if resample == "students":
+        # Resample the students' sums
+        sxy = np.bincount(groups, weights=x * y)
+        sxx = np.bincount(groups, weights=x * x)
+        offsets = np.zeros(len(sxy), dtype=np.intp)
+        widths = np.full(len(sxy), len(sxy), dtype=np.intp)
+    elif resample == "galaxies":
+        # Resample each measurement from the measurements of its student
+        order = np.argsort(groups, kind="stable")
+        x, y, groups = x[order], y[order], groups[order]
+        sxy, sxx = x * y, x * x
+        counts = np.bincount(groups)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        offsets = starts[groups].astype(np.intp)
+        widths = counts[groups].astype(np.intp)
+    else:
+        raise ValueError(f"Unknown resampling `{resample}`")
+
+    chunk = max(1, BOOTSTRAP_CHUNK_DRAWS // len(widths))
+    sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(s, size, sxy, sxx, offsets, widths) for s, size in zip(seeds, sizes)]
+
+    if workers > 0 and len(args) > 1:
+        logger.info("Bootstrapping %d resamples in %d processes.", n_resamples, workers)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_resample_slopes, *zip(*args)))
+    else:
+        chunks = [_resample_slopes(*arg) for arg in args]
+
+    result = BootstrapResult(h0, np.concatenate(chunks))
+    if result.degenerate:
+        logger.warning(
+            "%d of %d resamples have only zero distances; leaving them out.",
+            result.degenerate,
+            n_resamples,
+        )
+    return result
@@ -22,10 +22,9 @@ def SelectionTool(
 
         def _add_widget():
             selection_tool_widget = SelectionToolWidget(
-                table_layer_data={
-                    k: [x.dict()[k] for x in LOCAL_STATE.value.galaxies.values()]
-                    for k in ["id", "ra", "decl"]
-                }
+                table_layer_data=LOCAL_STATE.value.galaxies.columns(
+                    ["id", "ra", "decl"]
+                )
             )
 
             tool_widget = solara.get_widget(tool_container)
@@ -42,12 +41,12 @@ def SelectionTool(
         solara.use_effect(_add_widget, dependencies=[])
 
         def _on_galaxy_selected(gal: dict):
-            data = LOCAL_STATE.value.galaxies[int(gal["id"])]
+            data = LOCAL_STATE.value.galaxies.galaxy(gal["id"])
             galaxy_added_callback(data)
 
         def _on_current_galaxy_changed(change: dict):
             gal = change["new"]
-            data = LOCAL_STATE.value.galaxies[int(gal["id"])]
+            data = LOCAL_STATE.value.galaxies.galaxy(gal["id"])
             galaxy_selected_callback(data)
 
         def _setup_callbacks():
@@ -0,0 +1,54 @@
+from typing import Any
+
+from pydantic import TypeAdapter
+
+from hubbleds.galaxy_catalog import GALAXY_POOL
+from hubbleds.state import ClassSummary, StudentMeasurement, StudentSummary
+
+STUDENT_MEASUREMENTS = TypeAdapter(list[StudentMeasurement])
+STUDENT_SUMMARIES = TypeAdapter(list[StudentSummary])
+CLASS_SUMMARIES = TypeAdapter(list[ClassSummary])
+
+
+def _construct_measurement(record: dict[str, Any]) -> StudentMeasurement:
+    galaxy = record.get("galaxy")
+    if galaxy is not None:
+        record = {**record, "galaxy_id": GALAXY_POOL.intern(galaxy).id}
+    return StudentMeasurement.model_construct(**record)
+
+
+def decode_measurements(
+    records: list[dict[str, Any]], trusted: bool = False
+) -> list[StudentMeasurement]:
+    """
+    Decode a list of measurement records in one pass. The galaxies of the
+    records are stored once, in `GALAXY_POOL`, and the measurements refer
+    to them by id.
+
+    Parameters
+    ----------
+    records: list[dict]
+        Measurement records, e.g. the `measurements` of an API response.
+        The records are not modified.
+    trusted: bool
+        If True, build the models without validating the records, which is
+        several times faster for large payloads. Only use this for bulk
+        backend data whose types are already known to be right; a malformed
+        record then becomes a silently malformed model.
+
+    Returns
+    ----------
+    measurements: list[StudentMeasurement]
+    """
+    if trusted:
+        return [_construct_measurement(record) for record in records]
+
+    return STUDENT_MEASUREMENTS.validate_python(records)
+
+
+def decode_student_summaries(records: list[dict[str, Any]]) -> list[StudentSummary]:
+    return STUDENT_SUMMARIES.validate_python(records)
+
+
+def decode_class_summaries(records: list[dict[str, Any]]) -> list[ClassSummary]:
+    return CLASS_SUMMARIES.validate_python(records)
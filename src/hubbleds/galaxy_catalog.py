@@ -0,0 +1,256 @@
+from os import getenv
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from hubbleds.state import GalaxyData
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("GALAXY-CATALOG")
+
+# How long (in seconds) a loaded catalog is served before it is revalidated
+#  against the backend
+CATALOG_REFRESH_INTERVAL = float(getenv("HUBBLEDS_CATALOG_REFRESH_INTERVAL", 600))
+
+_NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "ra": np.float64,
+    "decl": np.float64,
+    "z": np.float64,
+}
+_STRING_COLUMNS = ("name", "type", "element")
+
+
+class GalaxyCatalog:
+    """
+    Immutable, columnar view of the galaxy catalog for a story.
+
+    Each field of `GalaxyData` is stored as a read-only NumPy array, with an
+    index from galaxy id to row. `GalaxyData` instances are only created
+    when a galaxy is looked up, and are then shared by every session in the
+    process, so they must be treated as read-only.
+
+    Parameters
+    ----------
+    records: list[dict]
+        Galaxy records, as returned by the `galaxies` endpoint
+    etag: str | None
+        `ETag` validator of the response the records came from
+    last_modified: str | None
+        `Last-Modified` validator of the response the records came from
+    """
+
+    def __init__(self,
+                 records: list[dict[str, Any]],
+                 etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+        columns: dict[str, np.ndarray] = {}
+        for name, dtype in _NUMERIC_COLUMNS.items():
+            columns[name] = np.fromiter(
+                (r[name] for r in records), dtype=dtype, count=len(records)
+            )
+        for name in _STRING_COLUMNS:
+            columns[name] = np.array([r[name] for r in records], dtype=object)
+        for array in columns.values():
+            array.setflags(write=False)
+
+        self._columns = columns
+        self._index = {
+            int(galaxy_id): row for row, galaxy_id in enumerate(columns["id"])
+        }
+        self._galaxies: dict[int, GalaxyData] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, galaxy_id: int) -> bool:
+        return int(galaxy_id) in self._index
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._columns["id"]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    def columns(self, names: list[str]) -> dict[str, list]:
+        """
+        Plain-list copies of the requested columns, e.g. for sending to a widget.
+        """
+        return {name: self._columns[name].tolist() for name in names}
+
+    def row(self, galaxy_id: int) -> int:
+        return self._index[int(galaxy_id)]
+
+    def galaxy(self, galaxy_id: int) -> GalaxyData:
+        galaxy_id = int(galaxy_id)
+        galaxy = self._galaxies.get(galaxy_id)
+        if galaxy is not None:
+            return galaxy
+
+        row = self._index[galaxy_id]
+        galaxy = GalaxyData.model_construct(
+            **{name: array[row].item() if name in _NUMERIC_COLUMNS else array[row]
+               for name, array in self._columns.items()}
+        )
+        with self._lock:
+            return self._galaxies.setdefault(galaxy_id, galaxy)
+
+    def get(self, galaxy_id: int, default=None) -> Optional[GalaxyData]:
+        if galaxy_id not in self:
+            return default
+        return self.galaxy(galaxy_id)
+
+    def galaxies(self) -> list[GalaxyData]:
+        return [self.galaxy(galaxy_id) for galaxy_id in self._index]
+
+    def sample(self,
+               size: int,
+               exclude: Optional[list[int]] = None,
+               rng: Optional[np.random.Generator] = None) -> list[GalaxyData]:
+        """
+        Draw `size` distinct galaxies at random, optionally excluding some ids.
+        """
+        ids = self.ids
+        if exclude:
+            ids = ids[~np.isin(ids, exclude)]
+        choice = rng.choice if rng is not None else np.random.choice
+        return [
+            self.galaxy(galaxy_id)
+            for galaxy_id in choice(ids, size=size, replace=False)
+        ]
+
+
+class GalaxyCatalogCache:
+    """
+    Process-wide store of galaxy catalogs, one per story. A catalog is
+    considered fresh for `refresh_interval` seconds after it was last
+    loaded or revalidated; after that, callers should revalidate it with a
+    conditional request using the catalog's `etag` and `last_modified`.
+    """
+
+    def __init__(self, refresh_interval: float = CATALOG_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._catalogs: dict[str, GalaxyCatalog] = {}
+        self._checked: dict[str, float] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.revalidations = 0
+
+    def lock(self, story_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(story_id, threading.Lock())
+
+    def get(self, story_id: str) -> Optional[GalaxyCatalog]:
+        return self._catalogs.get(story_id)
+
+    def is_fresh(self, story_id: str) -> bool:
+        checked = self._checked.get(story_id)
+        return (
+            checked is not None
+            and time.monotonic() - checked < self.refresh_interval
+        )
+
+    def store(self, story_id: str, catalog: GalaxyCatalog):
+        self._catalogs[story_id] = catalog
+        self._checked[story_id] = time.monotonic()
+        self.loads += 1
+        logger.info(
+            "Loaded galaxy catalog for `%s` (%d galaxies).", story_id, len(catalog)
+        )
+
+    def revalidated(self, story_id: str):
+        self._checked[story_id] = time.monotonic()
+        self.revalidations += 1
+
+    def find(self, galaxy_id: int) -> Optional[GalaxyData]:
+        """
+        Look up a galaxy in whichever loaded catalog contains it.
+        """
+        for catalog in list(self._catalogs.values()):
+            if galaxy_id in catalog:
+                return catalog.galaxy(galaxy_id)
+        return None
+
+    def validators(self, story_id: str) -> dict[str, str]:
+        catalog = self._catalogs.get(story_id)
+        headers = {}
+        if catalog is not None:
+            if catalog.etag:
+                headers["If-None-Match"] = catalog.etag
+            if catalog.last_modified:
+                headers["If-Modified-Since"] = catalog.last_modified
+        return headers
+
+
+class GalaxyPool:
+    """
+    Process-wide flyweight store of `GalaxyData`, keyed by galaxy id.
+
+    Measurements refer to one shared `GalaxyData` per galaxy instead of
+    each holding its own copy. Galaxies are taken from the loaded catalogs
+    where possible; galaxies that only appear in measurement payloads are
+    validated once, the first time they are seen. As with the catalog, the
+    shared instances must be treated as read-only.
+
+    Parameters
+    ----------
+    catalogs: GalaxyCatalogCache
+        The catalogs to resolve galaxy ids from
+    """
+
+    def __init__(self, catalogs: GalaxyCatalogCache):
+        self._catalogs = catalogs
+        self._galaxies: dict[int, GalaxyData] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._galaxies)
+
+    def get(self, galaxy_id: int) -> Optional[GalaxyData]:
+        galaxy_id = int(galaxy_id)
+        galaxy = self._galaxies.get(galaxy_id)
+        if galaxy is None:
+            galaxy = self._catalogs.find(galaxy_id)
+            if galaxy is not None:
+                with self._lock:
+                    galaxy = self._galaxies.setdefault(galaxy_id, galaxy)
+        return galaxy
+
+    def intern(self, galaxy: GalaxyData | dict[str, Any]) -> GalaxyData:
+        """
+        Return the shared instance for a galaxy, given as a model or as a
+        record from the API.
+        """
+        galaxy_id = galaxy["id"] if isinstance(galaxy, dict) else galaxy.id
+        shared = self.get(galaxy_id)
+        if shared is not None:
+            return shared
+
+        if isinstance(galaxy, dict):
+            galaxy = GalaxyData.model_validate(galaxy)
+        with self._lock:
+            return self._galaxies.setdefault(int(galaxy_id), galaxy)
+
+    def resolve(self, galaxy_ids: np.ndarray) -> np.ndarray:
+        """
+        Resolve an array of galaxy ids to an object array of the shared
+        galaxies. An id of 0 means no galaxy, and resolves to None.
+        """
+        ids, inverse = np.unique(galaxy_ids, return_inverse=True)
+        galaxies = np.empty(len(ids), dtype=object)
+        for i, galaxy_id in enumerate(ids):
+            galaxies[i] = self.get(galaxy_id) if galaxy_id else None
+        return galaxies[inverse]
+
+
+GALAXY_CATALOGS = GalaxyCatalogCache()
+GALAXY_POOL = GalaxyPool(GALAXY_CATALOGS)
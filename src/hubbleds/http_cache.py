@@ -0,0 +1,565 @@
+from collections import OrderedDict
+import hashlib
+import json
+from os import getenv, replace
+from pathlib import Path
+import re
+from tempfile import NamedTemporaryFile, gettempdir
+import threading
+import time
+from typing import Any, Mapping, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from cosmicds.logger import setup_logger
+
+from hubbleds.resilience import ResilientAdapter, is_backend_failure
+
+logger = setup_logger("HTTP-CACHE")
+
+HTTP_CACHE_DIR = getenv(
+    "HUBBLEDS_HTTP_CACHE_DIR",
+    (Path(gettempdir()) / "hubbleds" / "http").as_posix(),
+)
+HTTP_CACHE_MAX_BYTES = int(getenv("HUBBLEDS_HTTP_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Comma-separated names of the endpoints to cache (see `DEFAULT_POLICIES`),
+#  and per-endpoint overrides of how long (in seconds) a stored response is
+#  served without revalidating, e.g. "spectra=86400,sample-galaxy=300"
+HTTP_CACHE_ENDPOINTS = getenv("HUBBLEDS_HTTP_CACHE_ENDPOINTS")
+HTTP_CACHE_MAX_AGE = getenv("HUBBLEDS_HTTP_CACHE_MAX_AGE", "")
+
+VALIDATOR_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+# How each cacheable request was answered: from the cache without a request,
+#  by revalidating, by the backend, or from the cache after the backend failed
+_OUTCOMES = ("hits", "revalidated", "misses", "stale")
+
+# Headers that describe the body as sent rather than as stored
+_TRANSFER_HEADERS = {
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+}
+
+
+class CachePolicy:
+    """
+    How the responses of one endpoint are cached.
+
+    Parameters
+    ----------
+    pattern: str
+        Regular expression searched for in the path of request URLs
+    max_age: float
+        How long (in seconds) a stored response is served without asking the
+        server. After that, or always if 0, it is revalidated with a
+        conditional request.
+    """
+
+    def __init__(self, pattern: str, max_age: float = 0):
+        self.pattern = re.compile(pattern)
+        self.max_age = max_age
+
+
+DEFAULT_POLICIES = {
+    "galaxies": CachePolicy(r"/galaxies$"),
+    "sample-galaxy": CachePolicy(r"/sample-galaxy$"),
+    # Only the seed measurements; the per-student reads under
+    #  `/sample-measurements/{student_id}/...` change as students work
+    "sample-measurements": CachePolicy(r"/sample-measurements$"),
+    # Spectra files never change once published
+    "spectra": CachePolicy(r"/spectra/", max_age=24 * 60 * 60),
+}
+
+
+def http_cache_policies() -> dict[str, CachePolicy]:
+    """
+    The default policies, restricted and adjusted by the environment.
+    """
+    names = list(DEFAULT_POLICIES)
+    if HTTP_CACHE_ENDPOINTS is not None:
+        names = [
+            name.strip()
+            for name in HTTP_CACHE_ENDPOINTS.split(",")
+            if name.strip() in DEFAULT_POLICIES
+        ]
+
+    max_ages = {}
+    for item in HTTP_CACHE_MAX_AGE.split(","):
+        name, _, value = item.partition("=")
+        if value:
+            max_ages[name.strip()] = float(value)
+
+    return {
+        name: CachePolicy(DEFAULT_POLICIES[name].pattern.pattern,
+                          max_ages.get(name, DEFAULT_POLICIES[name].max_age))
+        for name in names
+    }
+
+
+class CacheEntry:
+    """
+    A stored response: the headers and size of its body, which is kept in
+    a file next to the entry's metadata.
+    """
+
+    def __init__(self, key: str, endpoint: str, url: str,
+                 headers: dict[str, str], size: int, stored_at: float):
+        self.key = key
+        self.endpoint = endpoint
+        self.url = url
+        self.headers = headers
+        self.size = size
+        self.stored_at = stored_at
+
+    def validators(self) -> dict[str, str]:
+        headers = CaseInsensitiveDict(self.headers)
+        validators = {}
+        if headers.get("ETag"):
+            validators["If-None-Match"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+        return validators
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "key": self.key,
+            "endpoint": self.endpoint,
+            "url": self.url,
+            "headers": self.headers,
+            "size": self.size,
+            "stored_at": self.stored_at,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "CacheEntry":
+        return cls(**data)
+
+
+class CacheLookup:
+    """
+    A cacheable request, and what the cache holds for it.
+    """
+
+    def __init__(self, endpoint: str, key: str, url: str,
+                 entry: Optional[CacheEntry], fresh: bool):
+        self.endpoint = endpoint
+        self.key = key
+        self.url = url
+        self.entry = entry
+        self.fresh = fresh
+
+
+class HTTPCache:
+    """
+    Process-wide cache of responses from read-only API endpoints.
+
+    Responses are stored with their `ETag` and `Last-Modified` validators
+    and revalidated with conditional requests, so an unchanged resource
+    costs a `304` rather than its whole body. Bodies are kept on disk
+    under `cache_dir`, shared by every worker on the machine, and the least
+    recently used are evicted once they exceed `max_bytes`. Which endpoints
+    are cached, and for how long responses are served without revalidating,
+    is set per endpoint by `policies`.
+
+    Requests that already carry validators are left alone, since the caller
+    is then doing its own revalidation. If the backend fails, a stored
+    response is served instead, however old it is.
+
+    Parameters
+    ----------
+    cache_dir: str | Path
+        Directory for stored responses
+    max_bytes: int
+        Disk budget for stored bodies
+    policies: dict[str, CachePolicy] | None
+        Policies keyed by endpoint name. Defaults to `http_cache_policies()`.
+    """
+
+    def __init__(self,
+                 cache_dir: str | Path = HTTP_CACHE_DIR,
+                 max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 policies: Optional[dict[str, CachePolicy]] = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.policies = policies if policies is not None else http_cache_policies()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._nbytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        self._counts: dict[str, dict[str, int]] = {}
+        self.evictions = 0
+
+    def endpoint(self, url: str) -> Optional[str]:
+        path = urlsplit(url).path
+        return next(
+            (
+                name for name, policy in self.policies.items()
+                if policy.pattern.search(path)
+            ),
+            None,
+        )
+
+    @staticmethod
+    def key(url: str, accept: Optional[str]) -> str:
+        # Responses to the same URL differ by negotiated format
+        return hashlib.sha256(f"{url}\n{accept or ''}".encode()).hexdigest()[:32]
+
+    def prepare(self, method: str, url: str,
+                headers: Mapping[str, str]) -> Optional[CacheLookup]:
+        """
+        Look up a request. Returns None if the request is not cacheable.
+        """
+        if method != "GET" or any(name in headers for name in VALIDATOR_HEADERS):
+            return None
+        endpoint = self.endpoint(url)
+        if endpoint is None:
+            return None
+
+        key = self.key(url, headers.get("Accept"))
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        max_age = self.policies[endpoint].max_age
+        fresh = (
+            entry is not None
+            and max_age > 0
+            and time.time() - entry.stored_at < max_age
+        )
+        return CacheLookup(endpoint, key, url, entry, fresh)
+
+    def cached(self, lookup: CacheLookup) -> Optional[tuple[dict[str, str], bytes]]:
+        """
+        The stored response for a fresh lookup, served without a request.
+        """
+        body = self._read(lookup.entry)
+        if body is None:
+            return None
+        self._count(lookup.endpoint, "hits")
+        return lookup.entry.headers, body
+
+    def revalidated(
+        self, lookup: CacheLookup, headers: Mapping[str, str]
+    ) -> Optional[tuple[dict[str, str], bytes]]:
+        """
+        Handle a `304` to a conditional request. Returns the stored response,
+        with its headers updated from the `304`, or None if the stored body
+        has gone and the resource must be requested again.
+        """
+        entry = lookup.entry
+        body = self._read(entry)
+        if body is None:
+            return None
+
+        entry.headers = {**entry.headers, **_stored_headers(headers)}
+        entry.stored_at = time.time()
+        try:
+            self._write_meta(entry)
+        except OSError as e:
+            logger.warning(
+                "Failed to update stored response for `%s`: %s", lookup.url, e
+            )
+        self._count(lookup.endpoint, "revalidated")
+        return entry.headers, body
+
+    def stale(self, lookup: CacheLookup) -> Optional[tuple[dict[str, str], bytes]]:
+        """
+        The stored response for a request the backend failed to answer, if
+        there is one.
+        """
+        if lookup.entry is None:
+            return None
+        body = self._read(lookup.entry)
+        if body is None:
+            return None
+        self._count(lookup.endpoint, "stale")
+        logger.warning("Backend failed; serving stored response for `%s`.", lookup.url)
+        return lookup.entry.headers, body
+
+    def store(self, lookup: CacheLookup, status_code: int,
+              headers: Mapping[str, str], body: bytes):
+        """
+        Handle a full response to a request that the cache could not answer.
+        """
+        self._count(lookup.endpoint, "misses")
+
+        headers = _stored_headers(headers)
+        entry = CacheEntry(
+            lookup.key, lookup.endpoint, lookup.url, headers, len(body), time.time()
+        )
+        storable = entry.validators() or self.policies[lookup.endpoint].max_age > 0
+        if status_code != 200 or not storable or len(body) > self.max_bytes:
+            return
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to temporary files first so that other workers never
+            #  see a partially written response
+            with NamedTemporaryFile(
+                dir=self.cache_dir, suffix=".tmp", delete=False
+            ) as f:
+                f.write(body)
+            replace(f.name, self._body_path(lookup.key))
+            self._write_meta(entry)
+        except OSError as e:
+            logger.warning("Failed to store response for `%s`: %s", lookup.url, e)
+            return
+
+        with self._lock:
+            self._insert(entry)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            totals = dict.fromkeys(_OUTCOMES, 0)
+            for endpoint, counts in self._counts.items():
+                endpoints[endpoint] = _with_hit_ratio(counts)
+                for name in totals:
+                    totals[name] += counts[name]
+            return {
+                **_with_hit_ratio(totals),
+                "endpoints": endpoints,
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self._counts.clear()
+
+    def _count(self, endpoint: str, outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, dict.fromkeys(_OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def _body_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.body"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load(self):
+        # Caller must hold the lock. Picks up the responses stored by earlier
+        #  runs, least recently stored first.
+        if self._loaded:
+            return
+        self._loaded = True
+
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                entries.append(CacheEntry.from_json(json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError):
+                path.unlink(missing_ok=True)
+        for entry in sorted(entries, key=lambda entry: entry.stored_at):
+            self._insert(entry)
+
+    def _insert(self, entry: CacheEntry):
+        # Caller must hold the lock
+        previous = self._entries.pop(entry.key, None)
+        if previous is not None:
+            self._nbytes -= previous.size
+        self._entries[entry.key] = entry
+        self._nbytes += entry.size
+
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        # Caller must hold the lock
+        entry = self._entries.pop(key)
+        self._nbytes -= entry.size
+        self._body_path(key).unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+
+    def _read(self, entry: CacheEntry) -> Optional[bytes]:
+        try:
+            return self._body_path(entry.key).read_bytes()
+        except OSError:
+            # Evicted by another worker
+            with self._lock:
+                if entry.key in self._entries:
+                    self._remove(entry.key)
+            return None
+
+    def _write_meta(self, entry: CacheEntry):
+        with NamedTemporaryFile(
+            "w", dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(entry.to_json(), f)
+        replace(f.name, self._meta_path(entry.key))
+
+
+def _stored_headers(headers: Mapping[str, str]) -> dict[str, str]:
+    # Bodies are stored decoded, so headers about how they were sent are dropped
+    return {
+        name: value
+        for name, value in headers.items()
+        if name.lower() not in _TRANSFER_HEADERS
+    }
+
+
+def _with_hit_ratio(counts: dict[str, int]) -> dict[str, Any]:
+    requests = sum(counts.values())
+    return {
+        **counts,
+        "requests": requests,
+        "hit_ratio": (requests - counts["misses"]) / requests if requests else 0.0,
+    }
+
+
+class CachingAdapter(ResilientAdapter):
+    """
+    `requests` transport adapter that answers requests from an `HTTPCache`,
+    in front of the retries and circuit breaker of `ResilientAdapter`.
+
+    Parameters
+    ----------
+    cache: HTTPCache
+    """
+
+    def __init__(self, cache: HTTPCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs) -> Response:
+        lookup = self.cache.prepare(request.method, request.url, request.headers)
+        if lookup is None:
+            return super().send(request, **kwargs)
+
+        if lookup.fresh:
+            cached = self.cache.cached(lookup)
+            if cached is not None:
+                return self._cached_response(request, *cached)
+
+        if lookup.entry is not None:
+            request.headers.update(lookup.entry.validators())
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            cached = self.cache.stale(lookup) if is_backend_failure(e) else None
+            if cached is None:
+                raise
+            return self._cached_response(request, *cached)
+
+        if response.status_code >= 500:
+            cached = self.cache.stale(lookup)
+            if cached is not None:
+                response.close()
+                return self._cached_response(request, *cached)
+
+        if response.status_code == 304 and lookup.entry is not None:
+            cached = self.cache.revalidated(lookup, response.headers)
+            if cached is not None:
+                return self._cached_response(request, *cached)
+            for name in VALIDATOR_HEADERS:
+                request.headers.pop(name, None)
+            response = super().send(request, **kwargs)
+
+        self.cache.store(
+            lookup, response.status_code, response.headers, response.content
+        )
+        return response
+
+    def _cached_response(
+        self, request, headers: dict[str, str], body: bytes
+    ) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = body
+        return response
+
+
+class AsyncCachingTransport(httpx.AsyncBaseTransport):
+    """
+    `httpx` transport that answers requests from an `HTTPCache`, and passes
+    everything else to the wrapped transport.
+
+    Parameters
+    ----------
+    cache: HTTPCache
+    transport: httpx.AsyncBaseTransport
+    """
+
+    def __init__(self, cache: HTTPCache, transport: httpx.AsyncBaseTransport):
+        self.cache = cache
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        lookup = self.cache.prepare(request.method, str(request.url), request.headers)
+        if lookup is None:
+            return await self.transport.handle_async_request(request)
+
+        if lookup.fresh:
+            cached = self.cache.cached(lookup)
+            if cached is not None:
+                return self._cached_response(request, *cached)
+
+        if lookup.entry is not None:
+            request.headers.update(lookup.entry.validators())
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception as e:
+            cached = self.cache.stale(lookup) if is_backend_failure(e) else None
+            if cached is None:
+                raise
+            return self._cached_response(request, *cached)
+
+        if response.status_code >= 500:
+            cached = self.cache.stale(lookup)
+            if cached is not None:
+                await response.aclose()
+                return self._cached_response(request, *cached)
+
+        if response.status_code == 304 and lookup.entry is not None:
+            await response.aclose()
+            cached = self.cache.revalidated(lookup, response.headers)
+            if cached is not None:
+                return self._cached_response(request, *cached)
+            for name in VALIDATOR_HEADERS:
+                request.headers.pop(name, None)
+            response = await self.transport.handle_async_request(request)
+
+        # Read (and decode) the body here so it can be stored
+        body = await response.aread()
+        await response.aclose()
+        self.cache.store(lookup, response.status_code, response.headers, body)
+        return httpx.Response(
+            response.status_code,
+            headers=_stored_headers(response.headers),
+            content=body,
+            request=request,
+        )
+
+    @staticmethod
+    def _cached_response(
+        request: httpx.Request, headers: dict[str, str], body: bytes
+    ) -> httpx.Response:
+        return httpx.Response(200, headers=headers, content=body, request=request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+HTTP_CACHE = HTTPCache()
@@ -0,0 +1,415 @@
+from typing import Hashable, Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# Converts 1 / H0 (H0 in km/s/Mpc) to an age in Gyr. These are the values
+#  astropy uses for a megaparsec and a (Julian) year.
+MPC_TO_KM = 3.0856775814913673e19
+GYR_TO_S = 1e9 * 365.25 * 86400
+AGE_FACTOR = MPC_TO_KM / GYR_TO_S
+
+
+def as_float_array(values: Sequence) -> np.ndarray:
+    """
+    Values as a float array, with missing values (None) as NaN.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        return np.fromiter(
+            (np.nan if value is None else value for value in values),
+            dtype=float,
+            count=len(values),
+        )
+    return values.astype(float, copy=False)
+
+
+def hubble_age(h0):
+    """
+    The age of the universe (in Gyr, rounded to 3 decimals) implied by a
+    Hubble constant, as `utils.age_in_gyr_simple` computes it. Works
+    elementwise on arrays.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.round(AGE_FACTOR / np.asarray(h0, dtype=float), 3)
+
+
+class FitParameter(NamedTuple):
+    """
+    A fitted parameter. Like an astropy `Parameter`, its value is `.value`.
+    """
+    value: float
+    stderr: float = np.nan
+
+
+class LineFit:
+    """
+    A fitted line, y = slope * x + intercept. It exposes the same `slope`,
+    `intercept` and call interface as the astropy `Linear1D` that
+    `utils.fit_line` used to return.
+
+    Parameters
+    ----------
+    slope: FitParameter
+    intercept: FitParameter
+        Fixed at 0 (with no standard error) for lines through the origin
+    weights: np.ndarray, optional
+        The weights of the points that were fit
+    """
+
+    def __init__(self,
+                 slope: FitParameter,
+                 intercept: FitParameter = FitParameter(0.0),
+                 weights: Optional[np.ndarray] = None):
+        self.slope = slope
+        self.intercept = intercept
+        self.weights = weights
+
+    @property
+    def stderr(self) -> float:
+        """
+        Standard error of the slope.
+        """
+        return self.slope.stderr
+
+    def __call__(self, x):
+        return self.slope.value * np.asarray(x, dtype=float) + self.intercept.value
+
+
+def solve_line(x: Sequence[float],
+               y: Sequence[float],
+               weights: Optional[Sequence[float]] = None,
+               intercept: bool = False) -> Optional[LineFit]:
+    """
+    Least-squares fit of a line to the points (x, y), in closed form. By
+    default the line passes through the origin, so that its slope is
+    sum(x * y) / sum(x ** 2).
+
+    Parameters
+    ----------
+    x: Sequence[float]
+    y: Sequence[float]
+    weights: Sequence[float], optional
+        Weight of each point's residual, as for astropy's fitters (1 / sigma
+        for Gaussian uncertainties)
+    intercept: bool
+        Whether to fit the intercept too
+
+    Returns
+    -------
+    LineFit | None
+        The fitted line, or None if there are too few complete points (with
+        distinct x values) to fit it. Points with a missing (None or NaN)
+        coordinate or weight are ignored.
+    """
+    x = as_float_array(x)
+    y = as_float_array(y)
+    w2 = np.ones_like(x) if weights is None else as_float_array(weights) ** 2
+
+    complete = np.isfinite(x) & np.isfinite(y) & np.isfinite(w2)
+    x, y, w2 = x[complete], y[complete], w2[complete]
+    n = len(x)
+    dof = n - (2 if intercept else 1)
+
+    sw = w2.sum()
+    if intercept:
+        if n < 2:
+            return None
+        x_mean = (w2 * x).sum() / sw
+        y_mean = (w2 * y).sum() / sw
+        dx = x - x_mean
+        sxx = (w2 * dx * dx).sum()
+        if sxx == 0:
+            return None
+        slope = (w2 * dx * (y - y_mean)).sum() / sxx
+        offset = y_mean - slope * x_mean
+    else:
+        sxx = (w2 * x * x).sum()
+        if n == 0 or sxx == 0:
+            return None
+        slope = (w2 * x * y).sum() / sxx
+        offset = 0.0
+
+    residuals = y - slope * x - offset
+    variance = (w2 * residuals * residuals).sum() / dof if dof > 0 else np.nan
+    slope_stderr = np.sqrt(variance / sxx)
+
+    if intercept:
+        intercept_stderr = np.sqrt(variance * (1 / sw + x_mean * x_mean / sxx))
+        fitted_intercept = FitParameter(offset, intercept_stderr)
+    else:
+        fitted_intercept = FitParameter(0.0)
+
+    return LineFit(
+        FitParameter(slope, slope_stderr),
+        fitted_intercept,
+        None if weights is None else np.sqrt(w2),
+    )
+
+
+class GroupedHubbleFit:
+    """
+    Fits of a line through the origin, velocity = H0 * distance, for each
+    group of measurements (e.g. each student), computed for all groups at
+    once.
+
+    For a line through the origin the least-squares slope of a group is
+    sum(x * y) / sum(x ** 2), so every group is fit with a few weighted
+    `np.bincount` passes over the measurements. Measurements with a missing
+    (None or NaN) id are ignored, and so are the coordinates of measurements
+    with a missing distance or velocity; a group without any complete
+    measurement is kept, with a NaN fit.
+
+    Parameters
+    ----------
+    ids: Sequence
+        Group of each measurement
+    distances: Sequence[float]
+    velocities: Sequence[float]
+
+    Attributes
+    ----------
+    ids: np.ndarray
+        The groups, sorted
+    slopes: np.ndarray
+        Fitted H0 of each group. NaN if the group has no complete
+        measurement, or all of its distances are 0.
+    ages: np.ndarray
+        Age of the universe (in Gyr) implied by each slope
+    counts: np.ndarray
+        Number of complete measurements in each group
+    rms: np.ndarray
+        Root mean square of each group's velocity residuals
+    """
+
+    def __init__(self, ids: Sequence, distances: Sequence, velocities: Sequence):
+        ids = np.asarray(ids)
+        x = as_float_array(distances)
+        y = as_float_array(velocities)
+
+        if ids.dtype.kind == "f":
+            has_id = np.isfinite(ids)
+        elif ids.dtype == object:
+            has_id = np.array([i is not None for i in ids], dtype=bool)
+        else:
+            has_id = np.ones(len(ids), dtype=bool)
+        ids, x, y = ids[has_id], x[has_id], y[has_id]
+
+        self.ids, groups = np.unique(ids, return_inverse=True)
+        n = len(self.ids)
+
+        # Incomplete measurements keep their group but add nothing to its sums
+        complete = np.isfinite(x) & np.isfinite(y)
+        x = np.where(complete, x, 0.0)
+        y = np.where(complete, y, 0.0)
+
+        self.counts = np.bincount(groups, weights=complete, minlength=n).astype(int)
+        sxx = np.bincount(groups, weights=x * x, minlength=n)
+        sxy = np.bincount(groups, weights=x * y, minlength=n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.slopes = sxy / sxx
+            residuals = np.where(complete, y - self.slopes[groups] * x, 0.0)
+            self.rms = np.sqrt(
+                np.bincount(groups, weights=residuals * residuals, minlength=n)
+                / self.counts
+            )
+        self.ages = hubble_age(self.slopes)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class RegressionSums:
+    """
+    Running sums (n, Σx, Σy, Σxy, Σx²) of a set of points, from which their
+    least-squares line can be computed at any time. Points are added and
+    removed in O(1).
+    """
+
+    __slots__ = ("n", "sx", "sy", "sxy", "sxx")
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxy = self.sxx = 0.0
+
+    def add(self, x: float, y: float, sign: int = 1):
+        self.n += sign
+        if self.n == 0:
+            # Start over rather than keep the rounding errors of the removals
+            self.sx = self.sy = self.sxy = self.sxx = 0.0
+            return
+        self.sx += sign * x
+        self.sy += sign * y
+        self.sxy += sign * x * y
+        self.sxx += sign * x * x
+
+    def remove(self, x: float, y: float):
+        self.add(x, y, -1)
+
+    @property
+    def slope(self) -> float:
+        """
+        Slope of the line through the origin (H0, for distances and
+        velocities). NaN without points, or if all x are 0.
+        """
+        return self.sxy / self.sxx if self.sxx else np.nan
+
+    @property
+    def age(self) -> float:
+        return float(hubble_age(self.slope))
+
+    def line(self) -> tuple[float, float]:
+        """
+        Slope and intercept of the line with a free intercept.
+        """
+        denominator = self.n * self.sxx - self.sx * self.sx
+        if not denominator:
+            return np.nan, np.nan
+        slope = (self.n * self.sxy - self.sx * self.sy) / denominator
+        return slope, (self.sy - slope * self.sx) / self.n
+
+
+class GroupedRegression:
+    """
+    `RegressionSums` per group (e.g. per student or per class), kept up to
+    date as individual points are added, updated or removed. Each point is
+    identified by a key (e.g. student and galaxy id), so that changing one
+    only adjusts the sums of its group, in O(1) however large the groups
+    are. Points with a missing (None or NaN) coordinate are remembered but
+    left out of the sums.
+    """
+
+    def __init__(self):
+        self._points: dict[Hashable, tuple[Hashable, float, float]] = {}
+        self._groups: dict[Hashable, RegressionSums] = {}
+
+    @classmethod
+    def from_columns(cls,
+                     keys: Iterable[Hashable],
+                     groups: Sequence,
+                     x: Sequence[float],
+                     y: Sequence[float]) -> "GroupedRegression":
+        regression = cls()
+        points = zip(keys, groups, as_float_array(x), as_float_array(y))
+        for key, group, x_value, y_value in points:
+            regression.add(key, group, x_value, y_value)
+        return regression
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, group: Hashable) -> bool:
+        return group in self._groups
+
+    def groups(self) -> list[Hashable]:
+        return list(self._groups)
+
+    def sums(self, group: Hashable) -> RegressionSums:
+        return self._groups[group]
+
+    def slope(self, group: Hashable) -> float:
+        return self._groups[group].slope
+
+    def age(self, group: Hashable) -> float:
+        return self._groups[group].age
+
+    def add(self, key: Hashable, group: Hashable,
+            x: Optional[float], y: Optional[float]):
+        """
+        Add a point to `group`. Adding a key that is already present
+        replaces its point (and moves it to `group`).
+        """
+        if key in self._points:
+            self.remove(key)
+
+        x = np.nan if x is None else float(x)
+        y = np.nan if y is None else float(y)
+        self._points[key] = (group, x, y)
+        sums = self._groups.get(group)
+        if sums is None:
+            sums = self._groups[group] = RegressionSums()
+        if np.isfinite(x) and np.isfinite(y):
+            sums.add(x, y)
+
+    def update(self, key: Hashable, x: Optional[float], y: Optional[float]):
+        """
+        Change the coordinates of an existing point.
+        """
+        group, _, _ = self._points[key]
+        self.add(key, group, x, y)
+
+    def remove(self, key: Hashable):
+        group, x, y = self._points.pop(key)
+        if np.isfinite(x) and np.isfinite(y):
+            self._groups[group].remove(x, y)
+
+    def fits(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The groups with at least one point, sorted, with their slopes and
+        ages, as `GroupedHubbleFit` gives them. A group whose points are all
+        incomplete has a NaN fit.
+        """
+        groups = np.array(sorted({group for group, _, _ in self._points.values()}))
+        slopes = np.array(
+            [self._groups[group].slope for group in groups.tolist()], dtype=float
+        )
+        return groups, slopes, hubble_age(slopes)
+
+
+class RunningRange:
+    """
+    The smallest and largest of a set of keyed values (e.g. the age of each
+    student's fit), kept up to date as individual values change. Setting a
+    value is O(1), unless it was the smallest or largest and moves inward,
+    in which case the values are scanned again. Missing (None or NaN)
+    values are left out.
+
+    Attributes
+    ----------
+    low: float
+    high: float
+        The bounds of the values, NaN while there are none
+    """
+
+    def __init__(self):
+        self._values: dict[Hashable, float] = {}
+        self.low = self.high = np.nan
+
+    @classmethod
+    def from_columns(cls,
+                     keys: Iterable[Hashable],
+                     values: Sequence[float]) -> "RunningRange":
+        value_range = cls()
+        for key, value in zip(keys, as_float_array(values)):
+            if np.isfinite(value):
+                value_range._values[key] = float(value)
+        value_range._rescan()
+        return value_range
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def set(self, key: Hashable, value: Optional[float]):
+        value = np.nan if value is None else float(value)
+        finite = np.isfinite(value)
+        old = self._values.pop(key, None)
+        if finite:
+            self._values[key] = value
+
+        if old is not None and (
+            (old == self.low and not (finite and value <= old))
+            or (old == self.high and not (finite and value >= old))
+        ):
+            self._rescan()
+        elif finite:
+            self.low = float(np.fmin(self.low, value))
+            self.high = float(np.fmax(self.high, value))
+
+    def remove(self, key: Hashable):
+        self.set(key, None)
+
+    def _rescan(self):
+        if self._values:
+            self.low = min(self._values.values())
+            self.high = max(self._values.values())
+        else:
+            self.low = self.high = np.nan
@@ -0,0 +1,148 @@
+import asyncio
+from concurrent.futures import Future
+import threading
+from typing import Optional
+
+import solara
+from solara import Reactive
+from solara.server import kernel_context
+
+from cosmicds.state import GlobalState, BaseState
+from cosmicds.logger import setup_logger
+
+from hubbleds.remote import ASYNC_LOCAL_API, LOCAL_API
+from hubbleds.state import LocalState
+
+logger = setup_logger("HYDRATION")
+
+# How long (in seconds) a stage waits for the login hydration to provide its
+#  state before loading the state itself
+STAGE_STATE_WAIT = 15
+
+
+class SessionHydration:
+    """
+    Per-session results of loading a student's data at login.
+
+    Stage pages mount while the login hydration is still running, so they
+    wait for `stage_states` instead of each requesting their own state. The
+    stored states are kept up to date as stages schedule writes, so a stage
+    that is visited again also reads its state locally.
+    """
+
+    def __init__(self):
+        self._stage_states: Future = Future()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            if self._stage_states.done():
+                self._stage_states = Future()
+
+    def set_stage_states(self, stage_states: Optional[dict[str, dict]]):
+        with self._lock:
+            if not self._stage_states.done():
+                self._stage_states.set_result(stage_states)
+
+    def remember_stage_state(self, stage_id: str, state: dict):
+        with self._lock:
+            if self._stage_states.done():
+                stage_states = self._stage_states.result()
+                if stage_states is not None:
+                    stage_states[stage_id] = state
+
+    async def stage_states(
+        self, timeout: float = STAGE_STATE_WAIT
+    ) -> Optional[dict[str, dict]]:
+        """
+        Wait for the stored stage states of the session. Returns None if they
+        are not available, in which case each stage should load its own.
+        """
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(self._stage_states)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting for stage states from login.")
+            return None
+
+
+_SESSIONS: dict[str, SessionHydration] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session_hydration() -> SessionHydration:
+    """
+    Return the hydration state for the current session.
+    """
+    context_id = kernel_context.get_current_context().id
+    with _SESSIONS_LOCK:
+        hydration = _SESSIONS.get(context_id)
+        if hydration is None:
+            hydration = _SESSIONS[context_id] = SessionHydration()
+        return hydration
+
+
+def _on_kernel_start():
+    context_id = kernel_context.get_current_context().id
+
+    def cleanup():
+        with _SESSIONS_LOCK:
+            _SESSIONS.pop(context_id, None)
+
+    return cleanup
+
+
+solara.lab.on_kernel_start(_on_kernel_start)
+
+
+async def hydrate_session(
+    global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+):
+    """
+    Load the student's story state, measurements and stage states at once,
+    and make the stage states available to the stage pages.
+    """
+    hydration = get_session_hydration()
+    hydration.reset()
+
+    stage_states = None
+    try:
+        stage_states = await ASYNC_LOCAL_API.hydrate_session(global_state, local_state)
+    finally:
+        # If this failed, waiting stages fall back to loading their own state
+        hydration.set_stage_states(stage_states)
+
+
+def skip_hydration():
+    get_session_hydration().set_stage_states(None)
+
+
+async def load_stage_state(
+    global_state: Reactive[GlobalState],
+    local_state: Reactive[LocalState],
+    component_state: Reactive[BaseState],
+):
+    """
+    Load the stored state of a stage, from the session's hydrated stage
+    states when available.
+    """
+    stage_states = await get_session_hydration().stage_states()
+    if stage_states is None:
+        return await ASYNC_LOCAL_API.get_stage_state(
+            global_state, local_state, component_state
+        )
+
+    stage_json = stage_states.get(component_state.value.stage_id)
+    if stage_json is None:
+        logger.info("No stored state for stage `%s`.", component_state.value.stage_id)
+        return None
+
+    return LOCAL_API._set_stage_state(stage_json, component_state)
+
+
+def remember_stage_state(component_state: Reactive[BaseState]):
+    get_session_hydration().remember_stage_state(
+        component_state.value.stage_id,
+        LOCAL_API._stage_state_payload(component_state),
+    )
@@ -0,0 +1,96 @@
+from hashlib import sha1
+import json
+from typing import Any
+
+__all__ = [
+    "make_patch",
+    "apply_patch",
+    "document_version",
+]
+
+
+def _escape(key: str) -> str:
+    # JSON pointer escaping (RFC 6901)
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> list[dict[str, Any]]:
+    """
+    Compute an RFC 6902 JSON patch that turns `old` into `new`.
+
+    Objects are diffed key by key, recursively. Any other value that differs
+    (including lists) is replaced wholesale, which keeps the patch simple
+    while still making its size proportional to what actually changed.
+
+    Parameters
+    ----------
+    old: Any
+        The JSON-compatible document the patch applies to
+    new: Any
+        The JSON-compatible document the patch should produce
+    path: str
+        JSON pointer to the location of `old` within the full document
+
+    Returns
+    ----------
+    patch: list[dict]
+        A list of `add`, `remove` and `replace` operations
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(make_patch(old[key], value, child))
+        return ops
+
+    if old == new and type(old) is type(new):
+        return []
+
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_patch(document: Any, patch: list[dict[str, Any]]) -> Any:
+    """
+    Apply a patch produced by `make_patch` to a copy of `document`.
+    """
+    document = json.loads(json.dumps(document))
+    for op in patch:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            if op["op"] == "remove":
+                raise ValueError("Cannot remove the document root")
+            document = op["value"]
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            last = int(last)
+        if op["op"] == "remove":
+            del parent[last]
+        elif op["op"] in ("add", "replace"):
+            parent[last] = op["value"]
+        else:
+            raise ValueError(f"Unsupported patch operation: {op['op']}")
+    return document
+
+
+def document_version(document: Any) -> str:
+    """
+    A stable fingerprint of a JSON-compatible document, used to check that a
+    patch is applied to the same base it was computed against.
+    """
+    canonical = json.dumps(document, sort_keys=True, separators=(",", ":"))
+    return sha1(canonical.encode("utf-8")).hexdigest()
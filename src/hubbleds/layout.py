@@ -4,7 +4,12 @@ from .state import GLOBAL_STATE, LOCAL_STATE
 import solara
 from solara.toestand import Ref
 from cosmicds.components import MathJaxSupport, PlotlySupport, GoogleAnalyticsSupport
-from hubbleds.remote import LOCAL_API
+from hubbleds.hydration import hydrate_session, skip_hydration
+from hubbleds.persistence import (
+    get_persistence_scheduler,
+    schedule_measurements,
+    schedule_story_state,
+)
 from cosmicds.logger import setup_logger
 
 logger = setup_logger("LAYOUT")
@@ -29,6 +34,7 @@ def Layout(children=[]):
     async def _load_global_local_states():
         if not GLOBAL_STATE.value.student.id:
             logger.warning("Failed to load measurements: no student was found.")
+            skip_hydration()
             return
 
         logger.info(
@@ -36,15 +42,9 @@ def Layout(children=[]):
             GLOBAL_STATE.value.student.id,
         )
 
-        # Retrieve the student's app and local states
-        LOCAL_API.get_app_story_states(GLOBAL_STATE, LOCAL_STATE)
-
-
-        # Load in the student's measurements
-        measurements = LOCAL_API.get_measurements(GLOBAL_STATE, LOCAL_STATE)
-        sample_measurements = LOCAL_API.get_sample_measurements(
-            GLOBAL_STATE, LOCAL_STATE
-        )
+        # Retrieve the student's app and local states, measurements and stage
+        #  states all at once
+        await hydrate_session(GLOBAL_STATE, LOCAL_STATE)
 
         logger.info("Finished loading state.")
         if LOCAL_STATE.value.last_route is not None:
@@ -57,27 +57,31 @@ def Layout(children=[]):
 
     # solara.use_memo(_load_local_state, dependencies=[student_id.value])
 
-    async def _write_local_global_states():
+    scheduler = get_persistence_scheduler()
+
+    # Writes are queued on the session's persistence scheduler, which
+    #  coalesces rapid changes and flushes them in the background
+    solara.lab.use_task(scheduler.run, dependencies=[])
+
+    def _write_local_global_states():
         if not loaded_states.value:
             return
 
         # Listen for changes in the states and write them to the database
-        put_state = LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)
+        schedule_story_state(GLOBAL_STATE, LOCAL_STATE)
 
         # Be sure to write the measurement data separately since it's stored
         #  in another location in the database
-        put_meas = LOCAL_API.put_measurements(GLOBAL_STATE, LOCAL_STATE)
-        put_samp = LOCAL_API.put_sample_measurements(GLOBAL_STATE, LOCAL_STATE)
-        
-        if put_state and put_meas and put_samp:
-            logger.info("Wrote state to database.")
-        else:
-            logger.info(f"Did not write {'story state' if not put_state else ''} {'measurements' if not put_meas else ''} {'sample measurements' if not put_samp else ''} to database.")
-
-    solara.lab.use_task(
+        schedule_measurements(GLOBAL_STATE, LOCAL_STATE)
+        schedule_measurements(GLOBAL_STATE, LOCAL_STATE, samples=True)
+
+    solara.use_effect(
         _write_local_global_states, dependencies=[GLOBAL_STATE.value, LOCAL_STATE.value]
     )
 
+    # Don't leave pending writes behind when the student moves between stages
+    solara.use_effect(scheduler.request_flush, dependencies=[router.path])
+
     with BaseLayout(
         local_state=LOCAL_STATE,
         children=children,
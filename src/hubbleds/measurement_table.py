@@ -0,0 +1,446 @@
+import sys
+from types import NoneType, UnionType
+from typing import Any, Iterable, Optional, Union, get_args, get_origin
+
+import numpy as np
+
+from glue.core import Data
+
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("MEASUREMENT-TABLE")
+
+# How each kind of column is stored
+_INT, _NULLABLE_INT, _FLOAT, _OBJECT = "int", "nullable_int", "float", "object"
+_DTYPES = {
+    _INT: np.int64,
+    _NULLABLE_INT: np.float64,
+    _FLOAT: np.float64,
+    _OBJECT: object,
+}
+
+_GALAXY = "galaxy"
+_GALAXY_ID = "galaxy_id"
+
+_schema: Optional[dict[str, tuple[str, Any]]] = None
+
+
+def _column_kind(annotation) -> str:
+    nullable = False
+    if get_origin(annotation) in (Union, UnionType):
+        args = get_args(annotation)
+        nullable = NoneType in args
+        others = [arg for arg in args if arg is not NoneType]
+        annotation = others[0] if len(others) == 1 else object
+
+    if annotation is int:
+        return _NULLABLE_INT if nullable else _INT
+    if annotation is float:
+        return _FLOAT
+    return _OBJECT
+
+
+def measurement_schema() -> dict[str, tuple[str, Any]]:
+    """
+    The columns of a `MeasurementTable`, derived from the fields of
+    `StudentMeasurement`, mapped to their kind and default value (None for
+    required fields).
+    """
+    global _schema
+    if _schema is None:
+        # Imported here since `hubbleds.state` itself uses this module
+        from hubbleds.state import StudentMeasurement
+
+        _schema = {
+            name: (
+                _column_kind(info.annotation),
+                None if info.is_required() else info.get_default(),
+            )
+            for name, info in StudentMeasurement.model_fields.items()
+        }
+    return _schema
+
+
+def _fill_value(kind: str, default):
+    if default is None:
+        return np.nan if kind in (_NULLABLE_INT, _FLOAT) else None
+    return default
+
+
+class MeasurementTable:
+    """
+    Columnar (struct-of-arrays) collection of student measurements.
+
+    Each field of `StudentMeasurement` is stored as a NumPy array: integers
+    as int64, floats as float64 and everything else (units, measurement
+    numbers) as object arrays. Missing numeric values, including missing
+    values of optional integer fields such as `class_id`, are NaN.
+
+    Galaxies are not stored per row: the table keeps an int64 `galaxy_id`
+    column (0 for no galaxy) and resolves the `galaxy` column lazily, to the
+    shared instances of `GALAXY_POOL`, the first time it is requested.
+
+    Tables are immutable; filtering returns a new table, and the arrays
+    returned by `column` must not be modified. Conversion to pydantic models
+    only happens in `to_models`, at the edges where models are needed.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray]):
+        self._columns = columns
+        self._galaxies: Optional[np.ndarray] = None
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def empty(cls) -> "MeasurementTable":
+        columns = {
+            name: np.empty(0, dtype=_DTYPES[kind])
+            for name, (kind, _) in measurement_schema().items()
+        }
+        return cls(columns)
+
+    @classmethod
+    def from_records(cls, records: list[dict[str, Any]]) -> "MeasurementTable":
+        """
+        Build a table from measurement records, as returned by the API.
+        Missing fields take the default value of the `StudentMeasurement`
+        field; unknown fields are ignored. A record may give its galaxy
+        either nested, as `galaxy`, or by reference, as `galaxy_id`.
+        """
+        from hubbleds.galaxy_catalog import GALAXY_POOL
+
+        columns = {}
+        for name, (kind, default) in measurement_schema().items():
+            if name == _GALAXY_ID:
+                continue
+            fill = _fill_value(kind, default)
+            values = (record.get(name, default) for record in records)
+            if kind == _OBJECT:
+                columns[name] = np.fromiter(values, dtype=object, count=len(records))
+            else:
+                columns[name] = np.fromiter(
+                    (fill if v is None else v for v in values),
+                    dtype=_DTYPES[kind],
+                    count=len(records),
+                )
+
+        galaxy_ids = np.zeros(len(records), dtype=np.int64)
+        for i, record in enumerate(records):
+            galaxy = record.get(_GALAXY)
+            if galaxy is not None:
+                galaxy_ids[i] = GALAXY_POOL.intern(galaxy).id
+            else:
+                galaxy_ids[i] = record.get(_GALAXY_ID) or 0
+        columns[_GALAXY_ID] = galaxy_ids
+
+        return cls(columns)
+
+    @classmethod
+    def from_columns(
+        cls, columns: dict[str, np.ndarray], length: int
+    ) -> "MeasurementTable":
+        """
+        Build a table from decoded columns, e.g. from a binary response.
+        Columns are converted to the table's dtypes, with missing values as
+        None or NaN; missing columns are filled with the field defaults and
+        unknown columns are ignored. Galaxies are given by `galaxy_id`.
+        """
+        table_columns = {}
+        for name, (kind, default) in measurement_schema().items():
+            if name == _GALAXY_ID:
+                continue
+            dtype = _DTYPES[kind]
+            values = columns.get(name)
+            if values is None:
+                table_columns[name] = np.full(
+                    length, _fill_value(kind, default), dtype=dtype
+                )
+            else:
+                table_columns[name] = np.asarray(values).astype(dtype, copy=False)
+
+        galaxy_ids = columns.get(_GALAXY_ID)
+        table_columns[_GALAXY_ID] = (
+            np.zeros(length, dtype=np.int64) if galaxy_ids is None
+            else np.nan_to_num(galaxy_ids).astype(np.int64, copy=False)
+        )
+
+        return cls(table_columns)
+
+    @classmethod
+    def from_models(cls, measurements: Iterable) -> "MeasurementTable":
+        measurements = list(measurements)
+        columns = {}
+        for name, (kind, _) in measurement_schema().items():
+            fill = _fill_value(kind, None)
+            values = (getattr(m, name) for m in measurements)
+            if kind == _OBJECT:
+                columns[name] = np.fromiter(
+                    values, dtype=object, count=len(measurements)
+                )
+            else:
+                columns[name] = np.fromiter(
+                    (fill if v is None else v for v in values),
+                    dtype=_DTYPES[kind],
+                    count=len(measurements),
+                )
+        return cls(columns)
+
+    @classmethod
+    def concatenate(cls, tables: list["MeasurementTable"]) -> "MeasurementTable":
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+        return cls({
+            name: np.concatenate([table._columns[name] for table in tables])
+            for name in tables[0]._columns
+        })
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __repr__(self) -> str:
+        return f"<MeasurementTable with {self._length} measurement(s)>"
+
+    @property
+    def column_names(self) -> list[str]:
+        return list(self._columns) + [_GALAXY]
+
+    def column(self, name: str) -> np.ndarray:
+        if name == _GALAXY:
+            return self.galaxies()
+        return self._columns[name]
+
+    def galaxies(self) -> np.ndarray:
+        """
+        The galaxy of each row, as an object array of shared `GalaxyData`.
+        """
+        if self._galaxies is None:
+            from hubbleds.galaxy_catalog import GALAXY_POOL
+
+            self._galaxies = GALAXY_POOL.resolve(self._columns[_GALAXY_ID])
+        return self._galaxies
+
+    def values(self, name: str) -> list:
+        """
+        The values of a column as a plain list, with missing values as None,
+        e.g. for sending to the front end.
+        """
+        values = self.column(name)
+        if values.dtype.kind == "f":
+            return [None if np.isnan(v) else v for v in values.tolist()]
+        return values.tolist()
+
+    def take(self, selection: np.ndarray) -> "MeasurementTable":
+        """
+        Select rows by boolean mask or by index.
+        """
+        return MeasurementTable({
+            name: values[selection] for name, values in self._columns.items()
+        })
+
+    def with_values(self, **values) -> "MeasurementTable":
+        """
+        A copy of the table with the given columns set to a single value.
+        """
+        columns = dict(self._columns)
+        for name, value in values.items():
+            if name == _GALAXY:
+                raise ValueError("Set `galaxy_id` to change the galaxy of the rows")
+            kind, _ = measurement_schema()[name]
+            fill = _fill_value(kind, None) if value is None else value
+            columns[name] = np.full(self._length, fill, dtype=_DTYPES[kind])
+        return MeasurementTable(columns)
+
+    def student_mask(self, student_ids: Iterable[int]) -> np.ndarray:
+        return np.isin(
+            self._columns["student_id"], np.fromiter(student_ids, dtype=np.int64)
+        )
+
+    def class_mask(self, class_ids: Iterable[int]) -> np.ndarray:
+        return np.isin(
+            self._columns["class_id"], np.fromiter(class_ids, dtype=np.float64)
+        )
+
+    def complete_mask(self) -> np.ndarray:
+        """
+        Rows with both a distance and a velocity.
+        """
+        return ~(
+            np.isnan(self._columns["est_dist_value"])
+            | np.isnan(self._columns["velocity_value"])
+        )
+
+    def for_students(self, student_ids: Iterable[int]) -> "MeasurementTable":
+        return self.take(self.student_mask(student_ids))
+
+    def for_classes(self, class_ids: Iterable[int]) -> "MeasurementTable":
+        return self.take(self.class_mask(class_ids))
+
+    def complete(self) -> "MeasurementTable":
+        return self.take(self.complete_mask())
+
+    def unique(self, name: str) -> np.ndarray:
+        return np.unique(self._columns[name])
+
+    def group_indices(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Group rows by the value of a column.
+
+        Returns
+        ----------
+        keys: np.ndarray
+            The sorted, distinct values of the column
+        groups: np.ndarray
+            For each row, the index of its key in `keys`
+        """
+        keys, groups = np.unique(self._columns[name], return_inverse=True)
+        return keys, groups
+
+    def group_by(self, name: str) -> dict[Any, "MeasurementTable"]:
+        keys, groups = self.group_indices(name)
+        order = np.argsort(groups, kind="stable")
+        bounds = np.searchsorted(groups[order], np.arange(len(keys) + 1))
+        return {
+            key.item() if hasattr(key, "item") else key: self.take(order[start:stop])
+            for key, start, stop in zip(keys, bounds[:-1], bounds[1:])
+        }
+
+    def to_models(self) -> list:
+        from hubbleds.state import StudentMeasurement
+
+        schema = measurement_schema()
+        names = list(schema)
+        rows = zip(*(self.values(name) for name in names))
+        measurements = []
+        for row in rows:
+            fields = dict(zip(names, row))
+            for name, (kind, _) in schema.items():
+                if kind == _NULLABLE_INT and fields[name] is not None:
+                    fields[name] = int(fields[name])
+            measurements.append(StudentMeasurement.model_construct(**fields))
+        return measurements
+
+    def to_glue_data(self,
+                     label: Optional[str] = None,
+                     ignore_components: Optional[list[str]] = None) -> Data:
+        """
+        Create glue `Data` with a component per `StudentMeasurement` field,
+        like `models_to_glue_data` does for a list of models. The components
+        wrap the table's arrays without copying them.
+        """
+        from cosmicds.utils import component_type_for_field
+        from hubbleds.state import StudentMeasurement
+
+        data_dict = {}
+        if self._length:
+            ignore = ignore_components or []
+            for field, info in StudentMeasurement.model_fields.items():
+                if field not in ignore:
+                    component_type = component_type_for_field(info)
+                    data_dict[field] = component_type(self.column(field))
+        if label:
+            data_dict["label"] = label
+        return Data(**data_dict)
+
+
+class MeasurementTableBuilder:
+    """
+    Builds a `MeasurementTable` one record at a time, e.g. while a response
+    is still being parsed, so that each record can be dropped as soon as it
+    has been added.
+
+    Values are written straight into fixed-size column chunks, and repeated
+    strings (units, measurement numbers) are interned, so the builder holds
+    little more than the finished table does.
+
+    Parameters
+    ----------
+    chunk_size: int
+        Number of rows per column chunk
+    """
+
+    def __init__(self, chunk_size: int = 4096):
+        self.chunk_size = chunk_size
+        self._fields = [
+            (name, kind, _fill_value(kind, default), default)
+            for name, (kind, default) in measurement_schema().items()
+            if name != _GALAXY_ID
+        ]
+        self._dtypes = {name: _DTYPES[kind] for name, kind, _, _ in self._fields}
+        self._dtypes[_GALAXY_ID] = np.int64
+        self._chunks: dict[str, list[np.ndarray]] = {name: [] for name in self._dtypes}
+        self._current: Optional[dict[str, np.ndarray]] = None
+        self._row = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _flush(self):
+        if self._current is None:
+            return
+        for name, values in self._current.items():
+            # Copy a partly-filled chunk so the unused rows can be freed
+            if self._row < self.chunk_size:
+                values = values[:self._row].copy()
+            self._chunks[name].append(values)
+        self._current = None
+        self._row = 0
+
+    def append(self, record: dict[str, Any]):
+        """
+        Add a measurement record, with the same handling of missing fields
+        and galaxies as `MeasurementTable.from_records`.
+        """
+        from hubbleds.galaxy_catalog import GALAXY_POOL
+
+        if self._row == self.chunk_size:
+            self._flush()
+        if self._current is None:
+            self._current = {
+                name: np.empty(self.chunk_size, dtype=dtype)
+                for name, dtype in self._dtypes.items()
+            }
+
+        row = self._row
+        current = self._current
+        for name, kind, fill, default in self._fields:
+            value = record.get(name, default)
+            if value is None:
+                value = fill
+            elif kind == _OBJECT and isinstance(value, str):
+                value = sys.intern(value)
+            current[name][row] = value
+
+        galaxy = record.get(_GALAXY)
+        if galaxy is not None:
+            current[_GALAXY_ID][row] = GALAXY_POOL.intern(galaxy).id
+        else:
+            current[_GALAXY_ID][row] = record.get(_GALAXY_ID) or 0
+
+        self._row += 1
+        self._length += 1
+
+    def build(self) -> MeasurementTable:
+        """
+        Return the table of the records added so far. The builder is empty
+        afterwards.
+        """
+        self._flush()
+        if not self._length:
+            return MeasurementTable.empty()
+
+        columns = {}
+        for name, chunks in self._chunks.items():
+            columns[name] = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+            # Release each column's chunks before joining the next column
+            chunks.clear()
+        self._length = 0
+        return MeasurementTable(columns)
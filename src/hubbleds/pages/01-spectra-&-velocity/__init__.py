@@ -2,7 +2,9 @@ import solara
 from solara.lab import computed
 from hubbleds.state import LOCAL_STATE, GLOBAL_STATE, get_multiple_choice, mc_callback
 from .component_state import COMPONENT_STATE, Marker
-from hubbleds.remote import LOCAL_API
+from hubbleds.remote import LOCAL_API, ASYNC_LOCAL_API
+from hubbleds.persistence import schedule_stage_state
+from hubbleds.hydration import load_stage_state
 from glue_jupyter import JupyterApplication
 import asyncio
 from pathlib import Path
@@ -35,7 +37,6 @@ from ...data_management import (
     EXAMPLE_GALAXY_MEASUREMENTS,
     DB_MEASWAVE_FIELD,
 )
-import numpy as np
 from glue.core import Data
 from hubbleds.utils import (
     models_to_glue_data, 
@@ -75,7 +76,7 @@ def Page():
     async def _load_component_state():
         # Load stored component state from database, measurement data is
         #   considered higher-level and is loaded when the story starts.
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
         total_galaxies = Ref(COMPONENT_STATE.fields.total_galaxies)
 
@@ -92,18 +93,15 @@ def Page():
     solara.lab.use_task(_load_component_state)
     # solara.use_memo(_load_component_state)
 
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        if res:
-            logger.info("Wrote component state to database.")
-        else:
-            logger.info("Did not write component state to database.")
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
 
     def _glue_setup() -> JupyterApplication:
         # NOTE: use_memo has to be part of the main page render. Including it
@@ -113,28 +111,18 @@ def Page():
         )
 
         if EXAMPLE_GALAXY_SEED_DATA not in gjapp.data_collection:
-            example_seed_data = LOCAL_API.get_example_seed_measurement(LOCAL_STATE, which='both')
-            
-            data = Data(
-                label=EXAMPLE_GALAXY_SEED_DATA,
-                **{
-                    k: np.asarray([r[k] for r in example_seed_data])
-                    for k in example_seed_data[0].keys()
-                }
-            )
+            example_seed_data = LOCAL_API.get_example_seed_data(LOCAL_STATE)
+
+            data = Data(label=EXAMPLE_GALAXY_SEED_DATA, **example_seed_data.columns)
             gjapp.data_collection.append(data)
             # create 'first measurement' and 'second measurement' datasets
             # create_measurement_subsets(gjapp, data)
             first = Data(label = EXAMPLE_GALAXY_SEED_DATA + '_first', 
-                         **{k: np.asarray([r[k] for r in example_seed_data if r['measurement_number'] == 'first'])
-                            for k in example_seed_data[0].keys()}
-                            )
+                         **example_seed_data.subset('first'))
             first.style.color = GENERIC_COLOR
             gjapp.data_collection.append(first)
             second = Data(label = EXAMPLE_GALAXY_SEED_DATA + '_second', 
-                         **{k: np.asarray([r[k] for r in example_seed_data if r['measurement_number'] == 'second'])
-                            for k in example_seed_data[0].keys()}
-                            )
+                         **example_seed_data.subset('second'))
             second.style.color = GENERIC_COLOR
             gjapp.data_collection.append(second)
             
@@ -276,8 +264,7 @@ def Page():
         need = 5 - len(LOCAL_STATE.value.measurements)
         if need <= 0:
             return
-        galaxies = LOCAL_API.get_galaxies(LOCAL_STATE)
-        sample = np.random.choice(galaxies, size=need, replace=False)
+        sample = LOCAL_STATE.value.galaxies.sample(need)
         new_measurements = [StudentMeasurement(student_id=GLOBAL_STATE.value.student.id,
                                                galaxy=galaxy)
                              for galaxy in sample]
@@ -406,7 +393,38 @@ def Page():
         
     solara.use_effect(_reactive_subscription_setup, dependencies=[])
 
-    
+    # Fetch spectra in the background as soon as we know they will be needed,
+    #  so that the spectrum viewer can show them right away
+    measurement_galaxy_ids = tuple(m.galaxy_id for m in LOCAL_STATE.value.measurements)
+
+    def _prefetch_measurement_spectra():
+        ASYNC_LOCAL_API.prefetch_spectra(
+            [m.galaxy for m in LOCAL_STATE.value.measurements], LOCAL_STATE
+        )
+
+    solara.use_effect(
+        _prefetch_measurement_spectra, dependencies=[measurement_galaxy_ids]
+    )
+
+    example_spectra_needed = COMPONENT_STATE.value.current_step_at_or_after(
+        Marker.cho_row1
+    )
+    example_galaxy_ids = tuple(
+        m.galaxy_id for m in LOCAL_STATE.value.example_measurements
+    )
+
+    def _prefetch_example_spectra():
+        if example_spectra_needed:
+            ASYNC_LOCAL_API.prefetch_spectra(
+                [m.galaxy for m in LOCAL_STATE.value.example_measurements], LOCAL_STATE
+            )
+
+    solara.use_effect(
+        _prefetch_example_spectra,
+        dependencies=[example_spectra_needed, example_galaxy_ids],
+    )
+
+
 
     def create_dotplot_viewer(first_dotplot = True, show_which_meas = 'first', show_which_seed = 'first', ignore_full_seed_data = True, ignore_full_meas_data = True):
         print("\n\n ======== \ncreate_dotplot_viewer\n\n")
@@ -873,11 +891,15 @@ def Page():
                 def example_galaxy_data():
                     if use_second_measurement.value:
                         return [
-                            x.dict() for x in LOCAL_STATE.value.example_measurements if x.measurement_number == 'second'
+                            x.table_row()
+                            for x in LOCAL_STATE.value.example_measurements
+                            if x.measurement_number == 'second'
                         ]
                     else:
                         return [
-                            x.dict() for x in LOCAL_STATE.value.example_measurements if x.measurement_number == 'first'
+                            x.table_row()
+                            for x in LOCAL_STATE.value.example_measurements
+                            if x.measurement_number == 'first'
                         ]
 
                 @computed
@@ -975,7 +997,7 @@ def Page():
 
                 DataTable(
                     title="My Galaxies",
-                    items=[x.dict() for x in LOCAL_STATE.value.measurements],
+                    items=[x.table_row() for x in LOCAL_STATE.value.measurements],
                     selected_indices=selected_galaxy_index.value,
                     show_select=COMPONENT_STATE.value.current_step_at_or_after(
                         Marker.cho_row1
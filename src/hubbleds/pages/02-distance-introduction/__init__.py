@@ -5,7 +5,8 @@ from solara.toestand import Ref
 from hubbleds.components import Stage2Slideshow, STAGE_2_SLIDESHOW_LENGTH
 from hubbleds.state import LOCAL_STATE, GLOBAL_STATE, get_multiple_choice, mc_callback 
 from .component_state import COMPONENT_STATE
-from hubbleds.remote import LOCAL_API
+from hubbleds.persistence import schedule_stage_state
+from hubbleds.hydration import load_stage_state
 from ...utils import IMAGE_BASE_URL, DISTANCE_CONSTANT
 
 from cosmicds.logger import setup_logger
@@ -21,7 +22,7 @@ def Page():
     async def _load_component_state():
         # Load stored component state from database, measurement data is
         # considered higher-level and is loaded when the story starts
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
         # TODO: What else to we need to do here?
         logger.info("Finished loading component state for stage 2.")
@@ -29,22 +30,15 @@ def Page():
 
     solara.lab.use_task(_load_component_state)
 
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        
-        if res:
-            logger.info("Wrote component state for stage 2 to database.")
-        else:
-            logger.info("Did not write component state for stage 2 to database.")
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-        
-
-    logger.info("Trying to write component state for stage 2.")
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
 
     step = Ref(
         COMPONENT_STATE.fields.distance_slideshow_state.step
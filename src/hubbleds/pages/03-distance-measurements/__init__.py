@@ -35,6 +35,8 @@ from hubbleds.components import (
 
 from hubbleds.data_management import *
 from hubbleds.remote import LOCAL_API
+from hubbleds.persistence import schedule_measurements, schedule_stage_state
+from hubbleds.hydration import load_stage_state
 from hubbleds.state import (
     GLOBAL_STATE, 
     LOCAL_STATE,
@@ -55,7 +57,6 @@ from hubbleds.widgets.distance_tool.distance_tool import DistanceTool
 from ...viewers.hubble_dotplot import HubbleDotPlotView, HubbleDotPlotViewer
 from .component_state import COMPONENT_STATE, Marker
 
-from numpy import asarray
 import astropy.units as u
 
 from pathlib import Path
@@ -174,24 +175,21 @@ def Page():
     distance_tool_bg_count = solara.use_reactive(0)
 
     async def _load_component_state():
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
         logger.info("Finished loading component state")
         loaded_component_state.set(True)
     
     solara.lab.use_task(_load_component_state)
     
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        if res:
-            logger.info("Wrote component state for stage 3 to database.")
-        else:
-            logger.info("Did not write component state for stage 3 to database.")
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
     
     
     def _glue_setup() -> JupyterApplication:
@@ -201,22 +199,18 @@ def Page():
         
         # Get the example seed data
         if EXAMPLE_GALAXY_SEED_DATA not in gjapp.data_collection:
-            example_seed_data = LOCAL_API.get_example_seed_measurement(LOCAL_STATE, which = 'both')
-            data = Data(label=EXAMPLE_GALAXY_SEED_DATA, **{k: asarray([r[k] for r in example_seed_data]) for k in example_seed_data[0].keys()})
+            example_seed_data = LOCAL_API.get_example_seed_data(LOCAL_STATE)
+            data = Data(label=EXAMPLE_GALAXY_SEED_DATA, **example_seed_data.columns)
             gjapp.data_collection.append(data)
             
             # create 'first measurement' and 'second measurement' datasets
             # create_measurement_subsets(gjapp, data)
             first = Data(label = EXAMPLE_GALAXY_SEED_DATA + '_first', 
-                         **{k: asarray([r[k] for r in example_seed_data if r['measurement_number'] == 'first'])
-                            for k in example_seed_data[0].keys()}
-                            )
+                         **example_seed_data.subset('first'))
             first.style.color = GENERIC_COLOR
             gjapp.data_collection.append(first)
             second = Data(label = EXAMPLE_GALAXY_SEED_DATA + '_second', 
-                         **{k: asarray([r[k] for r in example_seed_data if r['measurement_number'] == 'second'])
-                            for k in example_seed_data[0].keys()}
-                            )
+                         **example_seed_data.subset('second'))
             second.style.color = GENERIC_COLOR
             gjapp.data_collection.append(second)
             
@@ -347,9 +341,9 @@ def Page():
 
     def put_measurements(samples):
         if samples:
-            LOCAL_API.put_sample_measurements(GLOBAL_STATE, LOCAL_STATE)
+            schedule_measurements(GLOBAL_STATE, LOCAL_STATE, samples=True)
         else:
-            LOCAL_API.put_measurements(GLOBAL_STATE, LOCAL_STATE)
+            schedule_measurements(GLOBAL_STATE, LOCAL_STATE)
             
     def _update_angular_size(update_example: bool, galaxy, angular_size, count, meas_num = 'first', brightness = 1.0):
         # if bool(galaxy) and angular_size is not None:
@@ -4,12 +4,11 @@ from echo import delay_callback
 from glue.core import Data
 from glue_jupyter import JupyterApplication
 from hubbleds.base_component_state import transition_next, transition_previous
-import numpy as np
 from pathlib import Path
 import reacton.ipyvuetify as rv
 import solara
 from solara.toestand import Ref
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
 
 from cosmicds.components import ScaffoldAlert, StateEditor, ViewerLayout
 from hubbleds.viewer_marker_colors import MY_DATA_COLOR, MY_CLASS_COLOR, GENERIC_COLOR
@@ -17,8 +16,11 @@ from hubbleds.components import DataTable, HubbleExpUniverseSlideshow, LineDrawV
 from hubbleds.state import LOCAL_STATE, GLOBAL_STATE, StudentMeasurement, get_multiple_choice, get_free_response, mc_callback, fr_callback
 from hubbleds.viewers.hubble_scatter_viewer import HubbleScatterView
 from .component_state import COMPONENT_STATE, Marker
-from hubbleds.remote import LOCAL_API
-from hubbleds.utils import AGE_CONSTANT, models_to_glue_data, PLOTLY_MARGINS
+from hubbleds.remote import LOCAL_API, ASYNC_LOCAL_API
+from hubbleds.persistence import schedule_stage_state, schedule_story_state
+from hubbleds.hydration import load_stage_state
+from hubbleds.utils import AGE_CONSTANT, PLOTLY_MARGINS
+from hubbleds.measurement_table import MeasurementTable
 
 from cosmicds.logger import setup_logger
 
@@ -30,16 +32,17 @@ GUIDELINE_ROOT = Path(__file__).parent / "guidelines"
 @solara.lab.task
 async def load_class_data():
     logger.info("Loading class data")
-    class_measurements = LOCAL_API.get_class_measurements(GLOBAL_STATE, LOCAL_STATE)
+    class_measurements = await ASYNC_LOCAL_API.get_class_measurements(
+        GLOBAL_STATE, LOCAL_STATE
+    )
     logger.info(len(class_measurements))
     measurements = Ref(LOCAL_STATE.fields.class_measurements)
     student_ids = Ref(LOCAL_STATE.fields.stage_4_class_data_students)
     if class_measurements and not student_ids.value:
-        ids = [int(id) for id in np.unique([m.student_id for m in class_measurements])]
-        student_ids.set(ids)
+        student_ids.set(class_measurements.unique("student_id").tolist())
     measurements.set(class_measurements)
 
-    class_data_points = [m for m in class_measurements if m.student_id in student_ids.value]
+    class_data_points = class_measurements.for_students(student_ids.value)
     return class_data_points
 
 
@@ -52,7 +55,7 @@ def Page():
     async def _load_component_state():
         # Load stored component state from database, measurement data is
         # considered higher-level and is loaded when the story starts
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
         # TODO: What else to we need to do here?
         logger.info("Finished loading component state for stage 4.")
@@ -60,19 +63,15 @@ def Page():
 
     solara.lab.use_task(_load_component_state)
 
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        if res:
-            logger.info("Wrote component state for stage 4 to database.")
-        else:
-            logger.info("Did not write component state for stage 4 to database.")
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
 
     class_plot_data = solara.use_reactive([])
 
@@ -80,7 +79,9 @@ def Page():
     async def _load_student_data():
         if not LOCAL_STATE.value.measurements_loaded:
             logger.info("Loading measurements")
-            measurements = LOCAL_API.get_measurements(GLOBAL_STATE, LOCAL_STATE)
+            measurements = await ASYNC_LOCAL_API.get_measurements(
+                GLOBAL_STATE, LOCAL_STATE
+            )
             student_plot_data.set(measurements)
     solara.lab.use_task(_load_student_data)
 
@@ -122,12 +123,12 @@ def Page():
     if not (load_class_data.finished or load_class_data.pending):
         load_class_data()
 
-    def _on_class_data_loaded(class_data_points: List[StudentMeasurement]):
+    def _on_class_data_loaded(class_data_points: MeasurementTable):
         logger.info("Setting up class glue data")
         if not class_data_points:
             return
 
-        class_data = models_to_glue_data(class_data_points, label="Stage 4 Class Data")
+        class_data = class_data_points.to_glue_data(label="Stage 4 Class Data")
         if not class_data.components:
             class_data = empty_data_from_model_class(StudentMeasurement, label="Stage 4 Class Data")
         class_data = GLOBAL_STATE.value.add_or_update_data(class_data)
@@ -197,7 +198,7 @@ def Page():
         with rv.Col():
             DataTable(
                 title="My Galaxies",
-                items=[x.model_dump() for x in LOCAL_STATE.value.measurements],
+                items=[x.table_row() for x in LOCAL_STATE.value.measurements],
                 headers=[
                     {
                         "text": "Galaxy Name",
@@ -331,7 +332,10 @@ def Page():
                 event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
                 can_advance=COMPONENT_STATE.value.can_transition(next=True),
                 show=COMPONENT_STATE.value.is_current_step(Marker.sho_est1),
-                event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                event_fr_callback = lambda event: fr_callback(
+                    event, LOCAL_STATE, COMPONENT_STATE,
+                    lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                ),
                 state_view={
                     'free_response_a': get_free_response(LOCAL_STATE, COMPONENT_STATE,'shortcoming-1'),
                     'free_response_b': get_free_response(LOCAL_STATE, COMPONENT_STATE,'shortcoming-2'),
@@ -424,13 +428,16 @@ def Page():
                     with rv.Col(class_="no-padding"):
                         if student_plot_data.value and class_plot_data.value:
                             # Note the ordering here - we want the student data on top
-                            layers = (class_plot_data.value, student_plot_data.value)
+                            layers = (
+                                class_plot_data.value,
+                                MeasurementTable.from_models(student_plot_data.value),
+                            )
                             layers_visible = (False, True)
 
                             plot_data=[
                                 {
-                                    "x": [t.est_dist_value for t in data],
-                                    "y": [t.velocity_value for t in data],
+                                    "x": data.values("est_dist_value"),
+                                    "y": data.values("velocity_value"),
                                     "mode": "markers",
                                     "marker": { "color": color, "size": size },
                                     "visible": visibility,    
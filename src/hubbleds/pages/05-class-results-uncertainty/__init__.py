@@ -1,16 +1,14 @@
+import asyncio
 from contextlib import ExitStack
 from echo import delay_callback, add_callback
 from glue.core import Subset
-from glue.core.message import NumericalDataChangedMessage
 from glue.core.subset import RangeSubsetState
 from glue_jupyter import JupyterApplication
 from glue_jupyter.link import link
 from glue_plotly.viewers import PlotlyBaseView
-import numpy as np
 import solara
 from solara.toestand import Ref
 
-from functools import partial
 from pathlib import Path
 import reacton.ipyvuetify as rv
 from typing import Dict, Iterable, Optional, Tuple
@@ -22,11 +20,21 @@ from hubbleds.base_component_state import transition_next, transition_previous
 from hubbleds.components import UncertaintySlideshow, IdSlider
 from hubbleds.tools import *  # noqa
 from hubbleds.state import LOCAL_STATE, GLOBAL_STATE, ClassSummary, StudentMeasurement, StudentSummary, get_free_response, get_multiple_choice, mc_callback, fr_callback
-from hubbleds.utils import create_single_summary, make_summary_data, models_to_glue_data
+from hubbleds.utils import (
+    create_single_summary,
+    make_summary_data,
+    models_to_glue_data,
+    patch_summary_data,
+    regression_summary_data,
+)
+from hubbleds.hubble_fit import GroupedRegression, RunningRange
+from hubbleds.measurement_table import MeasurementTable
 from hubbleds.viewers.hubble_histogram_viewer import HubbleHistogramView
 from hubbleds.viewers.hubble_scatter_viewer import HubbleScatterView
 from .component_state import COMPONENT_STATE, Marker
-from hubbleds.remote import LOCAL_API
+from hubbleds.remote import LOCAL_API, ASYNC_LOCAL_API
+from hubbleds.persistence import schedule_stage_state, schedule_story_state
+from hubbleds.hydration import load_stage_state
 from hubbleds.viewer_marker_colors import (
     MY_DATA_COLOR,
     MY_DATA_COLOR_NAME,
@@ -57,7 +65,7 @@ def Page():
     async def _load_component_state():
         # Load stored component state from database, measurement data is
         # considered higher-level and is loaded when the story starts
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
         # TODO: What else to we need to do here?
         logger.info("Finished loading component state for stage 4.")
@@ -65,21 +73,15 @@ def Page():
 
     solara.lab.use_task(_load_component_state)
 
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        if res:
-            logger.info("Wrote stage 5 component state to database.")
-        else:
-            logger.info("Did not write stage 5 component state to database.")
-
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-        
-
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
     
     student_default_color = MY_CLASS_COLOR
     student_highlight_color = MY_DATA_COLOR
@@ -87,26 +89,24 @@ def Page():
     class_default_color = OTHER_CLASSES_COLOR
     class_highlight_color = MY_CLASS_COLOR
 
-    def _update_bins(viewers: Iterable[CDSHistogramView], _msg: Optional[NumericalDataChangedMessage]=None):
+    # The range of the ages shown in the histograms, kept up to date as the
+    #  summaries change rather than rescanned: "class" for the class
+    #  histogram, "all" for the all-students and all-classes histograms
+    age_ranges: Dict[str, RunningRange] = solara.use_memo(dict, dependencies=[])
+
+    def _update_bins(
+        viewers: Iterable[CDSHistogramView], age_range: Optional[RunningRange]
+    ):
+        if age_range is None or not len(age_range):
+            return
+
         props = ('hist_n_bin', 'hist_x_min', 'hist_x_max')
         with ExitStack() as stack:
             for viewer in viewers:
                 stack.enter_context(delay_callback(viewer.state, *props))
 
-            values = []
-            for viewer in viewers:
-                if viewer.layers: 
-                    # For now, we assume that the first layer contains the data that we're interested in
-                    values.append(viewer.layers[0].layer[viewer.state.x_att])
-
-            if not values:
-                return
-
-            try:
-                xmin = round(min(min(vals) for vals in values), 0) - 2.5
-                xmax = round(max(max(vals) for vals in values), 0) + 2.5
-            except:
-                return
+            xmin = round(age_range.low, 0) - 2.5
+            xmax = round(age_range.high, 0) + 2.5
             for viewer in viewers:
                 viewer.state.hist_n_bin = int(xmax - xmin)
                 viewer.state.hist_x_min = xmin
@@ -135,31 +135,61 @@ def Page():
             "class_hist": class_hist_viewer
         }
 
-        two_hist_viewers = (all_student_hist_viewer, class_hist_viewer)
         for att in ('x_min', 'x_max'):
             link((all_student_hist_viewer.state, att), (class_hist_viewer.state, att))
 
+        return gjapp, viewers
+
+    gjapp, viewers = solara.use_memo(glue_setup, dependencies=[])
+
+    async def _load_class_results():
+        # The student's, class and all-data measurements are loaded at once,
+        #  without blocking the page while they are in flight
+        loads = [
+            ASYNC_LOCAL_API.get_class_measurements(GLOBAL_STATE, LOCAL_STATE),
+            ASYNC_LOCAL_API.get_all_data(GLOBAL_STATE, LOCAL_STATE),
+        ]
         if not LOCAL_STATE.value.measurements_loaded:
-            LOCAL_API.get_measurements(GLOBAL_STATE, LOCAL_STATE)
+            loads.append(ASYNC_LOCAL_API.get_measurements(GLOBAL_STATE, LOCAL_STATE))
+        class_measurements, all_data, *_ = await asyncio.gather(*loads)
+        return class_measurements, all_data
+
+    load_class_results = solara.lab.use_task(_load_class_results, dependencies=[])
+
+    def _on_class_results_loaded():
+        if not load_class_results.finished or data_ready.value:
+            return
+
+        class_measurements, all_data = load_class_results.value
+        all_measurements, student_summaries, class_summaries = all_data
+        # The all-data summaries are shared with other sessions
+        student_summaries = list(student_summaries)
+        class_summaries = list(class_summaries)
+
+        layer_viewer = viewers["layer"]
+        student_slider_viewer = viewers["student_slider"]
+        class_slider_viewer = viewers["class_slider"]
+        student_hist_viewer = viewers["student_hist"]
+        all_student_hist_viewer = viewers["all_student_hist"]
+        class_hist_viewer = viewers["class_hist"]
 
-        class_measurements = LOCAL_API.get_class_measurements(GLOBAL_STATE, LOCAL_STATE)
         measurements = Ref(LOCAL_STATE.fields.class_measurements)
         student_ids = Ref(LOCAL_STATE.fields.stage_5_class_data_students)
         if class_measurements and not student_ids.value:
-            ids = list(np.unique([m.student_id for m in class_measurements]))
-            student_ids.set(ids)
-        measurements.set(class_measurements)
+            student_ids.set(class_measurements.unique("student_id").tolist())
 
-        all_measurements, student_summaries, class_summaries = LOCAL_API.get_all_data(GLOBAL_STATE, LOCAL_STATE)
         if GLOBAL_STATE.value.classroom.class_info is not None:
             class_id = GLOBAL_STATE.value.classroom.class_info["id"]
-            class_distances = [distance for m in class_measurements if ((distance := m.est_dist_value) is not None and m.velocity_value is not None)]
-            class_velocities = [velocity for m in class_measurements if (m.est_dist_value is not None and (velocity := m.velocity_value) is not None)]
+            complete = class_measurements.complete()
+            class_distances = complete.column("est_dist_value")
+            class_velocities = complete.column("velocity_value")
             my_class_h0, my_class_age = create_single_summary(distances=class_distances, velocities=class_velocities)
             class_summaries.append(ClassSummary(class_id=class_id, hubble_fit_value=my_class_h0, age_value=my_class_age))
-            for measurement in class_measurements:
-                measurement.class_id = class_id
-            all_measurements.extend(class_measurements)
+            class_measurements = class_measurements.with_values(class_id=class_id)
+            all_measurements = MeasurementTable.concatenate(
+                [all_measurements, class_measurements]
+            )
+        measurements.set(class_measurements)
 
         all_meas = Ref(LOCAL_STATE.fields.all_measurements)
         all_stu_summaries = Ref(LOCAL_STATE.fields.student_summaries)
@@ -174,8 +204,8 @@ def Page():
         student_data = GLOBAL_STATE.value.add_or_update_data(student_data)
 
         class_ids = LOCAL_STATE.value.stage_5_class_data_students
-        class_data_points = [m for m in LOCAL_STATE.value.class_measurements if m.student_id in class_ids]
-        class_data = models_to_glue_data(class_data_points, label="Class Data")
+        class_data_points = LOCAL_STATE.value.class_measurements.for_students(class_ids)
+        class_data = class_data_points.to_glue_data(label="Class Data")
         class_data = GLOBAL_STATE.value.add_or_update_data(class_data)
 
         for component in ("est_dist_value", "velocity_value"):
@@ -246,7 +276,7 @@ def Page():
         student_hist_viewer.layers[0].state.color = MY_CLASS_COLOR
         student_hist_viewer.add_subset(my_summ_subset)
 
-        all_data = models_to_glue_data(all_measurements, label="All Measurements")
+        all_data = all_measurements.to_glue_data(label="All Measurements")
         all_data = GLOBAL_STATE.value.add_or_update_data(all_data)
 
         student_summ_data = models_to_glue_data(student_summaries, label="All Student Summaries")
@@ -294,19 +324,93 @@ def Page():
         for viewer in viewers.values():
             viewer.state.reset_limits(visible_only=True)
 
-        gjapp.data_collection.hub.subscribe(gjapp.data_collection, NumericalDataChangedMessage,
-                                            handler=partial(_update_bins, two_hist_viewers),
-                                            filter=lambda msg: msg.data.label == "Student Summaries")
-
-        gjapp.data_collection.hub.subscribe(gjapp.data_collection, NumericalDataChangedMessage,
-                                            handler=partial(_update_bins, [student_hist_viewer]),
-                                            filter=lambda msg: msg.data.label in ("All Student Summaries", "All Class Summaries"))
+        age_ranges["class"] = RunningRange.from_columns(
+            class_summary_data["id"], class_summary_data["age_value"]
+        )
+        age_ranges["all"] = RunningRange.from_columns(
+            [("student", summary.student_id) for summary in student_summaries]
+            + [("class", summary.class_id) for summary in class_summaries],
+            [summary.age_value for summary in student_summaries + class_summaries],
+        )
 
         data_ready.set(True)
 
-        return gjapp, viewers
+    solara.use_effect(
+        _on_class_results_loaded, dependencies=[load_class_results.finished]
+    )
 
-    gjapp, viewers = solara.use_memo(glue_setup, dependencies=[])
+    def _sync_summaries_with_measurements():
+        # When the student's measurements change, only their own fit and
+        #  their class's fit are updated, from running sums, and patched into
+        #  the summary data; the rest of the class is not refit
+        if not data_ready.value:
+            return
+
+        student_id = GLOBAL_STATE.value.student.id
+        class_info = GLOBAL_STATE.value.classroom.class_info
+        class_id = class_info["id"] if class_info is not None else None
+
+        class_table = LOCAL_STATE.value.class_measurements
+        students_table = class_table.for_students(
+            LOCAL_STATE.value.stage_5_class_data_students
+        )
+        student_fits = GroupedRegression.from_columns(
+            zip(
+                students_table.column("student_id"),
+                students_table.column("galaxy_id"),
+            ),
+            students_table.column("student_id"),
+            students_table.column("est_dist_value"),
+            students_table.column("velocity_value"),
+        )
+        class_fits = GroupedRegression.from_columns(
+            zip(class_table.column("student_id"), class_table.column("galaxy_id")),
+            class_table.column("class_id"),
+            class_table.column("est_dist_value"),
+            class_table.column("velocity_value"),
+        )
+        my_keys = {(student_id, m.galaxy_id) for m in LOCAL_STATE.value.measurements}
+
+        def _on_measurements_changed(measurements: list[StudentMeasurement]):
+            nonlocal my_keys
+            points = {(student_id, m.galaxy_id): m for m in measurements}
+            for fits, group in ((student_fits, student_id), (class_fits, class_id)):
+                if group not in fits:
+                    continue
+                for key in my_keys - points.keys():
+                    fits.remove(key)
+                for key, m in points.items():
+                    fits.add(key, group, m.est_dist_value, m.velocity_value)
+            my_keys = set(points)
+
+            data_collection = GLOBAL_STATE.value.glue_data_collection
+            if student_id in student_fits:
+                if not patch_summary_data(
+                    data_collection["Class Summaries"], student_fits, [student_id]
+                ):
+                    GLOBAL_STATE.value.add_or_update_data(
+                        regression_summary_data(student_fits, "id", "Class Summaries")
+                    )
+                age_ranges["class"].set(student_id, student_fits.age(student_id))
+                _update_bins([viewers["student_hist"]], age_ranges["class"])
+            if class_id in class_fits:
+                patch_summary_data(
+                    data_collection["All Class Summaries"],
+                    class_fits,
+                    [class_id],
+                    "class_id",
+                )
+                age_ranges["all"].set(("class", class_id), class_fits.age(class_id))
+                _update_bins(
+                    (viewers["all_student_hist"], viewers["class_hist"]),
+                    age_ranges["all"],
+                )
+
+        return Ref(LOCAL_STATE.fields.measurements).subscribe(_on_measurements_changed)
+
+    solara.use_effect(
+        _sync_summaries_with_measurements, dependencies=[data_ready.value]
+    )
 
     if not data_ready.value:
         rv.ProgressCircular(
@@ -317,8 +421,10 @@ def Page():
         )
         return
 
-    _update_bins((viewers["all_student_hist"], viewers["class_hist"]))
-    _update_bins((viewers["student_hist"],))
+    _update_bins(
+        (viewers["all_student_hist"], viewers["class_hist"]), age_ranges.get("all")
+    )
+    _update_bins((viewers["student_hist"],), age_ranges.get("class"))
 
     logger.info("DATA IS READY")
     for name, viewer in viewers.items():
@@ -604,7 +710,10 @@ def Page():
                             age_calc_short1=get_free_response(LOCAL_STATE, COMPONENT_STATE,"shortcoming-1").get("response"),
                             age_calc_short2=get_free_response(LOCAL_STATE, COMPONENT_STATE,"shortcoming-2").get("response"),
                             age_calc_short_other=get_free_response(LOCAL_STATE, COMPONENT_STATE,"other-shortcomings").get("response"),    
-                            event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                            event_fr_callback = lambda event: fr_callback(
+                                event, LOCAL_STATE, COMPONENT_STATE,
+                                lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                            ),
                             free_responses=[get_free_response(LOCAL_STATE, COMPONENT_STATE,'shortcoming-4'), get_free_response(LOCAL_STATE, COMPONENT_STATE,'systematic-uncertainty')]   
                         )
             
@@ -669,7 +778,10 @@ def Page():
                         age_calc_short1=get_free_response(LOCAL_STATE, COMPONENT_STATE,"shortcoming-1").get("response"),
                         age_calc_short2=get_free_response(LOCAL_STATE, COMPONENT_STATE,"shortcoming-2").get("response"),
                         age_calc_short_other=get_free_response(LOCAL_STATE, COMPONENT_STATE,"other-shortcomings").get("response"),  
-                        event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                        event_fr_callback = lambda event: fr_callback(
+                            event, LOCAL_STATE, COMPONENT_STATE,
+                            lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                        ),
                         free_responses=[get_free_response(LOCAL_STATE, COMPONENT_STATE,'shortcoming-4'), get_free_response(LOCAL_STATE, COMPONENT_STATE,'systematic-uncertainty')]
                 )
 
@@ -772,7 +884,10 @@ def Page():
         event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
         can_advance=COMPONENT_STATE.value.can_transition(next=True),
         show=COMPONENT_STATE.value.is_current_step(Marker.mos_lik4),
-        event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+        event_fr_callback = lambda event: fr_callback(
+            event, LOCAL_STATE, COMPONENT_STATE,
+            lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+        ),
         state_view={
             'free_response_a': get_free_response(LOCAL_STATE, COMPONENT_STATE,'best-guess-age'),
             # 'best_guess_answered': LOCAL_STATE.value.question_completed("best-guess-age"),
@@ -786,7 +901,10 @@ def Page():
         event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
         can_advance=COMPONENT_STATE.value.can_transition(next=True),
         show=COMPONENT_STATE.value.is_current_step(Marker.con_int3),
-        event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+        event_fr_callback = lambda event: fr_callback(
+            event, LOCAL_STATE, COMPONENT_STATE,
+            lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+        ),
         state_view={
             'free_response_a': get_free_response(LOCAL_STATE, COMPONENT_STATE,'likely-low-age'),
             'free_response_b': get_free_response(LOCAL_STATE, COMPONENT_STATE,'likely-high-age'),
@@ -878,7 +996,10 @@ def Page():
                     event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
                     can_advance=COMPONENT_STATE.value.can_transition(next=True),
                     show=COMPONENT_STATE.value.is_current_step(Marker.two_his5),
-                    event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                    event_fr_callback = lambda event: fr_callback(
+                        event, LOCAL_STATE, COMPONENT_STATE,
+                        lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                    ),
                     state_view={
                         'free_response': get_free_response(LOCAL_STATE, COMPONENT_STATE,'unc-range-change-reasoning'),
                     }
@@ -904,7 +1025,10 @@ def Page():
             event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
             can_advance=COMPONENT_STATE.value.can_transition(next=True),
             show=COMPONENT_STATE.value.is_current_step(Marker.con_int2c),
-            event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+            event_fr_callback = lambda event: fr_callback(
+                event, LOCAL_STATE, COMPONENT_STATE,
+                lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+            ),
             state_view={
                 "low_guess": get_free_response(LOCAL_STATE, COMPONENT_STATE,"likely-low-age").get("response"),
                 "high_guess": get_free_response(LOCAL_STATE, COMPONENT_STATE,"likely-high-age").get("response"),
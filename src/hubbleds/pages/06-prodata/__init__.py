@@ -14,7 +14,9 @@ from cosmicds.logger import setup_logger
 from cosmicds.utils import show_legend, show_layer_traces_in_legend
 
 # hubbleds
-from hubbleds.remote import LOCAL_API
+from hubbleds.remote import LOCAL_API, ASYNC_LOCAL_API
+from hubbleds.persistence import schedule_stage_state, schedule_story_state
+from hubbleds.hydration import load_stage_state
 from hubbleds.base_component_state import (
     transition_previous,
     transition_next,
@@ -36,7 +38,7 @@ from hubbleds.viewer_marker_colors import (
     HST_KEY_COLOR_NAME,
 )
 
-from ...utils import HST_KEY_AGE, models_to_glue_data, AGE_CONSTANT
+from ...utils import HST_KEY_AGE, AGE_CONSTANT
 
 from .component_state import COMPONENT_STATE, Marker
 
@@ -52,7 +54,6 @@ from ...viewers import HubbleFitView
 
 from typing import Tuple, cast
 from ...data_management import HUBBLE_1929_DATA_LABEL, HUBBLE_KEY_DATA_LABEL
-import numpy as np
 
 # from ...data_management import *
 
@@ -78,24 +79,21 @@ def Page():
     loaded_component_state = solara.use_reactive(False)
 
     async def _load_component_state():
-        LOCAL_API.get_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
+        await load_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
         logger.info("Finished loading component state")
         loaded_component_state.set(True)
     
     solara.lab.use_task(_load_component_state)
     
-    async def _write_component_state():
+    def _write_component_state():
         if not loaded_component_state.value:
             return
 
-        # Listen for changes in the states and write them to the database
-        res = LOCAL_API.put_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
-        if res:
-            logger.info("Wrote stage 6 component state to database.")
-        else:
-            logger.info("Did not write stage 6 component state to database.")
+        # Listen for changes in the states and queue them to be written to
+        #  the database
+        schedule_stage_state(GLOBAL_STATE, LOCAL_STATE, COMPONENT_STATE)
 
-    solara.lab.use_task(_write_component_state, dependencies=[COMPONENT_STATE.value])
+    solara.use_effect(_write_component_state, dependencies=[COMPONENT_STATE.value])
     
     # === Setup Glue ===
     
@@ -119,23 +117,8 @@ def Page():
         if HUBBLE_1929_DATA_LABEL not in gjapp.data_collection:
             gjapp.data_collection.append(load_data(data_dir / f"{HUBBLE_1929_DATA_LABEL}.csv"))
         
-        if len(LOCAL_STATE.value.class_measurements) == 0:
-            class_measurements = LOCAL_API.get_class_measurements(GLOBAL_STATE, LOCAL_STATE)
-            measurements = Ref(LOCAL_STATE.fields.class_measurements)
-            student_ids = Ref(LOCAL_STATE.fields.stage_5_class_data_students)
-            if class_measurements and not student_ids.value:
-                ids = list(np.unique([m.student_id for m in class_measurements]))
-                student_ids.set(ids)
-            measurements.set(class_measurements)
-        
-        if 'Class Data' not in gjapp.data_collection:
-            class_data = models_to_glue_data(LOCAL_STATE.value.class_measurements, label="Class Data")
-            class_data = GLOBAL_STATE.value.add_or_update_data(class_data)
-
         add_link(HUBBLE_1929_DATA_LABEL, 'Distance (Mpc)', HUBBLE_KEY_DATA_LABEL, 'Distance (Mpc)')
         add_link(HUBBLE_1929_DATA_LABEL, 'Tweaked Velocity (km/s)', HUBBLE_KEY_DATA_LABEL, 'Velocity (km/s)')
-        add_link(HUBBLE_1929_DATA_LABEL, 'Distance (Mpc)', 'Class Data', 'est_dist_value')
-        add_link(HUBBLE_1929_DATA_LABEL, 'Tweaked Velocity (km/s)', 'Class Data', 'velocity_value')
 
         viewer = cast(HubbleFitView, gjapp.new_data_viewer(HubbleFitView, show=False))
         viewer.state.title = "Professional Data"
@@ -148,6 +131,46 @@ def Page():
 
     gjapp, viewer = solara.use_memo(_glue_setup)
 
+    data_ready = solara.use_reactive(False)
+
+    async def _load_class_measurements():
+        # Loaded without blocking the page while the request is in flight
+        if len(LOCAL_STATE.value.class_measurements) > 0:
+            return
+        class_measurements = await ASYNC_LOCAL_API.get_class_measurements(
+            GLOBAL_STATE, LOCAL_STATE
+        )
+        student_ids = Ref(LOCAL_STATE.fields.stage_5_class_data_students)
+        if class_measurements and not student_ids.value:
+            student_ids.set(class_measurements.unique("student_id").tolist())
+
+    load_class_measurements = solara.lab.use_task(
+        _load_class_measurements, dependencies=[]
+    )
+
+    def _on_class_measurements_loaded():
+        if not load_class_measurements.finished or data_ready.value:
+            return
+
+        if 'Class Data' not in gjapp.data_collection:
+            class_data = LOCAL_STATE.value.class_measurements.to_glue_data(
+                label="Class Data"
+            )
+            GLOBAL_STATE.value.add_or_update_data(class_data)
+
+        class_data_dc = gjapp.data_collection['Class Data']
+        data_1929 = gjapp.data_collection[HUBBLE_1929_DATA_LABEL]
+        gjapp.add_link(data_1929, 'Distance (Mpc)', class_data_dc, 'est_dist_value')
+        gjapp.add_link(
+            data_1929, 'Tweaked Velocity (km/s)', class_data_dc, 'velocity_value'
+        )
+
+        data_ready.set(True)
+
+    solara.use_effect(
+        _on_class_measurements_loaded, dependencies=[load_class_measurements.finished]
+    )
+
     def _state_callback_setup():
         # We want to minimize duplicate state handling, but also keep the states
         #  independent. We'll set up observers for changes here so that they
@@ -227,8 +250,9 @@ def Page():
         show_legend(viewer, show=Marker.is_at_or_after(marker, Marker.pro_dat8))
 
     current_step = Ref(COMPONENT_STATE.fields.current_step)
-    current_step.subscribe(lambda step: add_data_by_marker(viewer, step))
-    add_data_by_marker(viewer, current_step.value)
+    if data_ready.value:
+        current_step.subscribe(lambda step: add_data_by_marker(viewer, step))
+        add_data_by_marker(viewer, current_step.value)
 
     show_layer_traces_in_legend(viewer)
 
@@ -240,8 +264,9 @@ def Page():
         # returns the slope, m,  of y(x) = m*x
         return sum(x * y) / sum(x * x)
 
-    def _on_component_state_loaded(value: bool):
-        if not value:
+    def _on_component_state_loaded():
+        # The class age needs both the component state and the class data
+        if not (loaded_component_state.value and data_ready.value):
             return
 
         class_age = Ref(COMPONENT_STATE.fields.class_age)
@@ -255,7 +280,10 @@ def Page():
             slope = linear_slope(dist[indices], vel[indices])
             class_age.set(round(AGE_CONSTANT / slope, 8))     
 
-    loaded_component_state.subscribe(_on_component_state_loaded) 
+    solara.use_effect(
+        _on_component_state_loaded,
+        dependencies=[loaded_component_state.value, data_ready.value],
+    )
 
     StateEditor(Marker, COMPONENT_STATE, LOCAL_STATE, LOCAL_API, show_all=True)
     
@@ -305,7 +333,10 @@ def Page():
                 can_advance=COMPONENT_STATE.value.can_transition(next=True),
                 show=COMPONENT_STATE.value.is_current_step(Marker.pro_dat4),
                 event_mc_callback = lambda event: mc_callback(event, LOCAL_STATE, COMPONENT_STATE),
-                event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                event_fr_callback = lambda event: fr_callback(
+                    event, LOCAL_STATE, COMPONENT_STATE,
+                    lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                ),
                 state_view={
                     'mc_score': get_multiple_choice(LOCAL_STATE, COMPONENT_STATE, 'pro-dat4'), 
                     'score_tag': 'pro-dat4',
@@ -346,7 +377,10 @@ def Page():
                 can_advance=COMPONENT_STATE.value.can_transition(next=True),
                 show=COMPONENT_STATE.value.is_current_step(Marker.pro_dat7),
                 event_mc_callback = lambda event: mc_callback(event, LOCAL_STATE, COMPONENT_STATE),
-                event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                event_fr_callback = lambda event: fr_callback(
+                    event, LOCAL_STATE, COMPONENT_STATE,
+                    lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                ),
                 state_view={
                     'mc_score': get_multiple_choice(LOCAL_STATE, COMPONENT_STATE, 'pro-dat7'), 
                     'score_tag': 'pro-dat7',
@@ -360,7 +394,10 @@ def Page():
                 event_back_callback=lambda _: transition_previous(COMPONENT_STATE),
                 can_advance=COMPONENT_STATE.value.can_transition(next=True),
                 show=COMPONENT_STATE.value.is_current_step(Marker.pro_dat8),
-                event_fr_callback = lambda event: fr_callback(event, LOCAL_STATE, COMPONENT_STATE, lambda: LOCAL_API.put_story_state(GLOBAL_STATE, LOCAL_STATE)),
+                event_fr_callback = lambda event: fr_callback(
+                    event, LOCAL_STATE, COMPONENT_STATE,
+                    lambda: schedule_story_state(GLOBAL_STATE, LOCAL_STATE),
+                ),
                 state_view={
                     'free_response_a': get_free_response(LOCAL_STATE, COMPONENT_STATE,'prodata-reflect-8a'),
                     'free_response_b': get_free_response(LOCAL_STATE, COMPONENT_STATE,'prodata-reflect-8b'),
@@ -400,12 +437,20 @@ def Page():
         
         with rv.Col(class_="no-padding"):
             with solara.Columns([3,9], classes=["no-padding"]):
-                with rv.Col(class_="no-padding"):
-                    # TODO: LayerToggle should refresh when the data changes
-                    LayerToggle(viewer, names={
-                        "Class Data": "Class Data",
-                        HUBBLE_1929_DATA_LABEL: "Hubble 1929 Data",
-                        HUBBLE_KEY_DATA_LABEL: "HST Key Project 2001 Data"
-                    })
-                with rv.Col(class_="no-padding"):
-                    ViewerLayout(viewer)
+                if not data_ready.value:
+                    rv.ProgressCircular(
+                        width=3,
+                        color="primary",
+                        indeterminate=True,
+                        size=100,
+                    )
+                else:
+                    with rv.Col(class_="no-padding"):
+                        # TODO: LayerToggle should refresh when the data changes
+                        LayerToggle(viewer, names={
+                            "Class Data": "Class Data",
+                            HUBBLE_1929_DATA_LABEL: "Hubble 1929 Data",
+                            HUBBLE_KEY_DATA_LABEL: "HST Key Project 2001 Data"
+                        })
+                    with rv.Col(class_="no-padding"):
+                        ViewerLayout(viewer)
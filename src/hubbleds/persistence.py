@@ -0,0 +1,262 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+import solara
+from solara import Reactive
+from solara.server import kernel_context
+
+from cosmicds.state import GlobalState, BaseState
+from cosmicds.logger import setup_logger
+
+from hubbleds.hydration import remember_stage_state
+from hubbleds.remote import ASYNC_LOCAL_API, DEBOUNCE_TIMEOUT
+from hubbleds.state import LocalState
+
+logger = setup_logger("PERSISTENCE")
+
+# Upper bound (in seconds) on how long a pending write may be postponed by a
+#  steady stream of new changes
+MAX_WRITE_DELAY = 5 * DEBOUNCE_TIMEOUT
+
+Writer = Callable[[], Awaitable[bool]]
+
+
+class PersistenceScheduler:
+    """
+    Per-session write-behind queue for story, stage and measurement state.
+
+    Writes are requested under a key (e.g. "story-state"). Requesting a key
+    that is already pending replaces the pending writer, so repeated changes
+    collapse into a single write of the latest state. Pending writes are
+    flushed once no new request has arrived for `debounce` seconds, once the
+    oldest pending request is `max_delay` seconds old, when a flush is
+    explicitly requested (e.g. on a route change), and when the session
+    disconnects.
+
+    `request` may be called from any thread. The writes themselves are run by
+    `run`, which is meant to be started once per session as a long-lived
+    task, so that they execute inside the session's kernel context.
+    """
+
+    def __init__(self,
+                 debounce: float = DEBOUNCE_TIMEOUT,
+                 max_delay: float = MAX_WRITE_DELAY):
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        self._pending: dict[str, Writer] = {}
+        self._first_request: Optional[float] = None
+        self._last_request: Optional[float] = None
+        self._flush_requested = False
+        self._lock = threading.Lock()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+        self.requests = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency: Optional[float] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def request(self, key: str, writer: Writer):
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = writer
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+        self._notify()
+
+    def request_flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            self._flush_requested = True
+        self._notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": len(self._pending),
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "writes": self.writes,
+                "failures": self.failures,
+                "last_latency": self.last_latency,
+                "mean_latency": (
+                    self.total_latency / self.writes if self.writes else None
+                ),
+                "max_latency": self.max_latency,
+            }
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                delay = self._time_until_due()
+                if delay is None:
+                    await self._wake.wait()
+                elif delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self.flush()
+                self._wake.clear()
+        except asyncio.CancelledError:
+            if self._pending:
+                logger.info(
+                    "Flushing %d pending write(s) before shutdown.", len(self._pending)
+                )
+                await self.flush()
+            raise
+        finally:
+            self._loop = None
+            self._wake = None
+
+    async def flush(self) -> bool:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._first_request = None
+            self._last_request = None
+            self._flush_requested = False
+
+        if not pending:
+            return True
+
+        results = await asyncio.gather(
+            *(self._write(key, writer) for key, writer in pending.items())
+        )
+        return all(results)
+
+    async def _write(self, key: str, writer: Writer) -> bool:
+        start = time.perf_counter()
+        try:
+            stored = await writer()
+        except asyncio.CancelledError:
+            # Put the write back unless it has been superseded in the meantime
+            with self._lock:
+                self._pending.setdefault(key, writer)
+                if self._first_request is None:
+                    self._first_request = self._last_request = time.monotonic()
+            raise
+        except Exception as e:
+            logger.error("Write `%s` failed: %s", key, e)
+            stored = False
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.writes += 1
+            self.failures += 0 if stored else 1
+            self.total_latency += elapsed
+            self.max_latency = max(self.max_latency, elapsed)
+            self.last_latency = elapsed
+
+        logger.info(
+            "%s `%s` in %.3f s (%d pending).",
+            "Wrote" if stored else "Did not write",
+            key,
+            elapsed,
+            len(self._pending),
+        )
+        return stored
+
+    def _time_until_due(self) -> Optional[float]:
+        with self._lock:
+            if not self._pending:
+                return None
+            if self._flush_requested:
+                return 0
+            due = min(
+                self._last_request + self.debounce,
+                self._first_request + self.max_delay,
+            )
+        return due - time.monotonic()
+
+    def _notify(self):
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+
+_SCHEDULERS: dict[str, PersistenceScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_persistence_scheduler() -> PersistenceScheduler:
+    """
+    Return the persistence scheduler for the current session.
+    """
+    context_id = kernel_context.get_current_context().id
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(context_id)
+        if scheduler is None:
+            scheduler = _SCHEDULERS[context_id] = PersistenceScheduler()
+        return scheduler
+
+
+def _on_kernel_start():
+    context_id = kernel_context.get_current_context().id
+
+    def cleanup():
+        with _SCHEDULERS_LOCK:
+            _SCHEDULERS.pop(context_id, None)
+
+    return cleanup
+
+
+solara.lab.on_kernel_start(_on_kernel_start)
+
+
+def schedule_story_state(
+    global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+):
+    get_persistence_scheduler().request(
+        "story-state",
+        lambda: ASYNC_LOCAL_API.put_story_state(global_state, local_state),
+    )
+
+
+def schedule_measurements(
+    global_state: Reactive[GlobalState],
+    local_state: Reactive[LocalState],
+    samples: bool = False,
+):
+    if samples:
+        get_persistence_scheduler().request(
+            "sample-measurements",
+            lambda: ASYNC_LOCAL_API.put_sample_measurements(global_state, local_state),
+        )
+    else:
+        get_persistence_scheduler().request(
+            "measurements",
+            lambda: ASYNC_LOCAL_API.put_measurements(global_state, local_state),
+        )
+
+
+def schedule_stage_state(
+    global_state: Reactive[GlobalState],
+    local_state: Reactive[LocalState],
+    component_state: Reactive[BaseState],
+):
+    remember_stage_state(component_state)
+    get_persistence_scheduler().request(
+        f"stage-state:{component_state.value.stage_id}",
+        lambda: ASYNC_LOCAL_API.put_stage_state(
+            global_state, local_state, component_state
+        ),
+    )
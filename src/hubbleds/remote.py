@@ -1,69 +1,326 @@
 from cosmicds.utils import CDSJSONEncoder
-from hubbleds.state import ClassSummary, StudentMeasurement, StudentSummary
-from contextlib import closing
-from io import BytesIO
+from hubbleds.state import StudentMeasurement
+from collections import OrderedDict
+from functools import cached_property
 import json
-from astropy.io import fits
 from hubbleds.state import GalaxyData, SpectrumData, LocalState
+from hubbleds.spectrum_cache import SPECTRUM_CACHE, spectrum_key
+from hubbleds.spectrum_bundle import get_spectrum_bundle
+from hubbleds.spectrum_prefetch import SpectrumPrefetcher
+from hubbleds.spectrum_decoder import (
+    SpectrumColumns,
+    decode_spectrum,
+    decode_spectrum_async,
+)
+from hubbleds.json_patch import apply_patch, make_patch
+from hubbleds.galaxy_catalog import GALAXY_CATALOGS, GalaxyCatalog
+from hubbleds.measurement_table import MeasurementTable
+from hubbleds.decoding import (
+    decode_class_summaries,
+    decode_measurements,
+    decode_student_summaries,
+)
+from hubbleds.seed_data import SeedData, select_seed_indices
+from hubbleds.singleflight import SingleFlight
+from hubbleds.http_cache import HTTP_CACHE, AsyncCachingTransport, CachingAdapter
+from hubbleds.resilience import (
+    CONNECT_TIMEOUT,
+    POOL_SIZE,
+    READ_TIMEOUT,
+    BACKEND_BREAKER,
+    AsyncResilientTransport,
+    CircuitBreaker,
+    LastGood,
+    is_backend_failure,
+)
+from hubbleds.streaming import (
+    STREAM_ALL_DATA,
+    STREAM_CHUNK_SIZE,
+    AllData,
+    AllDataReader,
+)
+from hubbleds.transport import (
+    BULK_HEADERS,
+    bulk_measurements,
+    bulk_records,
+    is_arrow,
+    read_bulk_payload,
+)
+from hubbleds.write_journal import (
+    REPLAY_BATCH_SIZE,
+    REPLAY_INTERVAL,
+    REPLAY_INTERVAL_MAX,
+    WRITE_JOURNAL,
+    JournalEntry,
+    WriteJournal,
+)
 from cosmicds.remote import BaseAPI
 from cosmicds.state import GlobalState, BaseState, GLOBAL_STATE
 from solara import Reactive
 from solara.toestand import Ref
 from cosmicds.logger import setup_logger
 from typing import List
+import asyncio
+import concurrent.futures
+import threading
+
+import httpx
+from solara.server import kernel_context
 
 from pathlib import Path
 from csv import DictReader
+from math import inf
 
 logger = setup_logger("API")
 
-from .data_management import DB_VELOCITY_FIELD
-from numpy.random import Generator, PCG64, SeedSequence
-from numpy import arange, asarray, ravel, column_stack
-from typing import Any
+from numpy import isnan
+from typing import Any, Callable, Hashable, TypeVar
 
 ELEMENT_REST = {"H-α": 6562.79, "Mg-I": 5176.7}
 DEBOUNCE_TIMEOUT = 1
 
+T = TypeVar("T")
+
+# Default timeouts (in seconds) and connection pool limits for the async client
+ASYNC_TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+ASYNC_LIMITS = httpx.Limits(
+    max_connections=POOL_SIZE, max_keepalive_connections=min(POOL_SIZE, 20)
+)
+
+# Status codes indicating that the backend has no batched measurement route
+BATCH_UNSUPPORTED_STATUS = {404, 405, 501}
+
+# Status codes indicating that the backend does not accept story state patches
+PATCH_UNSUPPORTED_STATUS = {405, 501}
+
+# Number of acknowledged story states kept as patch bases
+STORY_STATE_TRACKER_SIZE = 1024
+
+# Number of acknowledged measurement payloads remembered. A student has a
+#  handful of measurements, so this covers several thousand active students.
+MEASUREMENT_TRACKER_SIZE = 32768
+
+# How long (in seconds) shared read results are reused after a request
+#  completes. Class and all-data results change as students submit, so they
+#  are only kept long enough to absorb a burst of identical requests; the
+#  seed measurements never change during a run.
+CLASS_DATA_TTL = 5
+SEED_DATA_TTL = 300
+
+
+class MeasurementTracker:
+    """
+    Remembers the last payload the backend acknowledged for each measurement,
+    so that only measurements that changed since then need to be submitted.
+    Entries are keyed by kind ("measurement" or "sample"), story and the
+    measurement's `submission_key`, which makes a single tracker safe to share
+    between sessions. Only the most recently acknowledged `max_entries`
+    payloads are kept; a measurement whose entry was evicted is simply
+    submitted again.
+    """
+
+    def __init__(self, max_entries: int = MEASUREMENT_TRACKER_SIZE):
+        self.max_entries = max_entries
+        self._submitted: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def dirty(
+        self, kind: str, story_id: str, measurements: list[StudentMeasurement]
+    ) -> list[tuple[tuple, dict]]:
+        changed = []
+        with self._lock:
+            for measurement in measurements:
+                key = (kind, story_id, *measurement.submission_key)
+                payload = measurement.submission_payload()
+                if self._submitted.get(key) != payload:
+                    changed.append((key, payload))
+        return changed
+
+    def mark_clean(self, entries: list[tuple[tuple, dict]]):
+        with self._lock:
+            for key, payload in entries:
+                self._submitted[key] = payload
+                self._submitted.move_to_end(key)
+            while len(self._submitted) > self.max_entries:
+                self._submitted.popitem(last=False)
+
+    def mark_loaded(
+        self, kind: str, story_id: str, measurements: list[StudentMeasurement]
+    ):
+        self.mark_clean([
+            ((kind, story_id, *m.submission_key), m.submission_payload())
+            for m in measurements
+        ])
+
+
+class StoryStateTracker:
+    """
+    Keeps the last story state the backend acknowledged for each student and
+    story, with the `ETag` the backend returned for it, so that later writes
+    can be sent as patches conditional on that version. A state acknowledged
+    without an `ETag` is not kept, since there is nothing to make a patch
+    conditional on; a backend that doesn't version story states always gets
+    full uploads. Only the most recently written `max_entries` states are
+    kept.
+    """
+
+    def __init__(self, max_entries: int = STORY_STATE_TRACKER_SIZE):
+        self.max_entries = max_entries
+        self._acknowledged: OrderedDict[tuple, tuple[str, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str, dict] | None:
+        with self._lock:
+            return self._acknowledged.get(key)
+
+    def acknowledge(self, key: tuple, state: dict, etag: str | None):
+        with self._lock:
+            if not etag:
+                self._acknowledged.pop(key, None)
+                return
+            self._acknowledged[key] = (etag, state)
+            self._acknowledged.move_to_end(key)
+            while len(self._acknowledged) > self.max_entries:
+                self._acknowledged.popitem(last=False)
+
 
 class LocalAPI(BaseAPI):
+    batch_measurements_supported: bool = True
+    story_state_patch_supported: bool = True
+    batch_stage_states_supported: bool = True
+
+    @cached_property
+    def request_session(self):
+        # A single session for the life of the API, so that connections are
+        #  reused. Requests to the backend get default timeouts, retries and
+        #  the circuit breaker, and read-only endpoints go through the HTTP
+        #  cache.
+        session = super().request_session
+        session.mount(self.API_URL, CachingAdapter(HTTP_CACHE))
+        return session
+
     def get_galaxies(self, local_state: Reactive[LocalState]) -> list[GalaxyData]:
-        galaxy_data_json = self.request_session.get(
-            f"{self.API_URL}/{local_state.value.story_id}/galaxies?types=Sp"
-        ).json()
+        return self.get_galaxy_catalog(local_state).galaxies()
+
+    def get_galaxy_catalog(self, local_state: Reactive[LocalState]) -> GalaxyCatalog:
+        story_id = local_state.value.story_id
+        catalog = GALAXY_CATALOGS.get(story_id)
+        if catalog is not None and GALAXY_CATALOGS.is_fresh(story_id):
+            return catalog
+
+        with GALAXY_CATALOGS.lock(story_id):
+            # Another session may have refreshed the catalog while we waited
+            catalog = GALAXY_CATALOGS.get(story_id)
+            if catalog is not None and GALAXY_CATALOGS.is_fresh(story_id):
+                return catalog
+
+            r = self.request_session.get(
+                self._galaxies_url(story_id),
+                headers=GALAXY_CATALOGS.validators(story_id),
+            )
 
-        galaxy_data = [GalaxyData(**x) for x in galaxy_data_json]
+            return self._set_galaxy_catalog(r, story_id)
 
-        return galaxy_data
+    def _galaxies_url(self, story_id: str) -> str:
+        return f"{self.API_URL}/{story_id}/galaxies?types=Sp"
+
+    @staticmethod
+    def _set_galaxy_catalog(r, story_id: str) -> GalaxyCatalog:
+        catalog = GALAXY_CATALOGS.get(story_id)
+        if catalog is not None:
+            if r.status_code == 304:
+                GALAXY_CATALOGS.revalidated(story_id)
+                return catalog
+            elif r.status_code != 200:
+                logger.warning(
+                    "Failed to revalidate galaxy catalog (status %d); "
+                    "serving cached copy.",
+                    r.status_code,
+                )
+                GALAXY_CATALOGS.revalidated(story_id)
+                return catalog
+
+        r.raise_for_status()
+        catalog = GalaxyCatalog(
+            r.json(),
+            etag=r.headers.get("ETag"),
+            last_modified=r.headers.get("Last-Modified"),
+        )
+        GALAXY_CATALOGS.store(story_id, catalog)
+
+        return catalog
 
     def load_spectrum_data(
         self, gal_data: GalaxyData, local_state: Reactive[LocalState]
     ) -> SpectrumData | None:
-        file_name = f"{gal_data.name.replace('.fits', '')}.fits"
+        spec_data = self._stored_spectrum(gal_data, local_state.value.story_id)
+        if spec_data is not None:
+            return spec_data
 
-        type_folders = {"Sp": "spiral", "E": "elliptical", "Ir": "irregular"}
-        folder = type_folders[gal_data.type]
-        url = (
-            f"{self.API_URL}/{local_state.value.story_id}/spectra/{folder}/{file_name}"
+        key = spectrum_key(local_state.value.story_id, gal_data.name)
+        url = self._spectrum_url(gal_data, local_state)
+
+        def _fetch():
+            response = self.request_session.get(url)
+            return self._set_spectrum_data(
+                decode_spectrum(response.content), gal_data, key
+            )
+
+        # Joins a prefetch of the same spectrum if one is in progress
+        return self.request_coalescer.do(url, _fetch)
+
+    def _spectrum_url(
+        self, gal_data: GalaxyData, local_state: Reactive[LocalState]
+    ) -> str:
+        return (
+            f"{self.API_URL}/{local_state.value.story_id}/spectra/"
+            f"{self.spectrum_path(gal_data)}"
         )
-        response = self.request_session.get(url)
 
-        with closing(BytesIO(response.content)) as f:
-            f.name = gal_data.name
+    @staticmethod
+    def spectrum_path(gal_data: GalaxyData) -> str:
+        file_name = f"{gal_data.name.replace('.fits', '')}.fits"
 
-            with fits.open(f) as hdulist:
-                data = hdulist["COADD"].data if "COADD" in hdulist else None
+        type_folders = {"Sp": "spiral", "E": "elliptical", "Ir": "irregular"}
+        folder = type_folders[gal_data.type]
+        return f"{folder}/{file_name}"
+
+    @staticmethod
+    def _stored_spectrum(gal_data: GalaxyData, story_id: str) -> SpectrumData | None:
+        # Spectra that can be served without a request, from the prebuilt
+        #  bundle if one is configured, or else from the spectrum cache
+        bundle = get_spectrum_bundle()
+        if bundle is not None and bundle.story_id == story_id:
+            spec_data = bundle.get(gal_data.name)
+            if spec_data is not None:
+                return spec_data
+
+        spec_data = SPECTRUM_CACHE.get(spectrum_key(story_id, gal_data.name))
+        if spec_data is not None:
+            logger.info("Loaded spectrum data for galaxy `%s` from cache.", gal_data.id)
+        return spec_data
 
-        if data is None:
+    @staticmethod
+    def _has_stored_spectrum(gal_data: GalaxyData, story_id: str) -> bool:
+        bundle = get_spectrum_bundle()
+        if (
+            bundle is not None
+            and bundle.story_id == story_id
+            and gal_data.name in bundle
+        ):
+            return True
+        return spectrum_key(story_id, gal_data.name) in SPECTRUM_CACHE
+
+    def _set_spectrum_data(
+        self, columns: SpectrumColumns | None, gal_data: GalaxyData, key
+    ) -> SpectrumData | None:
+        if columns is None:
             logger.error("No extension named 'COADD' in spectrum file.")
             return
 
-        spec_data = SpectrumData(
-            name=gal_data.name,
-            wave=10 ** data["loglam"],
-            flux=data["flux"],
-            ivar=data["ivar"],
-        )
+        wave, flux = columns
+        spec_data = SpectrumData(name=gal_data.name, wave=wave, flux=flux)
+        SPECTRUM_CACHE.put(key, spec_data)
 
         logger.info("Loaded spectrum data for galaxy `%s` from database.", gal_data.id)
 
@@ -71,7 +328,7 @@ class LocalAPI(BaseAPI):
 
     def get_dummy_data(self) -> List[StudentMeasurement]:
         path = (Path(__file__).parent / "data" / "dummy_student_data.csv").as_posix()
-        measurements = []
+        records = []
         galaxy_prefix = "galaxy."
         galaxy_pref_len = len(galaxy_prefix)
         with open(path, 'r') as f:
@@ -85,29 +342,38 @@ class LocalAPI(BaseAPI):
                         keys_to_remove.add(key)
                 measurement = { k: v for k, v in row.items() if k not in keys_to_remove }
                 measurement["galaxy"] = galaxy
-                measurements.append(StudentMeasurement(**measurement))
-        return measurements
+                records.append(measurement)
+
+        # CSV values are all strings, so these always need validating
+        return decode_measurements(records)
 
     def get_measurements(
         self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
     ) -> list[StudentMeasurement]:
-        url = (
+        r = self.request_session.get(self._measurements_url(global_state, local_state))
+
+        return self._set_measurements(r, local_state)
+
+    def _measurements_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
+        return (
             f"{self.API_URL}/{local_state.value.story_id}/measurements/"
             f"{global_state.value.student.id}"
         )
-        r = self.request_session.get(url)
-            
+
+    def _set_measurements(
+        self, r, local_state: Reactive[LocalState]
+    ) -> list[StudentMeasurement]:
         measurements = Ref(local_state.fields.measurements)
         if r.status_code == 200:
             measurement_json = r.json()
 
-            parsed_measurements = []
-
-            for measurement in measurement_json["measurements"]:
-                measurement = StudentMeasurement(**measurement)
-                parsed_measurements.append(measurement)
-
+            parsed_measurements = decode_measurements(measurement_json["measurements"])
             measurements.set(parsed_measurements)
+            self.measurement_tracker.mark_loaded(
+                "measurement", local_state.value.story_id, parsed_measurements
+            )
 
         Ref(local_state.fields.measurements_loaded).set(True)
 
@@ -119,33 +385,61 @@ class LocalAPI(BaseAPI):
         self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
     ) -> list[StudentMeasurement]:
         r = self.request_session.get(
+            self._sample_measurements_url(global_state, local_state),
+            headers=BULK_HEADERS,
+        )
+
+        sample_records = self._sample_records(r)
+        sample_gal_data = None
+        if len(sample_records) < 2:
+            sample_gal_data = self.get_sample_galaxy(local_state)
+
+        return self._set_sample_measurements(
+            sample_records, sample_gal_data, global_state, local_state
+        )
+
+    @staticmethod
+    def _sample_records(r) -> list[dict]:
+        # A new list, since missing sample measurements are added to it
+        payload = read_bulk_payload(r.headers, r.content)
+        return list(bulk_records(payload, "measurements"))
+
+    def _sample_measurements_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
+        return (
             f"{self.API_URL}/{local_state.value.story_id}/sample-"
             f"measurements/{global_state.value.student.id}"
         )
 
-        sample_measurement_json = r.json()
+    def _set_sample_measurements(
+        self,
+        sample_records: list[dict],
+        sample_gal_data: GalaxyData | None,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+    ) -> list[StudentMeasurement]:
+        stored_count = len(sample_records)
 
-        if len(sample_measurement_json["measurements"]) == 0:
+        if len(sample_records) == 0:
             logger.info(
                 "Failed to find sample galaxies for user `%s`: creating new "
                 "sample measurement.",
                 global_state.value.student.id,
             )
-            sample_gal_data = LOCAL_API.get_sample_galaxy(local_state)
             for meas in ['first', 'second']:
-                sample_measurement_json["measurements"].append(
+                sample_records.append(
                     StudentMeasurement(
                         student_id=global_state.value.student.id,
                         galaxy=sample_gal_data,
                         measurement_number=meas
                     ).dict()
                 )
-        elif len(sample_measurement_json["measurements"]) == 1:
+        elif len(sample_records) == 1:
             logger.info(
                 "Example measurements only had the first. Creating missing second measurement"
             )
-            sample_gal_data = LOCAL_API.get_sample_galaxy(local_state)
-            sample_measurement_json["measurements"].append(
+            sample_records.append(
                 StudentMeasurement(
                     student_id=global_state.value.student.id,
                     galaxy=sample_gal_data,
@@ -154,13 +448,15 @@ class LocalAPI(BaseAPI):
             )
 
         sample_measurements = Ref(local_state.fields.example_measurements)
-        parsed_sample_measurements = []
-
-        for measurement in sample_measurement_json["measurements"]:
-            measurement = StudentMeasurement(**measurement)
-            parsed_sample_measurements.append(measurement)
-
+        parsed_sample_measurements = decode_measurements(sample_records)
         sample_measurements.set(parsed_sample_measurements)
+        # Only the measurements that came from the database are in sync; any
+        #  newly created ones still need to be submitted
+        self.measurement_tracker.mark_loaded(
+            "sample",
+            local_state.value.story_id,
+            parsed_sample_measurements[:stored_count],
+        )
 
         logger.info("Loaded example measurements from database.")
 
@@ -173,24 +469,22 @@ class LocalAPI(BaseAPI):
         if not GLOBAL_STATE.value.update_db: 
             logger.info('Skipping DB write')
             return False
-        
-        url = f"{self.API_URL}/{local_state.value.story_id}/submit-measurement/"
-
-        for measurement in local_state.value.measurements:
-            r = self.request_session.put(url, json=measurement.dict(exclude={"galaxy"}))
-
-            if r.status_code != 200:
-                logger.warning(
-                    f"Failed to add measurement for galaxy `%s` by student `%s`.",
-                    global_state.value.student.id,
-                    measurement.galaxy_id,
-                )
 
-        logger.info(
-            "Stored measurements for student `%s`.",
-            global_state.value.student.id,
+        story_id = local_state.value.story_id
+        stored = self._submit_measurements(
+            "measurement",
+            f"{self.API_URL}/{story_id}/submit-measurement/",
+            f"{self.API_URL}/{story_id}/submit-measurements/",
+            story_id,
+            local_state.value.measurements,
         )
-        return True
+
+        if stored:
+            logger.info(
+                "Stored measurements for student `%s`.",
+                global_state.value.student.id,
+            )
+        return stored
 
     def put_sample_measurements(
         self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
@@ -198,30 +492,91 @@ class LocalAPI(BaseAPI):
         if not GLOBAL_STATE.value.update_db: 
             logger.info('Skipping DB write')
             return False
-        
-        url = f"{self.API_URL}/{local_state.value.story_id}/sample-measurement/"
-    
-        for i, measurement in enumerate(local_state.value.example_measurements):
-            if i == 0:
-                logger.info(
-                    f"Adding example measurement for galaxy `%s` by student `%s`.",
-                    measurement.galaxy_id,
-                    global_state.value.student.id,
-                )
 
-            r = self.request_session.put(url, json=measurement.dict(exclude={"galaxy"}))
-
-            if r.status_code != 200:
-                logger.warning(
-                    f"Failed to add example measurement for galaxy `%s` by student `%s`.",
-                    measurement.galaxy_id,
-                    global_state.value.student.id,
-                )
+        story_id = local_state.value.story_id
+        stored = self._submit_measurements(
+            "sample",
+            f"{self.API_URL}/{story_id}/sample-measurement/",
+            f"{self.API_URL}/{story_id}/sample-measurements/",
+            story_id,
+            local_state.value.example_measurements,
+        )
 
+        if stored:
             logger.info(
                 "Stored example measurements for student %s.",
                 global_state.value.student.id,
             )
+        return stored
+
+    @cached_property
+    def measurement_tracker(self) -> MeasurementTracker:
+        return MeasurementTracker()
+
+    def _submit_measurements(
+        self,
+        kind: str,
+        url: str,
+        batch_url: str,
+        story_id: str,
+        measurements: list[StudentMeasurement],
+    ) -> bool:
+        """
+        Submit the measurements that changed since their last successful
+        write. All changed rows are sent in a single request when the backend
+        supports it; otherwise each row is sent on its own.
+        """
+        dirty = self.measurement_tracker.dirty(kind, story_id, measurements)
+        if not dirty:
+            return True
+
+        if self.batch_measurements_supported:
+            r = self.request_session.put(batch_url, json=self._batch_payload(dirty))
+            if self._handle_batch_response(r, kind, dirty):
+                return True
+
+        stored = True
+        for key, payload in dirty:
+            r = self.request_session.put(url, json=payload)
+            stored = self._handle_row_response(r, kind, key, payload) and stored
+
+        return stored
+
+    @staticmethod
+    def _batch_payload(dirty: list[tuple[tuple, dict]]) -> dict:
+        return {"measurements": [payload for _, payload in dirty]}
+
+    def _handle_batch_response(
+        self, r, kind: str, dirty: list[tuple[tuple, dict]]
+    ) -> bool:
+        if r.status_code == 200:
+            self.measurement_tracker.mark_clean(dirty)
+            return True
+        elif r.status_code in BATCH_UNSUPPORTED_STATUS:
+            logger.info(
+                "Batched measurement submission is not supported by the "
+                "backend; submitting measurements individually."
+            )
+            self.batch_measurements_supported = False
+        else:
+            logger.warning(
+                "Batched submission of %d %s(s) failed; retrying individually.",
+                len(dirty),
+                kind,
+            )
+        return False
+
+    def _handle_row_response(self, r, kind: str, key: tuple, payload: dict) -> bool:
+        if r.status_code != 200:
+            logger.warning(
+                "Failed to add %s for galaxy `%s` by student `%s`.",
+                kind,
+                payload["galaxy_id"],
+                payload["student_id"],
+            )
+            return False
+
+        self.measurement_tracker.mark_clean([(key, payload)])
         return True
 
     def get_measurement(
@@ -291,35 +646,106 @@ class LocalAPI(BaseAPI):
                 logger.error(r.text)
 
     def get_sample_galaxy(self, local_state: Reactive[LocalState]) -> GalaxyData:
-        galaxy_json = self.request_session.get(
-            f"{self.API_URL}/{local_state.value.story_id}/sample-galaxy"
-        ).json()
+        # The sample galaxy is the same for every student
+        galaxy_json = self._get_shared_json(
+            self._sample_galaxy_url(local_state), SEED_DATA_TTL
+        )
 
         galaxy_data = GalaxyData(**galaxy_json)
 
         return galaxy_data
 
+    def _sample_galaxy_url(self, local_state: Reactive[LocalState]) -> str:
+        return f"{self.API_URL}/{local_state.value.story_id}/sample-galaxy"
+
+    @cached_property
+    def request_coalescer(self) -> SingleFlight:
+        return SingleFlight()
+
+    @cached_property
+    def last_good(self) -> LastGood:
+        # Small shared JSON reads fall back to their last result while the
+        #  backend fails. Bulk reads are too large to keep around for that.
+        return LastGood()
+
+    def _get_shared_json(self, url: str, ttl: float = 0) -> Any:
+        """
+        GET `url` and return the parsed JSON body, sharing a single request
+        between all concurrent callers asking for the same URL. The result is
+        shared, so callers must not modify it.
+        """
+
+        def _fetch():
+            r = self.request_session.get(url)
+            r.raise_for_status()
+            return r.json()
+
+        return self.request_coalescer.do(url, self.last_good.wrap(url, _fetch), ttl)
+
+    def _get_shared_bulk(
+        self,
+        url: str,
+        decode: Callable[[Any], T],
+        ttl: float = 0,
+        key: Hashable | None = None,
+    ) -> T:
+        """
+        GET a bulk read endpoint, preferring the binary transport, and
+        return the response decoded by `decode`, which is given either the
+        parsed JSON or an `ArrowPayload`. Like `_get_shared_json`, the request
+        and the decoded result are shared between callers: those asking for
+        the same `key` (by default, the URL).
+        """
+
+        def _fetch():
+            r = self.request_session.get(url, headers=BULK_HEADERS)
+            r.raise_for_status()
+            return decode(read_bulk_payload(r.headers, r.content))
+
+        return self.request_coalescer.do(url if key is None else key, _fetch, ttl)
+
     def get_class_measurements(
         self,
         global_state: Reactive[GlobalState],
         local_state: Reactive[LocalState],
-    ) -> list[StudentMeasurement]:
-        url = (
+    ) -> MeasurementTable:
+        measurements = self._get_shared_bulk(
+            self._class_measurements_url(global_state, local_state),
+            bulk_measurements,
+            CLASS_DATA_TTL,
+            key=self._class_measurements_key(global_state, local_state),
+        )
+
+        return self._set_class_measurements(measurements, local_state)
+
+    def _class_measurements_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
+        return (
             f"{self.API_URL}/{local_state.value.story_id}/class-measurements/"
             f"{global_state.value.student.id}/{global_state.value.classroom.class_info['id']}"
             f"?complete_only=true"
         )
-        r = self.request_session.get(url)
-        measurement_json = r.json()
 
-        measurements = Ref(local_state.fields.class_measurements)
-        parsed_measurements = []
-
-        for measurement in measurement_json["measurements"]:
-            measurement = StudentMeasurement(**measurement)
-            parsed_measurements.append(measurement)
+    @staticmethod
+    def _class_measurements_key(
+        global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> tuple:
+        # The URL names the requesting student, but the response is the
+        #  complete measurements of the whole class, so every student in the
+        #  class shares one request
+        return (
+            "class-measurements",
+            local_state.value.story_id,
+            global_state.value.classroom.class_info["id"],
+            True,
+        )
 
-        measurements.set(parsed_measurements)
+    def _set_class_measurements(
+        self, class_measurements: MeasurementTable, local_state: Reactive[LocalState]
+    ) -> MeasurementTable:
+        measurements = Ref(local_state.fields.class_measurements)
+        measurements.set(class_measurements)
 
         logger.info("Loaded class measurements from database.")
 
@@ -329,38 +755,66 @@ class LocalAPI(BaseAPI):
         self,
         global_state: Reactive[GlobalState],
         local_state: Reactive[LocalState],
-    ) -> tuple[list[StudentMeasurement], list[StudentSummary], list[ClassSummary]]:
+    ) -> AllData:
+        url = self._all_data_url(global_state, local_state)
+        if STREAM_ALL_DATA:
+            all_data = self._get_shared_all_data(url, CLASS_DATA_TTL)
+        else:
+            all_data = self._get_shared_bulk(url, self._decode_all_data, CLASS_DATA_TTL)
+
+        return self._set_all_data(all_data, local_state)
+
+    def _get_shared_all_data(self, url: str, ttl: float = 0) -> AllData:
+        """
+        GET the all-data `url` and decode the response while it streams in,
+        sharing the request like `_get_shared_json` does.
+        """
+
+        def _fetch():
+            reader = AllDataReader()
+            with self.request_session.get(url, headers=BULK_HEADERS, stream=True) as r:
+                r.raise_for_status()
+                if is_arrow(r.headers):
+                    payload = read_bulk_payload(r.headers, r.content)
+                    return self._decode_all_data(payload)
+                for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                    reader.feed(chunk)
+            return reader.finish()
+
+        return self.request_coalescer.do(("stream", url), _fetch, ttl)
+
+    def _all_data_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
         url = f"{self.API_URL}/{local_state.value.story_id}/all-data?minimal=True"
         if global_state.value.classroom.class_info is not None:
             url += f"&class_id={global_state.value.classroom.class_info['id']}"
-        r = self.request_session.get(url)
-        res_json = r.json()
+        return url
+
+    @staticmethod
+    def _decode_all_data(payload) -> AllData:
+        all_measurements = bulk_measurements(payload)
+        return (
+            all_measurements.take(~isnan(all_measurements.column("class_id"))),
+            decode_student_summaries(bulk_records(payload, "studentData")),
+            decode_class_summaries(bulk_records(payload, "classData")),
+        )
 
-        measurements = Ref(local_state.fields.all_measurements)
-        parsed_measurements = []
-        for measurement in res_json["measurements"]:
-            if measurement["class_id"] is None:
-                continue
-            measurement = StudentMeasurement(**measurement)
-            parsed_measurements.append(measurement)
+    def _set_all_data(
+        self, all_data: AllData, local_state: Reactive[LocalState]
+    ) -> AllData:
+        all_measurements, all_student_summaries, all_class_summaries = all_data
 
-        measurements.set(parsed_measurements)
+        measurements = Ref(local_state.fields.all_measurements)
+        measurements.set(all_measurements)
 
+        # The decoded data may be shared with other sessions, so each session
+        #  gets its own summary lists
         student_summaries = Ref(local_state.fields.student_summaries)
-        parsed_student_summaries = []
-        for summary in res_json["studentData"]:
-            summary = StudentSummary(**summary)
-            parsed_student_summaries.append(summary)
-
-        student_summaries.set(parsed_student_summaries)
+        student_summaries.set(list(all_student_summaries))
 
         class_summaries = Ref(local_state.fields.class_summaries)
-        parsed_class_summaries = []
-        for summary in res_json["classData"]:
-            summary = ClassSummary(**summary)
-            parsed_class_summaries.append(summary)
-
-        class_summaries.set(parsed_class_summaries)
+        class_summaries.set(list(all_class_summaries))
 
         logger.info("Loaded all measurements and summary data from database.")
 
@@ -378,24 +832,74 @@ class LocalAPI(BaseAPI):
         
         logger.info("Serializing stage state into DB.")
 
+        r = self.request_session.put(
+            self._stage_state_url(global_state, local_state, component_state),
+            json=self._stage_state_payload(component_state),
+        )
+
+        return self._handle_write_response(r, "stage state")
+
+    def _stage_state_url(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        component_state: Reactive[BaseState],
+    ) -> str:
+        return (
+            f"{self.API_URL}/stage-state/{global_state.value.student.id}/"
+            f"{local_state.value.story_id}/{component_state.value.stage_id}"
+        )
+
+    def _stage_states_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
+        return (
+            f"{self.API_URL}/stage-states/{global_state.value.student.id}/"
+            f"{local_state.value.story_id}"
+        )
+
+    def _handle_stage_states_response(self, r) -> dict[str, dict] | None:
+        """
+        Parse the response of the batched stage state route, which maps each
+        stage id to its stored state. Returns None if the states could not be
+        loaded, in which case stages load their own state individually.
+        """
+        if r.status_code in BATCH_UNSUPPORTED_STATUS:
+            logger.info(
+                "Batched stage state loading is not supported by the backend; "
+                "loading stage states individually."
+            )
+            self.batch_stage_states_supported = False
+            return None
+        elif r.status_code != 200:
+            logger.error("Failed to load stage states (status %d).", r.status_code)
+            return None
+
+        return r.json().get("states", {})
+
+    @staticmethod
+    def _set_stage_state(stage_json: dict, component_state: Reactive[BaseState]):
+        component_state.set(component_state.value.__class__(**stage_json))
+        logger.info("Updated component state from database.")
+        return component_state.value
+
+    @staticmethod
+    def _stage_state_payload(component_state: Reactive[BaseState]) -> dict:
         comp_state_dict = component_state.value.dict(
             exclude={"selected_galaxy", "selected_example_galaxy"}
         )
         comp_state_dict.update(
             {"current_step": component_state.value.current_step.value}
         )
+        return comp_state_dict
 
-        r = self.request_session.put(
-            f"{self.API_URL}/stage-state/{global_state.value.student.id}/"
-            f"{local_state.value.story_id}/{component_state.value.stage_id}",
-            json=comp_state_dict,
-        )
-
+    @staticmethod
+    def _handle_write_response(r, description: str) -> bool:
         if r.status_code != 200:
-            logger.error("Failed to write story state to database.")
+            logger.error("Failed to write %s to database.", description)
             logger.error(r.text)
             return False
-        
+
         return True
 
     def put_story_state(
@@ -409,24 +913,108 @@ class LocalAPI(BaseAPI):
         
         logger.info("Serializing state into DB.")
 
+        url = self._story_state_url(global_state, local_state)
+        key, state, state_json = self._story_state(global_state, local_state)
+
+        patch = self._story_state_patch(key, state)
+        if patch is not None:
+            etag, operations = patch
+            if not operations:
+                return True
+
+            r = self.request_session.patch(
+                url,
+                headers={
+                    "Content-Type": "application/json-patch+json",
+                    "If-Match": etag,
+                },
+                data=json.dumps(operations),
+            )
+            if self._handle_patch_response(r, key, state):
+                return True
+
+        r = self.request_session.put(
+            url,
+            headers={"Content-Type": "application/json"},
+            data=state_json,
+        )
+
+        return self._handle_story_state_response(r, key, state)
+
+    def _story_state_url(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> str:
+        return (
+            f"{self.API_URL}/story-state/{global_state.value.student.id}/"
+            f"{local_state.value.story_id}"
+        )
+
+    @cached_property
+    def story_state_tracker(self) -> StoryStateTracker:
+        return StoryStateTracker()
+
+    @staticmethod
+    def _story_state(
+        global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ) -> tuple[tuple, dict, str]:
         state = {
             "app": global_state.value.model_dump(),
             "story": local_state.value.as_dict(),
         }
 
+        # Round-trip through the encoder so that the snapshot we diff against
+        #  holds exactly what the backend received
         state_json = json.dumps(state, cls=CDSJSONEncoder)
-        r = self.request_session.put(
-            f"{self.API_URL}/story-state/{global_state.value.student.id}/{local_state.value.story_id}",
-            headers={"Content-Type": "application/json"},
-            data=state_json,
-        )
+        key = (global_state.value.student.id, local_state.value.story_id)
+
+        return key, json.loads(state_json), state_json
+
+    def _story_state_patch(self, key: tuple, state: dict) -> tuple[str, list] | None:
+        if not self.story_state_patch_supported:
+            return None
+
+        base = self.story_state_tracker.get(key)
+        if base is None:
+            return None
+
+        etag, base_state = base
+        patch = make_patch(base_state, state)
+        # Only send a patch that is known to reproduce the state; otherwise
+        #  the full state is uploaded
+        if apply_patch(base_state, patch) != state:
+            logger.warning(
+                "Story state patch does not reproduce the state; "
+                "uploading full state."
+            )
+            return None
+        return etag, patch
 
-        if r.status_code != 200:
-            logger.error("Failed to write story state to database.")
-            logger.error(r.text)
-            return False
-        
-        return True
+    def _handle_patch_response(self, r, key: tuple, state: dict) -> bool:
+        if r.status_code == 200:
+            self.story_state_tracker.acknowledge(
+                key, state, r.headers.get("ETag")
+            )
+            return True
+        elif r.status_code in PATCH_UNSUPPORTED_STATUS:
+            logger.info(
+                "Story state patches are not supported by the backend; "
+                "uploading full story states."
+            )
+            self.story_state_patch_supported = False
+        else:
+            logger.info(
+                "Story state patch was rejected (status %d); uploading full state.",
+                r.status_code,
+            )
+        return False
+
+    def _handle_story_state_response(self, r, key: tuple, state: dict) -> bool:
+        stored = self._handle_write_response(r, "story state")
+        if stored:
+            self.story_state_tracker.acknowledge(
+                key, state, r.headers.get("ETag")
+            )
+        return stored
 
 
     def get_example_seed_measurement(
@@ -435,33 +1023,805 @@ class LocalAPI(BaseAPI):
             which="both"
             ) -> list[dict[str, Any]]:
         url = f"{self.API_URL}/{local_state.value.story_id}/sample-measurements"
-        r = self.request_session.get(url)
-        res_json = r.json()
-        
-        
-        # TODO: Note that though this is from the old code
-        # it seems to only pick the 2nd measurement
-        vels = [record[DB_VELOCITY_FIELD] for record in res_json]
-        good = [(vel is not None and vel > 0) for vel in vels]
-        seq = SeedSequence(42)
-        gen = Generator(PCG64(seq))
-        indices = arange(len(good))
-        indices = indices[1::2][:85] # we need to keep the first 85 so that it always selects the same galaxies "randomly"
-        random_subset = gen.choice(indices[good[1::2][:85]], size=40, replace=False)
-        random_subset = ravel(column_stack((random_subset, random_subset+1)))
-        # This is the subset
-        # [121 122  13  14 159 160  23  24 161 162 137 138 111 112 155 156  69  70
-        #     75  76  81  82  11  12 129 130  93  94  99 100  17  18  37  38 169 170
-        #     67  68 107 108 119 120  65  66  45  46 141 142  73  74 165 166  85  86
-        #     59  60  87  88  27  28 109 110  51  52  47  48  97  98  89  90  63  64
-        #     91  92 143 144 149 150 103 104]
-        measurements = []
-
-        _filter_func = lambda x: res_json[x]['measurement_number'] == which
-        filtered = filter(_filter_func, random_subset) if which != 'both' else random_subset
-        for i in filtered:
-            measurements.append(res_json[i])
+        res_json = self._get_shared_json(url, SEED_DATA_TTL)
+
+        measurements = [res_json[i] for i in select_seed_indices(res_json)]
+        if which != "both":
+            measurements = [m for m in measurements if m["measurement_number"] == which]
 
         return measurements
 
+    def get_example_seed_data(self, local_state: Reactive[LocalState]) -> SeedData:
+        """
+        The example seed measurements as columns. They are selected and
+        converted once per story, and shared by every session. After a
+        restart they are rebuilt from the seed response stored by the HTTP
+        cache (see `http_cache.DEFAULT_POLICIES`).
+        """
+        story_id = local_state.value.story_id
+        return self.request_coalescer.do(
+            ("seed-data", story_id),
+            lambda: SeedData.from_records(
+                self.get_example_seed_measurement(local_state)
+            ),
+            inf,
+        )
+
 LOCAL_API = LocalAPI()
+
+class AsyncLocalAPI:
+    """
+    Asynchronous counterpart to `LocalAPI`, intended to be awaited from page
+    tasks. Requests go through a single pooled `httpx.AsyncClient` that lives
+    on a dedicated background event loop, so connections are reused no matter
+    which task (or task thread) issues the call, and a slow backend response
+    only suspends the task that is waiting on it. Request building and
+    response handling are shared with the wrapped `LocalAPI`.
+
+    Every method accepts an optional `timeout` (seconds or `httpx.Timeout`)
+    that overrides the client default for that call.
+
+    Writes that fail because the backend is unavailable are recorded in
+    `journal` and replayed in the background once it recovers, instead of
+    being retried by the page tasks.
+    """
+
+    def __init__(
+        self,
+        api: LocalAPI,
+        timeout: httpx.Timeout = ASYNC_TIMEOUT,
+        limits: httpx.Limits = ASYNC_LIMITS,
+        journal: WriteJournal = WRITE_JOURNAL,
+    ):
+        self.api = api
+        self.timeout = timeout
+        self.limits = limits
+        self.journal = journal
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._replay: concurrent.futures.Future | None = None
+        self._catalog_refreshes: dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.spectrum_prefetcher = SpectrumPrefetcher(self._get_loop)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="hubbleds-async-api",
+                    daemon=True,
+                ).start()
+            return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Only ever called on the background loop, which owns the client
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=dict(self.api.request_session.headers),
+                timeout=self.timeout,
+                transport=AsyncCachingTransport(
+                    HTTP_CACHE,
+                    AsyncResilientTransport(
+                        httpx.AsyncHTTPTransport(limits=self.limits)
+                    ),
+                ),
+            )
+            # Picks up writes journaled before a restart
+            self._ensure_replay()
+        return self._client
+
+    async def _client_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._get_client().request(method, url, **kwargs)
+
+    async def _client_read_all_data(self, url: str, **kwargs) -> AllData:
+        reader = AllDataReader()
+        client = self._get_client()
+        async with client.stream("GET", url, headers=BULK_HEADERS, **kwargs) as r:
+            r.raise_for_status()
+            if is_arrow(r.headers):
+                body = await r.aread()
+                return self.api._decode_all_data(read_bulk_payload(r.headers, body))
+            async for chunk in r.aiter_bytes(STREAM_CHUNK_SIZE):
+                reader.feed(chunk)
+        return reader.finish()
+
+    async def _request(
+        self, method: str, url: str, timeout=None, **kwargs
+    ) -> httpx.Response:
+        future = asyncio.run_coroutine_threadsafe(
+            self._client_request(
+                method,
+                url,
+                timeout=self.timeout if timeout is None else timeout,
+                **kwargs,
+            ),
+            self._get_loop(),
+        )
+        return await asyncio.wrap_future(future)
+
+    async def aclose(self):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.cancel()
+                self._replay = None
+
+        if self._client is None or self._loop is None:
+            return
+
+        future = asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop)
+        await asyncio.wrap_future(future)
+        self._client = None
+
+    async def _get_shared_json(self, url: str, ttl: float = 0, timeout=None) -> Any:
+        # Shares in-flight requests (and results) with `LocalAPI._get_shared_json`
+
+        async def _fetch():
+            r = await self._request("GET", url, timeout=timeout)
+            r.raise_for_status()
+            return r.json()
+
+        return await self.api.request_coalescer.ado(
+            url, self.api.last_good.awrap(url, _fetch), ttl
+        )
+
+    async def _get_shared_bulk(
+        self,
+        url: str,
+        decode: Callable[[Any], T],
+        ttl: float = 0,
+        timeout=None,
+        key: Hashable | None = None,
+    ) -> T:
+        # Shares in-flight requests (and results) with `LocalAPI._get_shared_bulk`
+
+        async def _fetch():
+            r = await self._request("GET", url, timeout=timeout, headers=BULK_HEADERS)
+            r.raise_for_status()
+            return decode(read_bulk_payload(r.headers, r.content))
+
+        key = url if key is None else key
+        return await self.api.request_coalescer.ado(key, _fetch, ttl)
+
+    async def _get_shared_all_data(
+        self, url: str, ttl: float = 0, timeout=None
+    ) -> AllData:
+        # Shares in-flight requests (and results) with `LocalAPI._get_shared_all_data`
+
+        async def _fetch():
+            future = asyncio.run_coroutine_threadsafe(
+                self._client_read_all_data(
+                    url, timeout=self.timeout if timeout is None else timeout
+                ),
+                self._get_loop(),
+            )
+            return await asyncio.wrap_future(future)
+
+        return await self.api.request_coalescer.ado(("stream", url), _fetch, ttl)
+
+    async def _in_thread(self, func, *args):
+        # The story and stage state loaders live in `cosmicds` and use the
+        #  blocking session. Run them on a worker thread inside the current
+        #  kernel context so that they can still update reactive state.
+        context = kernel_context.get_current_context()
+
+        def _run():
+            with context:
+                return func(*args)
+
+        return await asyncio.to_thread(_run)
+
+    async def get_app_story_states(
+        self, global_state: Reactive[GlobalState], local_state: Reactive[LocalState]
+    ):
+        return await self._in_thread(
+            self.api.get_app_story_states, global_state, local_state
+        )
+
+    async def get_stage_state(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        component_state: Reactive[BaseState],
+    ):
+        return await self._in_thread(
+            self.api.get_stage_state, global_state, local_state, component_state
+        )
+
+    async def get_galaxies(
+        self, local_state: Reactive[LocalState], timeout=None
+    ) -> list[GalaxyData]:
+        catalog = await self.get_galaxy_catalog(local_state, timeout)
+        return catalog.galaxies()
+
+    async def get_galaxy_catalog(
+        self, local_state: Reactive[LocalState], timeout=None
+    ) -> GalaxyCatalog:
+        story_id = local_state.value.story_id
+        catalog = GALAXY_CATALOGS.get(story_id)
+        if catalog is not None and GALAXY_CATALOGS.is_fresh(story_id):
+            return catalog
+
+        r = await self._request(
+            "GET",
+            self.api._galaxies_url(story_id),
+            headers=GALAXY_CATALOGS.validators(story_id),
+            timeout=timeout,
+        )
+
+        return self.api._set_galaxy_catalog(r, story_id)
+
+    def refresh_galaxy_catalog(self, story_id: str) -> concurrent.futures.Future:
+        """
+        Revalidate the galaxy catalog of `story_id` on the background loop,
+        without waiting for it. Sessions keep being served the loaded
+        catalog meanwhile. Only one refresh per story runs at a time.
+        """
+        loop = self._get_loop()
+        with self._lock:
+            future = self._catalog_refreshes.get(story_id)
+            if future is None or future.done():
+                future = asyncio.run_coroutine_threadsafe(
+                    self._refresh_galaxy_catalog(story_id), loop
+                )
+                self._catalog_refreshes[story_id] = future
+            return future
+
+    async def _refresh_galaxy_catalog(self, story_id: str):
+        try:
+            r = await self._client_request(
+                "GET",
+                self.api._galaxies_url(story_id),
+                headers=GALAXY_CATALOGS.validators(story_id),
+            )
+            self.api._set_galaxy_catalog(r, story_id)
+        except Exception as e:
+            logger.warning("Failed to refresh galaxy catalog for `%s`: %s", story_id, e)
+
+    async def load_spectrum_data(
+        self, gal_data: GalaxyData, local_state: Reactive[LocalState], timeout=None
+    ) -> SpectrumData | None:
+        spec_data = self.api._stored_spectrum(gal_data, local_state.value.story_id)
+        if spec_data is not None:
+            return spec_data
+
+        return await self._fetch_spectrum(
+            gal_data,
+            local_state.value.story_id,
+            self.api._spectrum_url(gal_data, local_state),
+            timeout,
+        )
+
+    async def _fetch_spectrum(
+        self, gal_data: GalaxyData, story_id: str, url: str, timeout=None
+    ) -> SpectrumData | None:
+        async def _fetch():
+            response = await self._request("GET", url, timeout=timeout)
+            return self.api._set_spectrum_data(
+                await decode_spectrum_async(response.content),
+                gal_data,
+                spectrum_key(story_id, gal_data.name),
+            )
+
+        # Joins a prefetch of the same spectrum if one is in progress
+        return await self.api.request_coalescer.ado(url, _fetch)
+
+    def prefetch_spectra(
+        self, galaxies: list[GalaxyData], local_state: Reactive[LocalState]
+    ):
+        """
+        Start fetching the spectra of `galaxies` in the background, so that
+        they are already in the spectrum cache when they are displayed.
+        Spectra that are already stored are skipped.
+        """
+        story_id = local_state.value.story_id
+        for gal_data in galaxies:
+            if gal_data is None or self.api._has_stored_spectrum(gal_data, story_id):
+                continue
+            url = self.api._spectrum_url(gal_data, local_state)
+            self.spectrum_prefetcher.submit(
+                url,
+                lambda gal_data=gal_data, url=url: self._fetch_spectrum(
+                    gal_data, story_id, url
+                ),
+            )
+
+    async def get_measurements(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> list[StudentMeasurement]:
+        r = await self._request(
+            "GET",
+            self.api._measurements_url(global_state, local_state),
+            timeout=timeout,
+        )
+
+        return self.api._set_measurements(r, local_state)
+
+    async def get_sample_galaxy(
+        self, local_state: Reactive[LocalState], timeout=None
+    ) -> GalaxyData:
+        # The sample galaxy is the same for every student
+        galaxy_json = await self._get_shared_json(
+            self.api._sample_galaxy_url(local_state), SEED_DATA_TTL, timeout=timeout
+        )
+
+        return GalaxyData(**galaxy_json)
+
+    async def get_sample_measurements(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> list[StudentMeasurement]:
+        r = await self._request(
+            "GET",
+            self.api._sample_measurements_url(global_state, local_state),
+            timeout=timeout,
+            headers=BULK_HEADERS,
+        )
+
+        sample_records = self.api._sample_records(r)
+        sample_gal_data = None
+        if len(sample_records) < 2:
+            sample_gal_data = await self.get_sample_galaxy(local_state, timeout)
+
+        return self.api._set_sample_measurements(
+            sample_records, sample_gal_data, global_state, local_state
+        )
+
+    async def get_stage_states(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> dict[str, dict] | None:
+        if not self.api.batch_stage_states_supported:
+            return None
+
+        r = await self._request(
+            "GET",
+            self.api._stage_states_url(global_state, local_state),
+            timeout=timeout,
+        )
+
+        return self.api._handle_stage_states_response(r)
+
+    async def hydrate_session(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> dict[str, dict] | None:
+        """
+        Load everything a session needs at login, with all requests in flight
+        at once: the story states, the student's measurements and sample
+        measurements, the sample galaxy and the stored state of every stage.
+
+        Loading the story state replaces the local state, so the measurements
+        are only applied once it has finished.
+
+        Returns
+        ----------
+        stage_states: dict[str, dict] | None
+            Stored stage states keyed by stage id, or None if they could not
+            be loaded in one request
+        """
+        (
+            _, measurements_r, samples_r, sample_gal_data, stage_states
+        ) = await asyncio.gather(
+            self.get_app_story_states(global_state, local_state),
+            self._request(
+                "GET",
+                self.api._measurements_url(global_state, local_state),
+                timeout=timeout,
+            ),
+            self._request(
+                "GET",
+                self.api._sample_measurements_url(global_state, local_state),
+                timeout=timeout,
+                headers=BULK_HEADERS,
+            ),
+            self.get_sample_galaxy(local_state, timeout),
+            self.get_stage_states(global_state, local_state, timeout),
+        )
+
+        self.api._set_measurements(measurements_r, local_state)
+        self.api._set_sample_measurements(
+            self.api._sample_records(samples_r),
+            sample_gal_data,
+            global_state,
+            local_state,
+        )
+
+        return stage_states
+
+    async def get_class_measurements(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> MeasurementTable:
+        measurements = await self._get_shared_bulk(
+            self.api._class_measurements_url(global_state, local_state),
+            bulk_measurements,
+            CLASS_DATA_TTL,
+            timeout=timeout,
+            key=self.api._class_measurements_key(global_state, local_state),
+        )
+
+        return self.api._set_class_measurements(measurements, local_state)
+
+    async def get_all_data(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ) -> AllData:
+        url = self.api._all_data_url(global_state, local_state)
+        if STREAM_ALL_DATA:
+            all_data = await self._get_shared_all_data(
+                url, CLASS_DATA_TTL, timeout=timeout
+            )
+        else:
+            all_data = await self._get_shared_bulk(
+                url, self.api._decode_all_data, CLASS_DATA_TTL, timeout=timeout
+            )
+
+        return self.api._set_all_data(all_data, local_state)
+
+    async def put_measurements(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ):
+        if not GLOBAL_STATE.value.update_db:
+            logger.info('Skipping DB write')
+            return False
+
+        story_id = local_state.value.story_id
+        stored = await self._submit_measurements(
+            "measurement",
+            f"{self.api.API_URL}/{story_id}/submit-measurement/",
+            f"{self.api.API_URL}/{story_id}/submit-measurements/",
+            story_id,
+            local_state.value.measurements,
+            timeout,
+        )
+
+        if stored:
+            logger.info(
+                "Stored measurements for student `%s`.",
+                global_state.value.student.id,
+            )
+        return stored
+
+    async def put_sample_measurements(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ):
+        if not GLOBAL_STATE.value.update_db:
+            logger.info('Skipping DB write')
+            return False
+
+        story_id = local_state.value.story_id
+        stored = await self._submit_measurements(
+            "sample",
+            f"{self.api.API_URL}/{story_id}/sample-measurement/",
+            f"{self.api.API_URL}/{story_id}/sample-measurements/",
+            story_id,
+            local_state.value.example_measurements,
+            timeout,
+        )
+
+        if stored:
+            logger.info(
+                "Stored example measurements for student %s.",
+                global_state.value.student.id,
+            )
+        return stored
+
+    async def _submit_measurements(
+        self,
+        kind: str,
+        url: str,
+        batch_url: str,
+        story_id: str,
+        measurements: list[StudentMeasurement],
+        timeout=None,
+    ) -> bool:
+        api = self.api
+        dirty = api.measurement_tracker.dirty(kind, story_id, measurements)
+        if not dirty:
+            return True
+
+        try:
+            stored = await self._send_measurements(kind, url, batch_url, dirty, timeout)
+        except Exception as e:
+            if not is_backend_failure(e):
+                raise
+            logger.warning("Could not submit %d %s(s): %s", len(dirty), kind, e)
+            stored = False
+
+        # Rows that are still dirty were not stored, and are journaled
+        remaining = set()
+        if not stored:
+            remaining = {
+                key
+                for key, _ in api.measurement_tracker.dirty(
+                    kind, story_id, measurements
+                )
+            }
+        for key, payload in dirty:
+            self._settle_write(
+                json.dumps(key),
+                key not in remaining,
+                kind,
+                url,
+                json.dumps(payload),
+                {"tracker_key": key, "batch_url": batch_url},
+            )
+
+        return stored
+
+    async def _send_measurements(
+        self,
+        kind: str,
+        url: str,
+        batch_url: str,
+        dirty: list[tuple[tuple, dict]],
+        timeout=None,
+    ) -> bool:
+        api = self.api
+        if api.batch_measurements_supported:
+            r = await self._request(
+                "PUT",
+                batch_url,
+                json=api._batch_payload(dirty),
+                timeout=timeout,
+            )
+            if api._handle_batch_response(r, kind, dirty):
+                return True
+
+        stored = True
+        for key, payload in dirty:
+            r = await self._request("PUT", url, json=payload, timeout=timeout)
+            stored = api._handle_row_response(r, kind, key, payload) and stored
+
+        return stored
+
+    async def put_stage_state(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        component_state: Reactive[BaseState],
+        timeout=None,
+    ):
+        if not GLOBAL_STATE.value.update_db:
+            logger.info('Skipping DB write')
+            return False
+
+        logger.info("Serializing stage state into DB.")
+
+        url = self.api._stage_state_url(global_state, local_state, component_state)
+        payload = self.api._stage_state_payload(component_state)
+        try:
+            r = await self._request("PUT", url, json=payload, timeout=timeout)
+            stored = self.api._handle_write_response(r, "stage state")
+        except Exception as e:
+            if not is_backend_failure(e):
+                raise
+            logger.warning("Could not write stage state: %s", e)
+            stored = False
+
+        self._settle_write(
+            f"stage-state {url}", stored, "stage-state", url, json.dumps(payload)
+        )
+        return stored
+
+    async def put_story_state(
+        self,
+        global_state: Reactive[GlobalState],
+        local_state: Reactive[LocalState],
+        timeout=None,
+    ):
+        if not GLOBAL_STATE.value.update_db:
+            logger.info('Skipping DB write')
+            return False
+
+        logger.info("Serializing state into DB.")
+
+        url = self.api._story_state_url(global_state, local_state)
+        key, state, state_json = self.api._story_state(global_state, local_state)
+        try:
+            stored = await self._send_story_state(url, key, state, state_json, timeout)
+        except Exception as e:
+            if not is_backend_failure(e):
+                raise
+            logger.warning("Could not write story state: %s", e)
+            stored = False
+
+        # A journaled story state is always replayed in full, since the
+        #  acknowledged state a patch is based on may have changed by then
+        self._settle_write(
+            f"story-state {url}", stored, "story-state", url, state_json,
+            {"tracker_key": key},
+        )
+        return stored
+
+    async def _send_story_state(
+        self, url: str, key: tuple, state: dict, state_json: str, timeout=None
+    ) -> bool:
+        api = self.api
+        patch = api._story_state_patch(key, state)
+        if patch is not None:
+            etag, operations = patch
+            if not operations:
+                return True
+
+            r = await self._request(
+                "PATCH",
+                url,
+                headers={
+                    "Content-Type": "application/json-patch+json",
+                    "If-Match": etag,
+                },
+                content=json.dumps(operations),
+                timeout=timeout,
+            )
+            if api._handle_patch_response(r, key, state):
+                return True
+
+        r = await self._request(
+            "PUT",
+            url,
+            headers={"Content-Type": "application/json"},
+            content=state_json,
+            timeout=timeout,
+        )
+
+        return api._handle_story_state_response(r, key, state)
+
+    def _settle_write(
+        self,
+        journal_key: str,
+        stored: bool,
+        kind: str,
+        url: str,
+        body: str,
+        context: Any = None,
+    ):
+        # A stored write supersedes any journaled write of the same record
+        if stored:
+            self.journal.discard([journal_key])
+            return
+
+        logger.warning("Journaling `%s` write for replay.", journal_key)
+        self.journal.record(journal_key, kind, "PUT", url, body, context)
+        self._ensure_replay()
+
+    def _ensure_replay(self):
+        # Replays run on the background loop, one at a time, until the
+        #  journal is empty
+        loop = self._get_loop()
+        with self._lock:
+            if self._replay is None:
+                self._replay = asyncio.run_coroutine_threadsafe(
+                    self._replay_journal(), loop
+                )
+
+    async def _replay_journal(self):
+        delay = REPLAY_INTERVAL
+        while True:
+            with self._lock:
+                if not self.journal.pending_count():
+                    self._replay = None
+                    return
+
+            await asyncio.sleep(delay)
+            if BACKEND_BREAKER.state == CircuitBreaker.OPEN:
+                continue
+
+            try:
+                replayed = await self.replay_journal()
+            except Exception as e:
+                logger.warning("Replaying journaled writes failed: %s", e)
+                replayed = False
+            delay = REPLAY_INTERVAL if replayed else min(2 * delay, REPLAY_INTERVAL_MAX)
+
+    async def replay_journal(self) -> bool:
+        """
+        Replay the oldest journaled writes. Must be called on the background
+        loop. Measurement rows bound for the same batched route are sent in
+        a single request.
+
+        Returns
+        -------
+        bool
+            Whether the backend took every replayed write. Writes it rejected
+            outright (4xx) are dropped; replaying stops at the first server
+            error and resumes later. If the batched route is not supported,
+            the rows are replayed one at a time instead. Entries superseded
+            by a newer successful write while replaying are not sent.
+        """
+        api = self.api
+        entries = self.journal.pending(REPLAY_BATCH_SIZE)
+
+        batches: dict[tuple[str, str], list[JournalEntry]] = {}
+        singles: list[JournalEntry] = []
+        for entry in entries:
+            batch_url = (entry.context or {}).get("batch_url")
+            if batch_url and api.batch_measurements_supported:
+                batches.setdefault((entry.kind, batch_url), []).append(entry)
+            else:
+                singles.append(entry)
+
+        for (kind, batch_url), batch in batches.items():
+            # A newer write that reached the backend since the entries were
+            #  read must not be overwritten with their older bodies
+            batch = self.journal.current(batch)
+            if not batch:
+                continue
+            dirty = [
+                (tuple(entry.context["tracker_key"]), json.loads(entry.body))
+                for entry in batch
+            ]
+            r = await self._client_request(
+                "PUT", batch_url, json=api._batch_payload(dirty)
+            )
+            if r.status_code >= 500 and r.status_code not in BATCH_UNSUPPORTED_STATUS:
+                self.journal.attempted(batch)
+                return False
+            if api._handle_batch_response(r, kind, dirty):
+                self.journal.replayed_entries(batch)
+            else:
+                singles.extend(batch)
+
+        for entry in singles:
+            if not self.journal.current([entry]):
+                continue
+            r = await self._client_request(
+                entry.method,
+                entry.url,
+                headers={"Content-Type": "application/json"},
+                content=entry.body,
+            )
+            if r.status_code >= 500:
+                self.journal.attempted([entry])
+                return False
+
+            accepted = r.status_code == 200
+            if accepted:
+                self._acknowledge_replayed(entry, r.headers.get("ETag"))
+            else:
+                logger.error(
+                    "Backend rejected journaled write `%s` (status %d); dropping it.",
+                    entry.key,
+                    r.status_code,
+                )
+            self.journal.replayed_entries([entry], accepted)
+
+        if entries:
+            logger.info("Replayed %d journaled write(s).", len(entries))
+        return True
+
+    def _acknowledge_replayed(
+        self, entry: JournalEntry, etag: str | None = None
+    ):
+        if entry.kind == "story-state":
+            self.api.story_state_tracker.acknowledge(
+                tuple(entry.context["tracker_key"]), json.loads(entry.body), etag
+            )
+        elif entry.kind in ("measurement", "sample"):
+            self.api.measurement_tracker.mark_clean(
+                [(tuple(entry.context["tracker_key"]), json.loads(entry.body))]
+            )
+
+
+ASYNC_LOCAL_API = AsyncLocalAPI(LOCAL_API)
@@ -0,0 +1,465 @@
+import asyncio
+import bisect
+from collections import OrderedDict
+from os import getenv
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("RESILIENCE")
+
+# Connection pool size and timeouts (in seconds) for requests to the backend
+POOL_SIZE = int(getenv("HUBBLEDS_POOL_SIZE", 50))
+CONNECT_TIMEOUT = float(getenv("HUBBLEDS_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(getenv("HUBBLEDS_READ_TIMEOUT", 10))
+
+# Idempotent requests that fail (connection errors, timeouts, or gateway
+#  errors) are retried this many times, after a jittered exponential backoff
+GET_RETRIES = int(getenv("HUBBLEDS_GET_RETRIES", 2))
+RETRY_BACKOFF = float(getenv("HUBBLEDS_RETRY_BACKOFF", 0.25))
+RETRY_BACKOFF_MAX = 4.0
+
+# The circuit breaker opens after this many consecutive failures, and lets a
+#  single request through to probe the backend after `BREAKER_RESET` seconds
+BREAKER_FAILURES = int(getenv("HUBBLEDS_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(getenv("HUBBLEDS_BREAKER_RESET", 30))
+
+RETRY_STATUS = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Number of last good responses kept to serve while the backend is down, and
+#  how old (in seconds) one may be and still be served
+LAST_GOOD_SIZE = 256
+LAST_GOOD_MAX_AGE = float(getenv("HUBBLEDS_LAST_GOOD_MAX_AGE", 600))
+
+
+class BackendUnavailable(ConnectionError):
+    """
+    Raised in place of sending a request while the circuit breaker is open.
+    """
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    Whether an error from a request means the backend is unhealthy, as
+    opposed to the request being wrong (e.g. a 404).
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code >= 500
+    return isinstance(error, (OSError, httpx.TransportError))
+
+
+def is_failure_status(status_code: int) -> bool:
+    """
+    Whether a response status means the backend is unhealthy. Other 5xx
+    answers, such as the 501 of a route the backend doesn't implement, are
+    answers rather than failures, and don't count against the breaker.
+    """
+    return status_code in RETRY_STATUS
+
+
+def retry_delay(attempt: int) -> float:
+    # "Full jitter": spreads out the retries of clients that failed together
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+def endpoint_label(url: str) -> str:
+    """
+    The endpoint of an API URL, e.g. `class-measurements` for
+    `.../hubbles_law/class-measurements/1/2`, used to label metrics.
+    """
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if len(segments) > 1:
+        return segments[1]
+    return segments[0] if segments else "/"
+
+
+class CircuitBreaker:
+    """
+    Fails requests to the backend fast while it is unhealthy.
+
+    The breaker opens after `failure_threshold` consecutive failures. While
+    open, `allow` refuses every request. After `reset_timeout` seconds the
+    breaker is half-open and lets a single probe request through; it closes
+    again if the probe succeeds and reopens if it fails.
+
+    Parameters
+    ----------
+    failure_threshold: int
+    reset_timeout: float
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self,
+                 failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        # Caller must hold the lock
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            return self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+
+            # A probe that never reported back no longer blocks new probes
+            now = time.monotonic()
+            stale_probe = (
+                self._probe_started is not None
+                and now - self._probe_started >= self.reset_timeout
+            )
+            if state == self.HALF_OPEN and (self._probe_started is None or stale_probe):
+                self._state = self.HALF_OPEN
+                self._probe_started = now
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_started = None
+            if self._state != self.CLOSED:
+                logger.info("Backend recovered; closing circuit breaker.")
+                self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_started = None
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != self.OPEN:
+                    self.opened += 1
+                    logger.warning(
+                        "Opening circuit breaker after %d consecutive "
+                        "backend failure(s).",
+                        self._failures,
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyHistogram:
+    """
+    Counts of request latencies per bucket, reported cumulatively (each
+    bucket counts every latency up to its bound), as Prometheus does.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self) -> dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+        }
+
+
+class BackendMetrics:
+    """
+    Latency histograms, failures and retries of backend requests, by endpoint.
+    """
+
+    def __init__(self):
+        self._latency: dict[str, LatencyHistogram] = {}
+        self._failures: dict[str, int] = {}
+        self._retries: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, seconds: float, failed: bool = False):
+        with self._lock:
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = LatencyHistogram()
+            histogram.observe(seconds)
+            if failed:
+                self._failures[endpoint] = self._failures.get(endpoint, 0) + 1
+
+    def retried(self, endpoint: str):
+        with self._lock:
+            self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                endpoint: {
+                    "latency": histogram.snapshot(),
+                    "failures": self._failures.get(endpoint, 0),
+                    "retries": self._retries.get(endpoint, 0),
+                }
+                for endpoint, histogram in self._latency.items()
+            }
+
+
+BACKEND_BREAKER = CircuitBreaker()
+BACKEND_METRICS = BackendMetrics()
+
+
+def backend_stats() -> dict[str, Any]:
+    return {
+        "breaker": BACKEND_BREAKER.stats(),
+        "endpoints": BACKEND_METRICS.stats(),
+    }
+
+
+class ResilientAdapter(HTTPAdapter):
+    """
+    `requests` transport adapter that applies the pool size, default
+    timeouts, retries and circuit breaker to backend requests, and records
+    their latency.
+
+    Parameters
+    ----------
+    breaker: CircuitBreaker
+    metrics: BackendMetrics
+    retries: int
+        Retries for idempotent requests
+    timeout: tuple[float, float]
+        Default (connect, read) timeouts, for requests that don't set one
+    pool_size: int
+    """
+
+    def __init__(self,
+                 breaker: CircuitBreaker = BACKEND_BREAKER,
+                 metrics: BackendMetrics = BACKEND_METRICS,
+                 retries: int = GET_RETRIES,
+                 timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 pool_size: int = POOL_SIZE,
+                 **kwargs):
+        self.breaker = breaker
+        self.metrics = metrics
+        self.retries = retries
+        self.timeout = timeout
+        kwargs.setdefault("pool_connections", pool_size)
+        kwargs.setdefault("pool_maxsize", pool_size)
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        retries = self.retries if request.method in IDEMPOTENT_METHODS else 0
+        endpoint = endpoint_label(request.url)
+
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                raise BackendUnavailable(
+                    f"Backend unavailable; not sending {request.method} {request.url}"
+                )
+
+            start = time.perf_counter()
+            try:
+                response = super().send(request, timeout=timeout, **kwargs)
+            except (RequestsConnectionError, Timeout):
+                self.metrics.observe(endpoint, time.perf_counter() - start, failed=True)
+                self.breaker.record_failure()
+                if attempt == retries:
+                    raise
+            else:
+                failed = is_failure_status(response.status_code)
+                self.metrics.observe(
+                    endpoint, time.perf_counter() - start, failed=failed
+                )
+                if failed:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUS or attempt == retries:
+                    return response
+                response.close()
+
+            self.metrics.retried(endpoint)
+            time.sleep(retry_delay(attempt))
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """
+    `httpx` counterpart to `ResilientAdapter`. Pool size and timeouts are set
+    on the client and the wrapped transport.
+
+    Parameters
+    ----------
+    transport: httpx.AsyncBaseTransport
+    breaker: CircuitBreaker
+    metrics: BackendMetrics
+    retries: int
+        Retries for idempotent requests
+    """
+
+    def __init__(self,
+                 transport: httpx.AsyncBaseTransport,
+                 breaker: CircuitBreaker = BACKEND_BREAKER,
+                 metrics: BackendMetrics = BACKEND_METRICS,
+                 retries: int = GET_RETRIES):
+        self.transport = transport
+        self.breaker = breaker
+        self.metrics = metrics
+        self.retries = retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        retries = self.retries if request.method in IDEMPOTENT_METHODS else 0
+        endpoint = endpoint_label(str(request.url))
+
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                raise BackendUnavailable(
+                    f"Backend unavailable; not sending {request.method} {request.url}"
+                )
+
+            start = time.perf_counter()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.metrics.observe(endpoint, time.perf_counter() - start, failed=True)
+                self.breaker.record_failure()
+                if attempt == retries:
+                    raise
+            else:
+                failed = is_failure_status(response.status_code)
+                self.metrics.observe(
+                    endpoint, time.perf_counter() - start, failed=failed
+                )
+                if failed:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if response.status_code not in RETRY_STATUS or attempt == retries:
+                    return response
+                await response.aclose()
+
+            self.metrics.retried(endpoint)
+            await asyncio.sleep(retry_delay(attempt))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class LastGood:
+    """
+    The last successful result of each of a bounded number of reads, served
+    in place of a fresh result while the backend is failing. Results are
+    held in memory, so this is only meant for small reads (such as the seed
+    measurements or a sample galaxy); bulk tables rely on the HTTP cache.
+
+    Parameters
+    ----------
+    max_entries: int
+    max_age: float
+        How old (in seconds) a result may be and still be served
+    """
+
+    def __init__(self,
+                 max_entries: int = LAST_GOOD_SIZE,
+                 max_age: float = LAST_GOOD_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._results: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def _store(self, key: Hashable, value: Any):
+        with self._lock:
+            self._results[key] = (time.monotonic(), value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def _fallback(self, key: Hashable, error: BaseException) -> Any:
+        with self._lock:
+            if not is_backend_failure(error) or key not in self._results:
+                raise error
+            stored_at, value = self._results[key]
+            if time.monotonic() - stored_at > self.max_age:
+                del self._results[key]
+                raise error
+            self.served += 1
+        logger.warning(
+            "Backend request failed (%s); serving last good result for `%s`.",
+            error, key,
+        )
+        return value
+
+    def wrap(self, key: Hashable, func: Callable[[], Any]) -> Callable[[], Any]:
+        def _call():
+            try:
+                value = func()
+            except Exception as e:
+                return self._fallback(key, e)
+            self._store(key, value)
+            return value
+
+        return _call
+
+    def awrap(
+        self, key: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> Callable[[], Awaitable[Any]]:
+        async def _call():
+            try:
+                value = await func()
+            except Exception as e:
+                return self._fallback(key, e)
+            self._store(key, value)
+            return value
+
+        return _call
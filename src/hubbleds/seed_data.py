@@ -0,0 +1,89 @@
+from typing import Any
+
+import numpy as np
+from numpy.random import Generator, PCG64, SeedSequence
+
+from hubbleds.data_management import DB_VELOCITY_FIELD
+
+# The example seed data is a fixed "random" selection of galaxy pairs (first
+#  and second measurement) from the sample measurements. Only the first
+#  `SEED_CANDIDATES` pairs are candidates, so that the same galaxies are
+#  always selected.
+SEED = 42
+SEED_CANDIDATES = 85
+SEED_PAIRS = 40
+
+
+def select_seed_indices(records: list[dict[str, Any]]) -> np.ndarray:
+    """
+    Indices of the seed measurements among the sample measurement records,
+    in selection order. Each selected galaxy contributes its first and second
+    measurement, which are adjacent in the records.
+    """
+    velocities = [record[DB_VELOCITY_FIELD] for record in records]
+    good = np.array([vel is not None and vel > 0 for vel in velocities], dtype=bool)
+
+    # TODO: Note that though this is from the old code
+    # it seems to only pick the 2nd measurement
+    gen = Generator(PCG64(SeedSequence(SEED)))
+    indices = np.arange(len(good))[1::2][:SEED_CANDIDATES]
+    subset = gen.choice(
+        indices[good[1::2][:SEED_CANDIDATES]], size=SEED_PAIRS, replace=False
+    )
+    # This is the subset
+    # [121 122  13  14 159 160  23  24 161 162 137 138 111 112 155 156  69  70
+    #     75  76  81  82  11  12 129 130  93  94  99 100  17  18  37  38 169 170
+    #     67  68 107 108 119 120  65  66  45  46 141 142  73  74 165 166  85  86
+    #     59  60  87  88  27  28 109 110  51  52  47  48  97  98  89  90  63  64
+    #     91  92 143 144 149 150 103 104]
+    return np.ravel(np.column_stack((subset, subset + 1)))
+
+
+class SeedData:
+    """
+    The example seed measurements as columns, ready to be passed to glue
+    `Data`, together with masks selecting the first and second measurements.
+
+    The selection is deterministic for a story, so one instance is built per
+    process and shared by every session. The arrays are read-only.
+
+    Parameters
+    ----------
+    columns: dict[str, np.ndarray]
+        Equal-length arrays, keyed by record field
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray]):
+        self.columns = columns
+        for array in columns.values():
+            array.setflags(write=False)
+
+        numbers = columns.get("measurement_number")
+        if numbers is None:
+            numbers = np.empty(0, dtype=object)
+        self.masks = {
+            "first": numbers == "first",
+            "second": numbers == "second",
+        }
+        self._subsets = {
+            which: {name: array[mask] for name, array in columns.items()}
+            for which, mask in self.masks.items()
+        }
+        for subset in self._subsets.values():
+            for array in subset.values():
+                array.setflags(write=False)
+
+    @classmethod
+    def from_records(cls, records: list[dict[str, Any]]) -> "SeedData":
+        if not records:
+            return cls({})
+        return cls({key: np.asarray([r[key] for r in records]) for key in records[0]})
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def subset(self, which: str) -> dict[str, np.ndarray]:
+        """
+        The columns of the "first" or "second" measurements only.
+        """
+        return self._subsets[which]
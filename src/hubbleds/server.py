@@ -1,3 +1,5 @@
+from os import getenv
+
 from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import JSONResponse
@@ -6,16 +8,41 @@ from solara.server import settings
 
 import solara.server.starlette
 
+from hubbleds.http_cache import HTTP_CACHE
+from hubbleds.remote import LOCAL_API
+from hubbleds.resilience import backend_stats
+from hubbleds.spectrum_cache import SPECTRUM_CACHE
+from hubbleds.write_journal import WRITE_JOURNAL
+
+# Whether to serve the process's cache and backend metrics at `/metrics`.
+#  Off by default: the route is unauthenticated, so only turn it on where
+#  the server is not publicly reachable (or is behind an authenticating proxy).
+METRICS_ROUTE = getenv(
+    "HUBBLEDS_METRICS_ROUTE", "false"
+).lower() in ("1", "true", "yes")
+
 
 def root(request: Request):
     return JSONResponse({"Error Message": "Go back whence ye came."})
 
 
+def metrics(request: Request):
+    return JSONResponse({
+        "backend": backend_stats(),
+        "http_cache": HTTP_CACHE.stats(),
+        "spectrum_cache": SPECTRUM_CACHE.stats(),
+        "request_coalescer": LOCAL_API.request_coalescer.stats(),
+        "write_journal": WRITE_JOURNAL.stats(),
+    })
+
+
 routes = [
     Route("/", endpoint=root),
     # Mount("/hubbles-law/", solara.server.starlette.app),
     Mount("/hubbles-law/", routes=solara.server.starlette.routes),
 ]
+if METRICS_ROUTE:
+    routes.insert(1, Route("/metrics", endpoint=metrics))
 
 # middleware = [
 #     Middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True),
@@ -0,0 +1,159 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+import threading
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+# Maximum number of results kept for their `ttl`. Results are keyed by URL,
+#  which for many reads includes the student, so the least recently used are
+#  dropped beyond this.
+SINGLEFLIGHT_MAX_RESULTS = 256
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls. While a call for a given key is in
+    flight, other callers asking for the same key wait for it and receive
+    the same result (or exception) instead of issuing their own call. A
+    result can optionally be kept for a short `ttl` so that calls arriving
+    just after it completes are served without a new request.
+
+    Callers may be plain threads (`do`) or coroutines on any event loop
+    (`ado`); both kinds can share the same in-flight call. Shared results
+    must be treated as read-only.
+
+    Kept results are dropped once expired, and at most `max_results` of
+    them are kept, least recently used first to go.
+
+    Parameters
+    ----------
+    max_results: int
+    """
+
+    def __init__(self, max_results: int = SINGLEFLIGHT_MAX_RESULTS):
+        self.max_results = max_results
+        self._calls: dict[Hashable, Future] = {}
+        self._results: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.executions = 0
+        self.deduplicated = 0
+        self.cache_hits = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "deduplicated": self.deduplicated,
+                "cache_hits": self.cache_hits,
+                "in_flight": len(self._calls),
+                "results": len(self._results),
+            }
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._results.pop(key, None)
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """
+        Returns the future for `key`, and whether the caller is responsible
+        for running the call.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+
+            cached = self._results.get(key)
+            if cached is not None:
+                expires, value = cached
+                if expires > now:
+                    self.cache_hits += 1
+                    self._results.move_to_end(key)
+                    future = Future()
+                    future.set_result(value)
+                    return future, False
+                del self._results[key]
+
+            future = self._calls.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future, False
+
+            future = self._calls[key] = Future()
+            self.executions += 1
+            return future, True
+
+    def _keep(self, key: Hashable, ttl: float, value: Any):
+        # Caller must hold the lock
+        now = time.monotonic()
+        expired = [k for k, (expires, _) in self._results.items() if expires <= now]
+        for k in expired:
+            del self._results[k]
+
+        self._results[key] = (now + ttl, value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+
+    def _finish(self, key: Hashable, future: Future, ttl: float,
+                value: Any = None, error: BaseException | None = None):
+        with self._lock:
+            self._calls.pop(key, None)
+            if error is None and ttl > 0:
+                self._keep(key, ttl, value)
+
+        if error is None:
+            future.set_result(value)
+        elif isinstance(error, (asyncio.CancelledError, KeyboardInterrupt, SystemExit)):
+            # The leader was interrupted rather than the call failing, so
+            #  waiting callers should retry instead of sharing the interruption
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+    def do(self, key: Hashable, func: Callable[[], Any], ttl: float = 0) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except CancelledError:
+                continue
+
+        try:
+            value = func()
+        except BaseException as e:
+            self._finish(key, future, ttl, error=e)
+            raise
+
+        self._finish(key, future, ttl, value=value)
+        return value
+
+    async def ado(
+        self, key: Hashable, func: Callable[[], Awaitable[Any]], ttl: float = 0
+    ) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # Shielded so that cancelling this caller does not cancel the
+                #  shared call
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # This caller was cancelled, not the shared call
+                    raise
+
+        try:
+            value = await func()
+        except BaseException as e:
+            self._finish(key, future, ttl, error=e)
+            raise
+
+        self._finish(key, future, ttl, value=value)
+        return value
@@ -0,0 +1,283 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+from os import getenv, replace
+from pathlib import Path
+import struct
+from tempfile import NamedTemporaryFile
+import threading
+from typing import Optional
+
+import numpy as np
+
+from hubbleds.state import GalaxyData, SpectrumData
+from hubbleds.spectrum_decoder import SpectrumColumns, decode_spectrum
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("SPECTRUM-BUNDLE")
+
+# Path of a prebuilt spectrum bundle to serve spectra from, if any
+SPECTRUM_BUNDLE_PATH = getenv("HUBBLEDS_SPECTRUM_BUNDLE")
+
+BUNDLE_MAGIC = b"HUBBLEDS-SPECTRA"
+BUNDLE_VERSION = 1
+_ALIGNMENT = 64
+
+_OFFSET_DTYPE = np.dtype("<i8")
+_WAVE_DTYPE = np.dtype("<f8")
+_FLUX_DTYPE = np.dtype("<f4")
+
+
+def _align(position: int) -> int:
+    return -(-position // _ALIGNMENT) * _ALIGNMENT
+
+
+def _bundle_key(name: str) -> str:
+    return name.replace(".fits", "")
+
+
+class SpectrumBundle:
+    """
+    Read-only, memory-mapped collection of the spectra for a story.
+
+    A bundle file starts with `BUNDLE_MAGIC`, followed by the length of a
+    JSON header (a little-endian uint64) and the header itself. After that
+    come three aligned arrays: `count + 1` int64 offsets, and the
+    concatenated wavelength (float64) and flux (float32) values of every
+    spectrum. Spectrum `i` occupies `offsets[i]:offsets[i + 1]` of both
+    value arrays.
+
+    The arrays are memory-mapped, so looking up a spectrum only slices them,
+    and every process that opens the same bundle shares its pages through
+    the OS page cache.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"{self.path} is not a spectrum bundle")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        if header["version"] != BUNDLE_VERSION:
+            raise ValueError(
+                f"Unsupported spectrum bundle version {header['version']} "
+                f"in {self.path}"
+            )
+
+        self.story_id: str = header["story_id"]
+        self.names: list[str] = header["names"]
+        self._index = {_bundle_key(name): i for i, name in enumerate(self.names)}
+
+        start = _align(len(BUNDLE_MAGIC) + 8 + header_length)
+        count, total = len(self.names), header["total"]
+        self._offsets = np.memmap(self.path, dtype=_OFFSET_DTYPE, mode="r",
+                                  offset=start + header["offsets_offset"],
+                                  shape=(count + 1,))
+        self._wave = np.memmap(self.path, dtype=_WAVE_DTYPE, mode="r",
+                               offset=start + header["wave_offset"], shape=(total,))
+        self._flux = np.memmap(self.path, dtype=_FLUX_DTYPE, mode="r",
+                               offset=start + header["flux_offset"], shape=(total,))
+
+    def __contains__(self, name: str) -> bool:
+        return _bundle_key(name) in self._index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        return self._offsets.nbytes + self._wave.nbytes + self._flux.nbytes
+
+    def get(self, name: str) -> Optional[SpectrumData]:
+        index = self._index.get(_bundle_key(name))
+        if index is None:
+            return None
+
+        start, stop = self._offsets[index:index + 2]
+        return SpectrumData(
+            name=self.names[index],
+            wave=self._wave[start:stop],
+            flux=self._flux[start:stop],
+        )
+
+
+def write_spectrum_bundle(
+    path: str | Path, story_id: str, spectra: dict[str, SpectrumColumns]
+):
+    """
+    Write spectra to a bundle file that `SpectrumBundle` can open.
+
+    Parameters
+    ----------
+    path: str | Path
+        Where to write the bundle. An existing file is replaced atomically.
+    story_id: str
+        The story the spectra belong to
+    spectra: dict[str, tuple[np.ndarray, np.ndarray]]
+        Wavelength and flux arrays, keyed by galaxy name
+    """
+    if not spectra:
+        raise ValueError("Refusing to write an empty spectrum bundle")
+
+    names = list(spectra)
+    lengths = [len(spectra[name][0]) for name in names]
+    offsets = np.zeros(len(names) + 1, dtype=_OFFSET_DTYPE)
+    np.cumsum(lengths, out=offsets[1:])
+    total = int(offsets[-1])
+
+    offsets_offset = 0
+    wave_offset = _align(offsets_offset + offsets.nbytes)
+    flux_offset = _align(wave_offset + total * _WAVE_DTYPE.itemsize)
+
+    header = json.dumps({
+        "version": BUNDLE_VERSION,
+        "story_id": story_id,
+        "names": names,
+        "total": total,
+        "offsets_offset": offsets_offset,
+        "wave_offset": wave_offset,
+        "flux_offset": flux_offset,
+    }).encode("utf-8")
+    start = _align(len(BUNDLE_MAGIC) + 8 + len(header))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+
+        f.seek(start + offsets_offset)
+        f.write(offsets.tobytes())
+        f.seek(start + wave_offset)
+        for name in names:
+            f.write(np.asarray(spectra[name][0], dtype=_WAVE_DTYPE).tobytes())
+        f.seek(start + flux_offset)
+        for name in names:
+            f.write(np.asarray(spectra[name][1], dtype=_FLUX_DTYPE).tobytes())
+    replace(f.name, path)
+
+    logger.info("Wrote %d spectra (%d values) to %s.", len(names), total, path)
+
+
+def build_spectrum_bundle(
+    path: str | Path,
+    story_id: str = "hubbles_law",
+    source_dir: Optional[str | Path] = None,
+    workers: int = 8,
+):
+    """
+    Build a bundle containing the spectrum of every galaxy in a story's
+    catalog, plus its sample galaxy.
+
+    Parameters
+    ----------
+    path: str | Path
+        Where to write the bundle
+    story_id: str
+        The story whose galaxies should be bundled
+    source_dir: str | Path | None
+        A local directory of spectrum files, laid out either like the spectra
+        endpoint (e.g. `spiral/<name>.fits`) or flat. Spectra that are not
+        found there are fetched from the API.
+    workers: int
+        Number of spectra to fetch and decode concurrently
+    """
+    import solara
+    from hubbleds.remote import LOCAL_API
+    from hubbleds.state import LocalState
+
+    local_state = solara.reactive(LocalState(story_id=story_id))
+    galaxies = LOCAL_API.get_galaxies(local_state)
+    sample_galaxy = LOCAL_API.get_sample_galaxy(local_state)
+    if all(galaxy.id != sample_galaxy.id for galaxy in galaxies):
+        galaxies.append(sample_galaxy)
+
+    source_dir = Path(source_dir) if source_dir else None
+
+    def _load(galaxy: GalaxyData) -> Optional[SpectrumColumns]:
+        relative_path = LOCAL_API.spectrum_path(galaxy)
+        if source_dir is not None:
+            candidates = (
+                source_dir / relative_path,
+                source_dir / Path(relative_path).name,
+            )
+            for candidate in candidates:
+                if candidate.exists():
+                    return decode_spectrum(candidate.read_bytes())
+
+        r = LOCAL_API.request_session.get(LOCAL_API._spectrum_url(galaxy, local_state))
+        if r.status_code != 200:
+            logger.warning(
+                "Failed to fetch spectrum `%s` (status %d).", galaxy.name, r.status_code
+            )
+            return None
+        return decode_spectrum(r.content)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_load, galaxies)
+        spectra = {}
+        for galaxy, columns in zip(galaxies, results):
+            if columns is None:
+                logger.warning("Skipping galaxy `%s`: no spectrum.", galaxy.name)
+                continue
+            spectra[galaxy.name] = columns
+
+    write_spectrum_bundle(path, story_id, spectra)
+
+
+_bundle: Optional[SpectrumBundle] = None
+_bundle_loaded = False
+_bundle_lock = threading.Lock()
+
+
+def get_spectrum_bundle() -> Optional[SpectrumBundle]:
+    """
+    Return the bundle configured via `HUBBLEDS_SPECTRUM_BUNDLE`, opening it on
+    first use, or None if no (usable) bundle is configured.
+    """
+    global _bundle, _bundle_loaded
+    if _bundle_loaded:
+        return _bundle
+
+    with _bundle_lock:
+        if not _bundle_loaded:
+            if SPECTRUM_BUNDLE_PATH:
+                try:
+                    _bundle = SpectrumBundle(SPECTRUM_BUNDLE_PATH)
+                    logger.info(
+                        "Serving %d spectra for `%s` from %s.",
+                        len(_bundle), _bundle.story_id, SPECTRUM_BUNDLE_PATH,
+                    )
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error(
+                        "Failed to open spectrum bundle %s: %s", SPECTRUM_BUNDLE_PATH, e
+                    )
+            _bundle_loaded = True
+    return _bundle
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Build a memory-mapped bundle of the spectra of a story's galaxies."
+    )
+    parser.add_argument("output", help="path of the bundle file to write")
+    parser.add_argument(
+        "--story", default="hubbles_law", help="story id (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--source-dir", help="read spectrum files from this directory when present"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8,
+        help="concurrent downloads (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    build_spectrum_bundle(args.output, args.story, args.source_dir, args.workers)
+
+
+if __name__ == "__main__":
+    main()
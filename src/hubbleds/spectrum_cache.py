@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from os import getenv, replace
+from pathlib import Path
+from tempfile import NamedTemporaryFile, gettempdir
+import threading
+
+import numpy as np
+
+from hubbleds.state import SpectrumData
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("SPECTRUM-CACHE")
+
+SPECTRUM_CACHE_DIR = getenv(
+    "HUBBLEDS_SPECTRUM_CACHE_DIR",
+    (Path(gettempdir()) / "hubbleds" / "spectra").as_posix(),
+)
+SPECTRUM_CACHE_MAX_BYTES = int(
+    getenv("HUBBLEDS_SPECTRUM_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+)
+
+SpectrumKey = tuple[str, str]
+
+
+def spectrum_key(story_id: str, galaxy_name: str) -> SpectrumKey:
+    return story_id, galaxy_name.replace(".fits", "")
+
+
+def spectrum_nbytes(spectrum: SpectrumData) -> int:
+    """
+    The memory held by the arrays of a spectrum.
+    """
+    return sum(
+        values.nbytes
+        for values in (spectrum.wave, spectrum.flux, spectrum.ivar)
+        if values is not None
+    )
+
+
+class SpectrumCache:
+    """
+    Process-wide, two-tier cache for galaxy spectra.
+
+    The first tier is an in-memory LRU bounded by `max_bytes`. The second is
+    an on-disk store of `.npz` files under `cache_dir`, which survives server
+    restarts and is shared by every worker on the same machine. Both tiers are
+    safe to use from multiple sessions at once.
+
+    Parameters
+    ----------
+    max_bytes: int
+        Memory budget for the in-memory tier. Least recently used spectra are
+        evicted once the budget is exceeded.
+    cache_dir: str | Path | None
+        Directory for the on-disk tier. If None, only the memory tier is used.
+    """
+
+    def __init__(self, max_bytes: int = SPECTRUM_CACHE_MAX_BYTES,
+                 cache_dir: str | Path | None = SPECTRUM_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[SpectrumKey, tuple[SpectrumData, int]] = (
+            OrderedDict()
+        )
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: SpectrumKey) -> bool:
+        with self._lock:
+            if key in self._entries:
+                return True
+        path = self._path(key)
+        return path is not None and path.exists()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get(self, key: SpectrumKey) -> SpectrumData | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        spectrum = self._read(key)
+        with self._lock:
+            if spectrum is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, spectrum)
+
+        return spectrum
+
+    def put(self, key: SpectrumKey, spectrum: SpectrumData):
+        with self._lock:
+            self._insert(key, spectrum)
+        self._write(key, spectrum)
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+        if disk and self.cache_dir is not None:
+            for path in self.cache_dir.glob("*/*.npz"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _insert(self, key: SpectrumKey, spectrum: SpectrumData):
+        # Caller must hold the lock
+        if key in self._entries:
+            self._nbytes -= self._entries.pop(key)[1]
+
+        size = spectrum_nbytes(spectrum)
+        if size > self.max_bytes:
+            logger.warning(
+                "Spectrum `%s` (%d bytes) exceeds the cache budget; "
+                "not caching in memory.",
+                key[1], size,
+            )
+            return
+
+        self._entries[key] = (spectrum, size)
+        self._nbytes += size
+
+        while self._nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._nbytes -= evicted_size
+            self.evictions += 1
+
+    def _path(self, key: SpectrumKey) -> Path | None:
+        if self.cache_dir is None:
+            return None
+        story_id, name = key
+        return self.cache_dir / story_id / f"{name}.npz"
+
+    def _read(self, key: SpectrumKey) -> SpectrumData | None:
+        path = self._path(key)
+        if path is None or not path.exists():
+            return None
+
+        try:
+            with np.load(path) as arrays:
+                return SpectrumData(
+                    name=str(arrays["name"]),
+                    wave=arrays["wave"],
+                    flux=arrays["flux"],
+                    ivar=arrays["ivar"] if "ivar" in arrays.files else None,
+                )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Discarding unreadable cached spectrum `%s`: %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+
+    def _write(self, key: SpectrumKey, spectrum: SpectrumData):
+        path = self._path(key)
+        if path is None:
+            return
+
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that concurrent readers in
+            #  other workers never see a partially written spectrum
+            with NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+                arrays = {"wave": spectrum.wave, "flux": spectrum.flux}
+                if spectrum.ivar is not None:
+                    arrays["ivar"] = spectrum.ivar
+                np.savez(f, name=spectrum.name, **arrays)
+            replace(f.name, path)
+        except OSError as e:
+            logger.warning("Failed to write spectrum `%s` to disk cache: %s", key[1], e)
+
+
+SPECTRUM_CACHE = SpectrumCache()
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from io import BytesIO
+from os import getenv
+import threading
+from typing import Optional
+
+from astropy.io import fits
+import numpy as np
+
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("SPECTRUM-DECODER")
+
+# Number of workers used to decode spectrum files
+SPECTRUM_DECODE_WORKERS = int(getenv("HUBBLEDS_SPECTRUM_DECODE_WORKERS", 4))
+
+# Decode in worker processes rather than threads. Processes avoid contending
+#  for the GIL with the server, at the cost of copying each file and its
+#  decoded arrays between processes.
+SPECTRUM_DECODE_PROCESSES = getenv(
+    "HUBBLEDS_SPECTRUM_DECODE_PROCESSES", ""
+).lower() in ("1", "true", "yes")
+
+SpectrumColumns = tuple[np.ndarray, np.ndarray]
+
+
+def decode_spectrum(content: bytes) -> Optional[SpectrumColumns]:
+    """
+    Decode the wavelength and flux of a spectrum from the contents of a FITS
+    file. Only the `loglam` and `flux` columns of the `COADD` table are read.
+
+    Parameters
+    ----------
+    content: bytes
+        The contents of the FITS file
+
+    Returns
+    ----------
+    columns: tuple[np.ndarray, np.ndarray] | None
+        Contiguous, native-endian wavelength (float64) and flux (float32)
+        arrays, or None if the file has no `COADD` table
+    """
+    with closing(BytesIO(content)) as f:
+        with fits.open(f, lazy_load_hdus=True) as hdulist:
+            if "COADD" not in hdulist:
+                return None
+            data = hdulist["COADD"].data
+            # FITS tables are big-endian, so converting here also gives us
+            #  native byte order and a copy that does not keep `content` alive
+            loglam = np.asarray(data.field("loglam"), dtype=np.float64)
+            flux = np.ascontiguousarray(data.field("flux"), dtype=np.float32)
+
+    wave = np.power(10.0, loglam, out=loglam)
+    return wave, flux
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_decode_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if SPECTRUM_DECODE_PROCESSES:
+                _executor = ProcessPoolExecutor(max_workers=SPECTRUM_DECODE_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=SPECTRUM_DECODE_WORKERS,
+                    thread_name_prefix="hubbleds-spectrum-decode",
+                )
+            logger.info(
+                "Decoding spectra with %d worker %s.",
+                SPECTRUM_DECODE_WORKERS,
+                "processes" if SPECTRUM_DECODE_PROCESSES else "threads",
+            )
+        return _executor
+
+
+async def decode_spectrum_async(content: bytes) -> Optional[SpectrumColumns]:
+    """
+    Like `decode_spectrum`, but runs on the decode worker pool so that the
+    calling event loop stays free.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_decode_executor(), decode_spectrum, content)
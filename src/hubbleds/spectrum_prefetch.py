@@ -0,0 +1,84 @@
+import asyncio
+from os import getenv
+import threading
+from typing import Awaitable, Callable, Hashable, Optional
+
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("SPECTRUM-PREFETCH")
+
+# Maximum number of spectra fetched in the background at once, across all
+#  sessions in the process
+SPECTRUM_PREFETCH_CONCURRENCY = int(getenv("HUBBLEDS_SPECTRUM_PREFETCH_CONCURRENCY", 4))
+
+
+class SpectrumPrefetcher:
+    """
+    Background queue for fetching spectra before they are displayed.
+
+    Prefetches run on the event loop returned by `get_loop`, with at most
+    `concurrency` of them in progress at a time. Submitting a key that is
+    already queued or in progress does nothing, so the same galaxies can be
+    submitted repeatedly (e.g. on every change to a student's measurements).
+    Failures are logged and otherwise ignored; the spectrum is then fetched
+    as usual when it is displayed.
+    """
+
+    def __init__(self,
+                 get_loop: Callable[[], asyncio.AbstractEventLoop],
+                 concurrency: int = SPECTRUM_PREFETCH_CONCURRENCY):
+        self.get_loop = get_loop
+        self.concurrency = concurrency
+
+        self._pending: set[Hashable] = set()
+        self._lock = threading.Lock()
+        # Only used on the prefetch loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.requested = 0
+        self.skipped = 0
+        self.fetched = 0
+        self.failures = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "queue_depth": len(self._pending),
+                "requested": self.requested,
+                "skipped": self.skipped,
+                "fetched": self.fetched,
+                "failures": self.failures,
+            }
+
+    def submit(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        with self._lock:
+            self.requested += 1
+            if key in self._pending:
+                self.skipped += 1
+                return
+            self._pending.add(key)
+
+        asyncio.run_coroutine_threadsafe(self._run(key, fetch), self.get_loop())
+
+    async def _run(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        fetched = False
+        try:
+            async with self._semaphore:
+                await fetch()
+            fetched = True
+        except Exception as e:
+            logger.warning("Failed to prefetch spectrum `%s`: %s", key, e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+                if fetched:
+                    self.fetched += 1
+                else:
+                    self.failures += 1
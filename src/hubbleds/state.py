@@ -1,31 +1,66 @@
-from pydantic import BaseModel, computed_field, field_validator, Field
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    computed_field,
+    field_serializer,
+    field_validator,
+    model_validator,
+    Field,
+)
 from solara import Reactive
 from cosmicds.state import BaseState, GLOBAL_STATE, BaseLocalState
 from hubbleds.base_component_state import BaseComponentState
-from typing import Optional
+from hubbleds.measurement_table import MeasurementTable
+from typing import Any, Optional
 import solara
 import datetime
 from functools import cached_property
 from astropy.table import Table
+import numpy as np
 from pydantic import Field
 
 from solara.toestand import Ref
 
 
-from typing import Callable, Tuple
+from typing import Callable, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hubbleds.galaxy_catalog import GalaxyCatalog
 
 ELEMENT_REST = {"H-α": 6562.79, "Mg-I": 5176.7}
 
+# Galaxy fields that `DataTable` rows don't need
+TABLE_EXCLUDED_GALAXY_FIELDS = {"ra", "decl", "z", "type"}
+
 from cosmicds.logger import setup_logger
 
 logger = setup_logger("HUBBLEDS-STATE")
 
 
 class SpectrumData(BaseModel):
+    """
+    A galaxy spectrum. The wavelength and flux are kept as contiguous NumPy
+    arrays rather than lists, which needs several times less memory and
+    lets them be passed to plotting code without conversion.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     name: str
-    wave: list[float]
-    flux: list[float]
-    ivar: list[float]
+    wave: np.ndarray
+    flux: np.ndarray
+    ivar: Optional[np.ndarray] = None
+
+    @field_validator("wave", mode="before")
+    @classmethod
+    def _wave_array(cls, value):
+        return np.ascontiguousarray(value, dtype=np.float64)
+
+    @field_validator("flux", "ivar", mode="before")
+    @classmethod
+    def _flux_array(cls, value):
+        if value is None:
+            return None
+        return np.ascontiguousarray(value, dtype=np.float32)
 
 
 class GalaxyData(BaseModel):
@@ -45,9 +80,9 @@ class GalaxyData(BaseModel):
 
     @cached_property
     def spectrum_as_data_frame(self):
-        from hubbleds.remote import LOCAL_API
-
-        spec_data = LOCAL_API.load_spectrum_data(self, LOCAL_STATE)
+        spec_data = self.spectrum
+        if spec_data is None:
+            return None
 
         return Table({"wave": spec_data.wave, "flux": spec_data.flux}).to_pandas()
 
@@ -74,12 +109,34 @@ class StudentMeasurement(BaseModel):
     est_dist_unit: str = "Mpc"
     measurement_number: str | None = None
     brightness: float = 0
-    galaxy: Optional[GalaxyData] = None
+    galaxy_id: int = 0
+
+    @model_validator(mode="before")
+    @classmethod
+    def _reference_galaxy(cls, data: Any) -> Any:
+        # A galaxy given in full is kept once, in `GALAXY_POOL`, and the
+        #  measurement only stores its id
+        if isinstance(data, dict) and "galaxy" in data:
+            data = dict(data)
+            galaxy = data.pop("galaxy")
+            if galaxy is not None:
+                from hubbleds.galaxy_catalog import GALAXY_POOL
+
+                data["galaxy_id"] = GALAXY_POOL.intern(galaxy).id
+        return data
 
     @computed_field
     @property
-    def galaxy_id(self) -> int:
-        return self.galaxy.id if self.galaxy else 0
+    def galaxy(self) -> Optional[GalaxyData]:
+        """
+        The shared `GalaxyData` of the measurement's galaxy, looked up by id
+        in `GALAXY_POOL`. Serialized in full, as the API expects.
+        """
+        if not self.galaxy_id:
+            return None
+        from hubbleds.galaxy_catalog import GALAXY_POOL
+
+        return GALAXY_POOL.get(self.galaxy_id)
 
     @computed_field
     @property
@@ -88,6 +145,20 @@ class StudentMeasurement(BaseModel):
             return self.galaxy.rest_wave_value
         return 0
 
+    @property
+    def submission_key(self) -> tuple[int, int, str | None]:
+        return self.student_id, self.galaxy_id, self.measurement_number
+
+    def submission_payload(self) -> dict:
+        return self.model_dump(exclude={"galaxy"})
+
+    def table_row(self) -> dict:
+        """
+        The measurement as a `DataTable` row. Only the galaxy fields the
+        table shows are included, rather than the whole galaxy.
+        """
+        return self.model_dump(exclude={"galaxy": TABLE_EXCLUDED_GALAXY_FIELDS})
+
     # @computed_field
     # @property
     # def last_modified(self) -> str:
@@ -112,12 +183,14 @@ class ClassSummary(BaseSummary):
 
 
 class LocalState(BaseLocalState):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     title: str = "Hubble's Law"
     story_id: str = "hubbles_law"
     measurements: list[StudentMeasurement] = []
     example_measurements: list[StudentMeasurement] = []
-    class_measurements: list[StudentMeasurement] = []
-    all_measurements: list[StudentMeasurement] = []
+    class_measurements: MeasurementTable = Field(default_factory=MeasurementTable.empty)
+    all_measurements: MeasurementTable = Field(default_factory=MeasurementTable.empty)
     student_summaries: list[StudentSummary] = []
     class_summaries: list[ClassSummary] = []
     measurements_loaded: bool = False
@@ -136,12 +209,24 @@ class LocalState(BaseLocalState):
     stage_5_class_data_students: list[int] = []
     last_route: Optional[str] = None
 
-    @cached_property
-    def galaxies(self) -> dict[int, GalaxyData]:
-        from hubbleds.remote import LOCAL_API
+    @field_serializer("class_measurements", "all_measurements")
+    def _serialize_measurement_table(self, table: MeasurementTable):
+        return [m.model_dump() for m in table.to_models()]
 
-        gal_data = LOCAL_API.get_galaxies(LOCAL_STATE)
-        return { galaxy.id: galaxy for galaxy in gal_data }
+    @property
+    def galaxies(self) -> "GalaxyCatalog":
+        # The catalog is loaded once per process and shared by every session.
+        #  Only the first access waits for it; once it is loaded, a stale
+        #  catalog is revalidated in the background rather than during render.
+        from hubbleds.galaxy_catalog import GALAXY_CATALOGS
+        from hubbleds.remote import ASYNC_LOCAL_API, LOCAL_API
+
+        catalog = GALAXY_CATALOGS.get(self.story_id)
+        if catalog is None:
+            return LOCAL_API.get_galaxy_catalog(LOCAL_STATE)
+        if not GALAXY_CATALOGS.is_fresh(self.story_id):
+            ASYNC_LOCAL_API.refresh_galaxy_catalog(self.story_id)
+        return catalog
 
     def as_dict(self):
         return self.model_dump(exclude={
@@ -0,0 +1,187 @@
+import codecs
+import json
+from os import getenv
+from typing import Any
+
+from hubbleds.decoding import decode_class_summaries, decode_student_summaries
+from hubbleds.measurement_table import MeasurementTable, MeasurementTableBuilder
+from hubbleds.state import ClassSummary, StudentSummary
+
+# Whether the all-data response is decoded as it streams in, rather than
+#  parsed in one go once it has been read in full
+STREAM_ALL_DATA = getenv(
+    "HUBBLEDS_STREAM_ALL_DATA", "true"
+).lower() in ("1", "true", "yes")
+
+# Size (in bytes) of the chunks a streamed response is read in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+AllData = tuple[MeasurementTable, list[StudentSummary], list[ClassSummary]]
+
+_WHITESPACE = " \t\n\r"
+_START, _KEY, _COLON, _VALUE, _ITEM, _END = range(6)
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for a JSON object whose values are mostly arrays,
+    such as `{"measurements": [...], "studentData": [...]}`.
+
+    Text is fed in chunks as it arrives, and each array element is returned,
+    along with the key of its array, as soon as it is complete. Only the
+    unparsed remainder of the text is kept. Values that are not arrays are
+    collected in `values`. Separators are not checked strictly; the parser
+    relies on the elements themselves being valid JSON.
+    """
+
+    def __init__(self):
+        self.values: dict[str, Any] = {}
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _START
+        self._key = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == _END
+
+    def feed(self, data: bytes | str) -> list[tuple[str, Any]]:
+        if isinstance(data, bytes):
+            data = self._text.decode(data)
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> list[tuple[str, Any]]:
+        """
+        Parse whatever is left once all of the text has been fed.
+        """
+        self._buffer = self._buffer[self._pos:] + self._text.decode(b"", final=True)
+        self._pos = 0
+        items = self._parse(final=True)
+        if not self.done:
+            raise ValueError("Incomplete JSON document")
+        return items
+
+    def _skip_whitespace(self) -> bool:
+        buffer, pos = self._buffer, self._pos
+        size = len(buffer)
+        while pos < size and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos < size
+
+    def _decode(self, final: bool) -> tuple[bool, Any]:
+        # Returns whether a complete value was decoded, and the value
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return False, None
+
+        # A number at the very end of the text may continue in the next chunk
+        if end == len(self._buffer) and not final:
+            return False, None
+
+        self._pos = end
+        return True, value
+
+    def _parse(self, final: bool) -> list[tuple[str, Any]]:
+        items = []
+        while not self.done and self._skip_whitespace():
+            char = self._buffer[self._pos]
+            state = self._state
+
+            if state == _START:
+                if char != "{":
+                    raise ValueError(f"Expected a JSON object, found `{char}`")
+                self._pos += 1
+                self._state = _KEY
+            elif state == _KEY:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _END
+                elif char == ",":
+                    self._pos += 1
+                else:
+                    complete, self._key = self._decode(final)
+                    if not complete:
+                        break
+                    self._state = _COLON
+            elif state == _COLON:
+                if char != ":":
+                    raise ValueError(
+                        f"Expected `:` after key `{self._key}`, found `{char}`"
+                    )
+                self._pos += 1
+                self._state = _VALUE
+            elif state == _VALUE:
+                if char == "[":
+                    self._pos += 1
+                    self._state = _ITEM
+                else:
+                    complete, value = self._decode(final)
+                    if not complete:
+                        break
+                    self.values[self._key] = value
+                    self._state = _KEY
+            elif char == "]":
+                self._pos += 1
+                self._state = _KEY
+            elif char == ",":
+                self._pos += 1
+            else:
+                complete, value = self._decode(final)
+                if not complete:
+                    break
+                items.append((self._key, value))
+
+        return items
+
+
+class AllDataReader:
+    """
+    Decodes an `all-data` response as it is read. Measurements go straight
+    into a `MeasurementTableBuilder` and summaries are decoded chunk by
+    chunk, so neither the response text nor its parsed records are ever
+    held in full.
+
+    Measurements without a class are skipped, as `LocalAPI` does not keep
+    them.
+    """
+
+    def __init__(self):
+        self._stream = JSONArrayStream()
+        self._measurements = MeasurementTableBuilder()
+        self._student_summaries: list[StudentSummary] = []
+        self._class_summaries: list[ClassSummary] = []
+
+    def feed(self, data: bytes | str):
+        self._consume(self._stream.feed(data))
+
+    def _consume(self, items: list[tuple[str, Any]]):
+        student_data, class_data = [], []
+        for key, item in items:
+            if key == "measurements":
+                if item.get("class_id") is not None:
+                    self._measurements.append(item)
+            elif key == "studentData":
+                student_data.append(item)
+            elif key == "classData":
+                class_data.append(item)
+
+        if student_data:
+            self._student_summaries.extend(decode_student_summaries(student_data))
+        if class_data:
+            self._class_summaries.extend(decode_class_summaries(class_data))
+
+    def finish(self) -> AllData:
+        self._consume(self._stream.close())
+        return (
+            self._measurements.build(),
+            self._student_summaries,
+            self._class_summaries,
+        )
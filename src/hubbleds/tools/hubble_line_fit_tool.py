@@ -1,24 +1,100 @@
+from uuid import uuid4
+
 from numpy import isnan
 from echo import CallbackProperty
+from glue.core.exceptions import IncompatibleAttribute
+from glue.core.hub import HubListener
+from glue.core.message import NumericalDataChangedMessage
+import plotly.graph_objects as go
 
 
+from ..hubble_fit import solve_line
 from ..utils import age_in_gyr_simple
 from cosmicds.config import register_tool
 from cosmicds.tools import LineFitTool
 
 @register_tool
-class HubbleLineFitTool(LineFitTool):
+class HubbleLineFitTool(LineFitTool, HubListener):
+    """
+    Draws the best-fit line through the origin of each visible layer,
+    labelled with the age of the universe its slope implies. The lines are
+    fit in closed form with `hubble_fit.solve_line`, and redrawn when the
+    plotted data, attributes, layers or x range change.
+
+    Only the toolbar metadata (icon, tool tip) is taken from `LineFitTool`:
+    its constructor is skipped, so none of its own astropy fitting or
+    redrawing is hooked up alongside ours.
+    """
 
     tool_id = 'hubble:linefit'
     active = CallbackProperty(False)
 
+    _STATE_ATTRIBUTES = ('x_att', 'y_att', 'layers', 'x_max')
+
+    def __init__(self, viewer, **kwargs):
+        super(LineFitTool, self).__init__(viewer, **kwargs)
+        self._line_ids: set[str] = set()
+
     def label(self, layer, line):
         slope = line.slope.value
         age = age_in_gyr_simple(slope)
         return 'Age: %.0f Gyr' % (age) if not isnan(slope) else None
 
     def activate(self):
-        super().activate()
-    
+        self.active = True
+        self.viewer.session.hub.subscribe(
+            self, NumericalDataChangedMessage, handler=self._refresh_lines
+        )
+        for att in self._STATE_ATTRIBUTES:
+            self.viewer.state.add_callback(att, self._refresh_lines)
+        self._refresh_lines()
+
     def deactivate(self):
-        super()._clear_lines()
+        self.active = False
+        self.viewer.session.hub.unsubscribe(self, NumericalDataChangedMessage)
+        for att in self._STATE_ATTRIBUTES:
+            self.viewer.state.remove_callback(att, self._refresh_lines)
+        self._clear_lines()
+
+    def _fit_layer(self, layer):
+        state = self.viewer.state
+        try:
+            x = layer.state.layer[state.x_att]
+            y = layer.state.layer[state.y_att]
+        except IncompatibleAttribute:
+            return None
+        return solve_line(x, y)
+
+    def _line_trace(self, layer, line) -> go.Scatter:
+        x_max = self.viewer.state.x_max or 0
+        return go.Scatter(
+            x=[0, x_max],
+            y=[0, float(line(x_max))],
+            mode='lines',
+            line=dict(color=layer.state.color, width=2),
+            name=self.label(layer, line),
+            hoverinfo='name',
+            meta=str(uuid4()),
+        )
+
+    def _refresh_lines(self, *args):
+        if not self.active:
+            return
+        traces = []
+        for layer in self.viewer.layers:
+            if not (layer.enabled and layer.state.visible):
+                continue
+            line = self._fit_layer(layer)
+            if line is not None:
+                traces.append(self._line_trace(layer, line))
+
+        self._clear_lines()
+        self.viewer.figure.add_traces(traces)
+        self._line_ids = {trace.meta for trace in traces}
+
+    def _clear_lines(self):
+        figure = self.viewer.figure
+        figure.data = [
+            trace for trace in figure.data if trace.meta not in self._line_ids
+        ]
+        self._line_ids = set()
@@ -0,0 +1,181 @@
+from os import getenv
+import json
+import struct
+from typing import Any, Mapping
+
+import numpy as np
+
+from hubbleds.galaxy_catalog import GALAXY_POOL
+from hubbleds.measurement_table import MeasurementTable
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+ARROW_TABLES = "application/vnd.cosmicds.arrow-tables"
+JSON = "application/json"
+
+# Whether to ask the bulk read endpoints (`all-data`, `class-measurements`,
+#  `sample-measurements`) for Arrow IPC rather than JSON. Only possible if
+#  `pyarrow` is installed; servers that don't support it still send JSON.
+BINARY_TRANSPORT = (
+    pa is not None
+    and getenv("HUBBLEDS_BINARY_TRANSPORT", "true").lower() in ("1", "true", "yes")
+)
+
+BULK_HEADERS = {
+    "Accept": (
+        f"{ARROW_STREAM}, {ARROW_TABLES}, {JSON};q=0.9" if BINARY_TRANSPORT else JSON
+    )
+}
+
+# Endpoints whose JSON body holds a single table (`class-measurements`,
+#  `sample-measurements`) are sent as a standard Arrow IPC stream, which
+#  holds the table under this key of the JSON body.
+ARROW_STREAM_KEY = "measurements"
+
+# Endpoints with several tables (`all-data`) are sent as `ARROW_TABLES`: one
+#  Arrow IPC stream per key of the equivalent JSON body, e.g. `measurements`
+#  and `studentData`, each framed as: key length (uint32), key (UTF-8),
+#  stream length (uint64), stream. This framing is specific to CosmicDS,
+#  hence its own media type.
+#
+# In both, columns mirror the JSON fields; galaxies are either a `galaxy`
+#  struct column or a `galaxy_id` column.
+_KEY_LENGTH = struct.Struct("<I")
+_STREAM_LENGTH = struct.Struct("<Q")
+
+
+class ArrowPayload:
+    """
+    A bulk response received as Arrow, as tables keyed like the JSON body.
+    """
+
+    def __init__(self, tables: dict[str, "pa.Table"]):
+        self.tables = tables
+
+
+def media_type(headers: Mapping[str, str]) -> str:
+    return headers.get("content-type", "").split(";")[0].strip()
+
+
+def is_arrow(headers: Mapping[str, str]) -> bool:
+    return media_type(headers) in (ARROW_STREAM, ARROW_TABLES)
+
+
+def read_arrow_stream(body: bytes, key: str = ARROW_STREAM_KEY) -> ArrowPayload:
+    """
+    Decode a standard Arrow IPC stream body, as the table under `key`.
+    """
+    reader = pa.ipc.open_stream(pa.py_buffer(body))
+    return ArrowPayload({key: reader.read_all()})
+
+
+def write_arrow_stream(table: "pa.Table") -> bytes:
+    """
+    Encode a table as a standard Arrow IPC stream body, as a server would.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_arrow_tables(body: bytes) -> ArrowPayload:
+    tables = {}
+    view = memoryview(body)
+    pos = 0
+    while pos < len(view):
+        (key_length,) = _KEY_LENGTH.unpack_from(view, pos)
+        pos += _KEY_LENGTH.size
+        key = bytes(view[pos:pos + key_length]).decode("utf-8")
+        pos += key_length
+        (stream_length,) = _STREAM_LENGTH.unpack_from(view, pos)
+        pos += _STREAM_LENGTH.size
+        reader = pa.ipc.open_stream(pa.py_buffer(view[pos:pos + stream_length]))
+        tables[key] = reader.read_all()
+        pos += stream_length
+    return ArrowPayload(tables)
+
+
+def write_arrow_tables(tables: dict[str, "pa.Table"]) -> bytes:
+    """
+    Encode tables as an `ARROW_TABLES` response body, as a server would.
+    """
+    parts = []
+    for key, table in tables.items():
+        stream = write_arrow_stream(table)
+        encoded_key = key.encode("utf-8")
+        parts += [
+            _KEY_LENGTH.pack(len(encoded_key)),
+            encoded_key,
+            _STREAM_LENGTH.pack(len(stream)),
+            stream,
+        ]
+    return b"".join(parts)
+
+
+def read_bulk_payload(headers: Mapping[str, str], body: bytes) -> ArrowPayload | Any:
+    """
+    Parse the body of a bulk response, in whichever format the server chose.
+    """
+    content_type = media_type(headers)
+    if content_type == ARROW_STREAM:
+        return read_arrow_stream(body)
+    if content_type == ARROW_TABLES:
+        return read_arrow_tables(body)
+    return json.loads(body)
+
+
+def bulk_records(payload: ArrowPayload | Any, key: str) -> list[dict[str, Any]]:
+    """
+    The records under `key` of a bulk payload, as in the JSON body.
+    """
+    if isinstance(payload, ArrowPayload):
+        table = payload.tables.get(key)
+        return table.to_pylist() if table is not None else []
+    return payload[key]
+
+
+def bulk_measurements(
+    payload: ArrowPayload | Any, key: str = "measurements"
+) -> MeasurementTable:
+    """
+    The measurements under `key` of a bulk payload, as a `MeasurementTable`.
+    Arrow columns are converted to NumPy column by column, without going
+    through per-record dicts.
+    """
+    if not isinstance(payload, ArrowPayload):
+        return MeasurementTable.from_records(payload[key])
+
+    table = payload.tables.get(key)
+    if table is None:
+        return MeasurementTable.empty()
+
+    columns = {
+        name: table.column(name).to_numpy()
+        for name in table.column_names
+        if name != "galaxy"
+    }
+    if "galaxy" in table.column_names:
+        columns["galaxy_id"] = _galaxy_ids(table.column("galaxy"))
+    return MeasurementTable.from_columns(columns, table.num_rows)
+
+
+def _galaxy_ids(galaxies: "pa.ChunkedArray") -> np.ndarray:
+    galaxies = galaxies.combine_chunks()
+    # Rows without a galaxy are null structs, whose `id` may not be null
+    ids = pc.if_else(galaxies.is_valid(), galaxies.field("id"), 0)
+    ids = ids.fill_null(0).to_numpy()
+
+    # Only galaxies that are not shared yet need to be built
+    unique_ids, first_rows = np.unique(ids, return_index=True)
+    for galaxy_id, row in zip(unique_ids, first_rows):
+        if galaxy_id and GALAXY_POOL.get(galaxy_id) is None:
+            GALAXY_POOL.intern(galaxies[int(row)].as_py())
+    return ids
+
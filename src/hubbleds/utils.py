@@ -1,7 +1,7 @@
-from collections import defaultdict
 from astropy import units as u
 from astropy.modeling import models, fitting
-from numpy import argsort, array, pi
+from numpy import argsort, array, flatnonzero, nan, pi
+from os import getenv
 
 from cosmicds.utils import component_type_for_field, mode, percent_around_center_indices
 from pydantic import BaseModel
@@ -9,10 +9,11 @@ from pydantic import BaseModel
 from glue.core import Data
 from glue_jupyter.app import JupyterApplication
 from numbers import Number
-from typing import List, Set, Tuple, TypeVar, Optional, cast, Any
-from collections.abc import Callable
+from typing import List, Tuple, TypeVar, Optional, Any
+from collections.abc import Callable, Iterable
 from solara.toestand import Reactive
 
+from hubbleds.hubble_fit import GroupedHubbleFit, GroupedRegression, solve_line
 from hubbleds.state import StudentMeasurement
 from glue.core import Data
 from numpy import asarray
@@ -59,6 +60,9 @@ PLOTLY_MARGINS = {"l": 60, "r": 20, "t": 20, "b": 60}
 
 IMAGE_BASE_URL = "https://cosmicds.github.io/cds-website/hubbleds_images"
 
+# Fit lines with astropy's modeling rather than in closed form
+ASTROPY_FIT = getenv("HUBBLEDS_ASTROPY_FIT", "").lower() in ("1", "true", "yes")
+
 
 def angle_to_json(angle, _widget):
     return {"value": angle.value, "unit": angle.unit.name}
@@ -95,11 +99,39 @@ def age_in_gyr_simple(H0):
     return round(inv * mpc_to_km * s_to_gyr, 3)
 
 
-def fit_line(x, y):
+def fit_line(x, y, weights=None, intercept=False, use_astropy=ASTROPY_FIT):
+    """
+    Fits a line to the points (x, y), through the origin unless `intercept`
+    is True.
+
+    Parameters
+    ----------
+    x: Sequence[float]
+    y: Sequence[float]
+    weights: Sequence[float], optional
+        Weight of each point's residual (1 / sigma for Gaussian uncertainties)
+    intercept: bool
+        Whether to fit the intercept too
+    use_astropy: bool
+        Fit with astropy's `LinearLSQFitter` instead of the closed-form
+        solver, e.g. to validate it
+
+    Returns
+    ----------
+    line: LineFit | astropy.modeling.models.Linear1D | None
+        The fitted line, whose slope is `line.slope.value`, or None if it
+        could not be fit
+    """
+    if use_astropy:
+        return _astropy_fit_line(x, y, weights, intercept)
+    return solve_line(x, y, weights, intercept)
+
+
+def _astropy_fit_line(x, y, weights=None, intercept=False):
     try:
         fit = fitting.LinearLSQFitter()
-        line_init = models.Linear1D(intercept=0, fixed={"intercept": True})
-        fitted_line = fit(line_init, x, y)
+        line_init = models.Linear1D(intercept=0, fixed={"intercept": not intercept})
+        fitted_line = fit(line_init, x, y, weights=weights)
         return fitted_line
     except ValueError as e:
         print(e)
@@ -178,7 +210,7 @@ def models_to_glue_data(items: List[M],
 
 def create_single_summary(distances: List[Number], velocities: List[Number]) -> Tuple[float, float]:
     line = fit_line(distances, velocities)
-    h0 = line.slope.value
+    h0 = line.slope.value if line is not None else nan
     age = age_in_gyr_simple(h0)
     return h0, age
 
@@ -188,37 +220,75 @@ def make_summary_data(measurement_data: Data,
                       output_id_field: str | None=None,
                       label: str | None=None
 ) -> Data:
-    dists = defaultdict(list)
-    vels = defaultdict(list)
-    d = measurement_data["est_dist_value"]
-    v = measurement_data["velocity_value"]
-    ids: Set[int] = set()
-
-    for i in range(measurement_data.size):
-        id_num = measurement_data[input_id_field][i]
-        ids.add(id_num)
-        dist = d[i]
-        vel = v[i]
-        if dist is not None and vel is not None:
-            dists[id_num].append(dist)
-            vels[id_num].append(vel)
-
-    hubbles: List[float] = []
-    ages: List[float] = []
-    for id_num in ids:
-        h0, age = create_single_summary(dists[id_num], vels[id_num])
-        hubbles.append(h0)
-        ages.append(age)
-
-    data_kwargs: dict = { "hubble_fit_value": hubbles, "age_value": ages }
+    """
+    Fit the Hubble constant (and the implied age of the universe) for each
+    value of `input_id_field` in `measurement_data`. All groups are fit in
+    a single vectorized pass (see `GroupedHubbleFit`). Ids without a complete
+    measurement get a NaN Hubble constant and age.
+    """
+    fits = GroupedHubbleFit(
+        measurement_data[input_id_field],
+        measurement_data["est_dist_value"],
+        measurement_data["velocity_value"],
+    )
+
+    data_kwargs: dict = { "hubble_fit_value": fits.slopes, "age_value": fits.ages }
     output_id_field = output_id_field or input_id_field
-    data_kwargs[output_id_field] = list(ids)
+    data_kwargs[output_id_field] = fits.ids
 
     if label:
         data_kwargs["label"] = label
 
     return Data(**data_kwargs)
 
+def patch_summary_data(summary_data: Data,
+                       regression: GroupedRegression,
+                       groups: Iterable[Any],
+                       id_field: str = "id") -> bool:
+    """
+    Update the fits of `groups` in summary data (as made by
+    `make_summary_data`) in place from `regression`, so that changing a few
+    measurements does not refit every group.
+
+    Returns
+    ----------
+    patched: bool
+        False if one of the groups has no row in `summary_data`, in which
+        case the data is left untouched and has to be rebuilt
+    """
+    ids = summary_data[id_field]
+    hubbles = array(summary_data["hubble_fit_value"], dtype=float)
+    ages = array(summary_data["age_value"], dtype=float)
+    for group in groups:
+        rows = flatnonzero(ids == group)
+        if not len(rows):
+            return False
+        hubbles[rows] = regression.slope(group)
+        ages[rows] = regression.age(group)
+
+    summary_data.update_components({
+        summary_data.id["hubble_fit_value"]: hubbles,
+        summary_data.id["age_value"]: ages,
+    })
+    return True
+
+
+def regression_summary_data(regression: GroupedRegression,
+                            id_field: str = "id",
+                            label: str | None = None) -> Data:
+    """
+    Summary data like `make_summary_data` makes, from the sums kept by
+    `regression`.
+    """
+    ids, hubbles, ages = regression.fits()
+    data_kwargs: dict = {
+        "hubble_fit_value": hubbles, "age_value": ages, id_field: ids
+    }
+    if label:
+        data_kwargs["label"] = label
+    return Data(**data_kwargs)
+
+
 from typing import Generic
 A = TypeVar('A', Any, Any)
 B = TypeVar('B', Any, Any)
@@ -0,0 +1,239 @@
+import json
+from os import getenv
+from pathlib import Path
+import sqlite3
+from tempfile import gettempdir
+import threading
+import time
+from typing import Any, Iterable, NamedTuple, Optional
+
+from cosmicds.logger import setup_logger
+
+logger = setup_logger("WRITE-JOURNAL")
+
+# Location of the journal database. Set to an empty string to keep the
+#  journal in memory, so that pending writes are still replayed but do not
+#  survive a restart.
+WRITE_JOURNAL_PATH = getenv(
+    "HUBBLEDS_WRITE_JOURNAL",
+    (Path(gettempdir()) / "hubbleds" / "write-journal.sqlite3").as_posix(),
+)
+
+# How often (in seconds) journaled writes are replayed. The interval doubles
+#  after each failed replay, up to `REPLAY_INTERVAL_MAX`.
+REPLAY_INTERVAL = float(getenv("HUBBLEDS_JOURNAL_REPLAY_INTERVAL", 5))
+REPLAY_INTERVAL_MAX = 300.0
+
+# Maximum number of journaled writes replayed at once
+REPLAY_BATCH_SIZE = int(getenv("HUBBLEDS_JOURNAL_REPLAY_BATCH", 100))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    body TEXT NOT NULL,
+    context TEXT,
+    recorded_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class JournalEntry(NamedTuple):
+    """
+    A write that has not reached the backend yet.
+    """
+    seq: int
+    key: str
+    kind: str
+    method: str
+    url: str
+    body: str
+    context: Any
+    recorded_at: float
+    attempts: int
+
+
+class WriteJournal:
+    """
+    Append-only local journal of writes that could not be sent to the backend.
+
+    Each entry is a complete request (e.g. the full story state, or one
+    measurement row) recorded under a key naming what it writes. Recording a
+    key that is already journaled replaces the older entry, so only the
+    latest state of each record is replayed. Entries are replayed oldest
+    first, and are discarded once the backend accepts them, or once a newer
+    write of the same record succeeds.
+
+    The journal is a SQLite database, so that pending writes survive a
+    restart of the server. It may be used from any thread.
+
+    Parameters
+    ----------
+    path: str
+        Path of the database file, or an empty string to keep the journal in
+        memory
+    """
+
+    def __init__(self, path: str = WRITE_JOURNAL_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.recorded = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Caller must hold the lock
+        if self._connection is None:
+            if self.path:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                connection = sqlite3.connect(
+                    self.path, check_same_thread=False, timeout=10
+                )
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            else:
+                connection = sqlite3.connect(":memory:", check_same_thread=False)
+            connection.execute(_SCHEMA)
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def record(self, key: str, kind: str, method: str, url: str, body: str,
+               context: Any = None):
+        """
+        Journal a write, replacing any pending write under the same key.
+
+        Parameters
+        ----------
+        key: str
+            Name of the record being written
+        kind: str
+            Type of the write (e.g. "story-state"), used when replaying it
+        method: str
+        url: str
+        body: str
+            JSON body of the request
+        context: Any
+            JSON-serializable details needed when the write is replayed
+        """
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO writes "
+                    "(key, kind, method, url, body, context, recorded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, method, url, body, json.dumps(context), time.time()),
+                )
+            self.recorded += 1
+
+    def discard(self, keys: Iterable[str]):
+        """
+        Forget the pending writes under `keys`, which have been superseded by
+        writes that reached the backend.
+        """
+        keys = [(key,) for key in keys]
+        if not keys:
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("DELETE FROM writes WHERE key = ?", keys)
+
+    def pending(self, limit: int = REPLAY_BATCH_SIZE) -> list[JournalEntry]:
+        """
+        The oldest `limit` pending writes.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT seq, key, kind, method, url, body, context, recorded_at, "
+                "attempts FROM writes ORDER BY seq LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            JournalEntry(*row[:6], json.loads(row[6]) if row[6] else None, *row[7:])
+            for row in rows
+        ]
+
+    def current(self, entries: Iterable[JournalEntry]) -> list[JournalEntry]:
+        """
+        The `entries` that are still pending as they were read, i.e. that
+        have been neither discarded nor replaced by a newer write since.
+        """
+        entries = list(entries)
+        if not entries:
+            return []
+        with self._lock:
+            connection = self._connect()
+            pending = set()
+            for entry in entries:
+                row = connection.execute(
+                    "SELECT 1 FROM writes WHERE key = ? AND seq = ?",
+                    (entry.key, entry.seq),
+                ).fetchone()
+                if row is not None:
+                    pending.add(entry.seq)
+        return [entry for entry in entries if entry.seq in pending]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+
+    def replayed_entries(self, entries: Iterable[JournalEntry], accepted: bool = True):
+        """
+        Remove replayed entries, unless a newer write of the same record has
+        been journaled in the meantime. Entries the backend rejected
+        (`accepted=False`) are removed all the same, since replaying them
+        again would not help.
+        """
+        entries = [(entry.key, entry.seq) for entry in entries]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                removed = connection.executemany(
+                    "DELETE FROM writes WHERE key = ? AND seq = ?", entries
+                ).rowcount
+            if accepted:
+                self.replayed += removed
+            else:
+                self.dropped += removed
+
+    def attempted(self, entries: Iterable[JournalEntry]):
+        """
+        Count a failed replay of `entries`.
+        """
+        seqs = [(entry.seq,) for entry in entries]
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "UPDATE writes SET attempts = attempts + 1 WHERE seq = ?", seqs
+                )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            pending, oldest = self._connect().execute(
+                "SELECT COUNT(*), MIN(recorded_at) FROM writes"
+            ).fetchone()
+            return {
+                "pending": pending,
+                "oldest_age": time.time() - oldest if oldest is not None else None,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+WRITE_JOURNAL = WriteJournal()
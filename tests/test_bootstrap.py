@@ -0,0 +1,68 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from hubbleds.bootstrap import bootstrap_hubble_fit
+
+H0 = 70.0
+
+
+def make_class(rng, students=30, per_student=5, noise=1500.0):
+    """
+    A class whose measurements scatter around a line of known slope `H0`.
+    """
+    rows = students * per_student
+    distances = rng.uniform(10, 400, rows)
+    velocities = H0 * distances + rng.normal(0, noise, rows)
+    return np.arange(students).repeat(per_student), distances, velocities
+
+
+@pytest.mark.parametrize("resample", ["students", "galaxies"])
+def test_interval_coverage(resample):
+    rng = np.random.default_rng(1)
+    trials = 200
+    covered = 0
+    for trial in range(trials):
+        ids, distances, velocities = make_class(rng)
+        result = bootstrap_hubble_fit(ids, distances, velocities,
+                                      n_resamples=1000, resample=resample, seed=trial)
+        low, high = result.interval(0.95)
+        covered += low <= H0 <= high
+    assert 0.88 <= covered / trials <= 0.99
+
+
+def test_same_seed_same_result():
+    ids, distances, velocities = make_class(np.random.default_rng(2))
+    a = bootstrap_hubble_fit(ids, distances, velocities, n_resamples=500, seed=3)
+    b = bootstrap_hubble_fit(ids, distances, velocities, n_resamples=500, seed=3)
+    np.testing.assert_array_equal(a.samples, b.samples)
+    assert a.interval() == b.interval()
+
+
+def test_zero_distances_are_nan():
+    ids = np.arange(10).repeat(3)
+    distances = np.zeros(30)
+    velocities = np.ones(30)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = bootstrap_hubble_fit(ids, distances, velocities, n_resamples=100)
+        assert np.isnan(result.h0)
+        assert np.isnan(result.age)
+        assert result.degenerate == 100
+        assert np.isnan(result.interval()).all()
+
+
+def test_degenerate_resamples_are_left_out():
+    # Only the first student has a nonzero distance, so every resample that
+    #  misses them has no fit
+    ids = np.arange(3).repeat(2)
+    distances = np.array([100.0, 200.0, 0, 0, 0, 0])
+    velocities = H0 * distances
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = bootstrap_hubble_fit(ids, distances, velocities, n_resamples=1000)
+    assert result.h0 == pytest.approx(H0)
+    assert 0 < result.degenerate < len(result)
+    assert result.interval() == pytest.approx((H0, H0))
+    assert result.summary()["degenerate"] == result.degenerate
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("requests")
+pytest.importorskip("cosmicds")
+
+from hubbleds.http_cache import (  # noqa: E402
+    AsyncCachingTransport,
+    CachePolicy,
+    HTTPCache,
+)
+
+GALAXIES = "https://api/hubbles_law/galaxies"
+SPECTRUM = "https://api/spectra/hubbles_law/galaxy.fits"
+ETAG = '"v1"'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HTTPCache(tmp_path, policies={
+        "galaxies": CachePolicy(r"/galaxies$"),
+        "spectra": CachePolicy(r"/spectra/", max_age=60),
+    })
+
+
+def store(cache, url, body, headers=None):
+    lookup = cache.prepare("GET", url, {})
+    cache.store(lookup, 200, headers if headers is not None else {"ETag": ETAG}, body)
+
+
+def test_only_cacheable_requests_are_looked_up(cache):
+    assert cache.prepare("POST", GALAXIES, {}) is None
+    assert cache.prepare("GET", "https://api/hubbles_law/all-data", {}) is None
+    assert cache.prepare("GET", GALAXIES, {"If-None-Match": ETAG}) is None
+    assert cache.prepare("GET", GALAXIES, {}) is not None
+
+
+def test_stored_response_is_revalidated(cache):
+    store(cache, GALAXIES, b"galaxies")
+    lookup = cache.prepare("GET", GALAXIES, {})
+    assert not lookup.fresh
+    assert lookup.entry.validators() == {"If-None-Match": ETAG}
+
+    headers, body = cache.revalidated(lookup, {"ETag": ETAG, "X-Version": "2"})
+    assert body == b"galaxies"
+    assert headers["X-Version"] == "2"
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_responses_without_validators_are_not_stored(cache):
+    store(cache, GALAXIES, b"galaxies", headers={})
+    assert cache.prepare("GET", GALAXIES, {}).entry is None
+
+
+def test_fresh_response_is_served_without_request(cache):
+    store(cache, SPECTRUM, b"spectrum", headers={})
+    lookup = cache.prepare("GET", SPECTRUM, {})
+    assert lookup.fresh
+    assert cache.cached(lookup) == ({}, b"spectrum")
+    assert cache.stats()["hits"] == 1
+
+
+def test_responses_are_keyed_by_format(cache):
+    store(cache, GALAXIES, b"galaxies")
+    accept = {"Accept": "application/vnd.apache.arrow.stream"}
+    assert cache.prepare("GET", GALAXIES, accept).entry is None
+
+
+def test_stored_response_is_served_when_backend_fails(cache):
+    store(cache, GALAXIES, b"galaxies")
+    lookup = cache.prepare("GET", GALAXIES, {})
+    assert cache.stale(lookup)[1] == b"galaxies"
+    assert cache.stats()["stale"] == 1
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = HTTPCache(tmp_path, max_bytes=10, policies={
+        "spectra": CachePolicy(r"/spectra/", max_age=60),
+    })
+    urls = [f"https://api/spectra/{name}.fits" for name in "abc"]
+    store(cache, urls[0], b"aaaa")
+    store(cache, urls[1], b"bbbb")
+    # Using `a` makes `b` the least recently used
+    cache.prepare("GET", urls[0], {})
+    store(cache, urls[2], b"cccc")
+
+    assert cache.prepare("GET", urls[1], {}).entry is None
+    assert cache.prepare("GET", urls[0], {}).entry is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["nbytes"] == 8
+    assert len(list(tmp_path.glob("*.body"))) == 2
+
+
+def test_stored_responses_are_shared_between_instances(cache, tmp_path):
+    store(cache, GALAXIES, b"galaxies")
+    other = HTTPCache(tmp_path, policies=cache.policies)
+    lookup = other.prepare("GET", GALAXIES, {})
+    assert other.revalidated(lookup, {})[1] == b"galaxies"
+
+
+def get(transport, url=GALAXIES):
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get(url)
+    return asyncio.run(main())
+
+
+def test_transport_revalidates_with_conditional_request(cache):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == ETAG:
+            return httpx.Response(304, headers={"ETag": ETAG})
+        return httpx.Response(200, headers={"ETag": ETAG}, content=b"galaxies")
+
+    transport = AsyncCachingTransport(cache, httpx.MockTransport(handler))
+    first, second = get(transport), get(transport)
+
+    assert seen == [None, ETAG]
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content == b"galaxies"
+
+
+def test_transport_serves_stored_response_on_server_error(cache):
+    responses = iter([
+        httpx.Response(200, headers={"ETag": ETAG}, content=b"galaxies"),
+        httpx.Response(503),
+    ])
+    transport = AsyncCachingTransport(
+        cache, httpx.MockTransport(lambda request: next(responses))
+    )
+    get(transport)
+    response = get(transport)
+    assert response.status_code == 200
+    assert response.content == b"galaxies"
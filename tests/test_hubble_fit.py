@@ -0,0 +1,228 @@
+import numpy as np
+import pytest
+
+from hubbleds.hubble_fit import (
+    GroupedHubbleFit,
+    GroupedRegression,
+    RunningRange,
+    solve_line,
+)
+
+
+def test_group_without_complete_measurement_is_nan():
+    ids = [1, 1, 2, 2, 3]
+    distances = [100.0, 200.0, None, np.nan, 50.0]
+    velocities = [7000.0, 14000.0, 5000.0, 6000.0, None]
+    fits = GroupedHubbleFit(ids, distances, velocities)
+
+    np.testing.assert_array_equal(fits.ids, [1, 2, 3])
+    np.testing.assert_array_equal(fits.counts, [2, 0, 0])
+    assert fits.slopes[0] == pytest.approx(70.0)
+    assert np.isnan(fits.slopes[1:]).all()
+    assert np.isnan(fits.ages[1:]).all()
+
+
+def test_missing_ids_are_ignored():
+    fits = GroupedHubbleFit([1.0, np.nan], [100.0, 100.0], [7000.0, 9000.0])
+    np.testing.assert_array_equal(fits.ids, [1.0])
+    assert fits.slopes[0] == pytest.approx(70.0)
+
+
+def test_regression_fits_keep_incomplete_groups():
+    regression = GroupedRegression.from_columns(
+        keys=["a", "b", "c"],
+        groups=[1, 2, 2],
+        x=[100.0, None, np.nan],
+        y=[7000.0, 5000.0, 6000.0],
+    )
+    groups, slopes, ages = regression.fits()
+    np.testing.assert_array_equal(groups, [1, 2])
+    assert slopes[0] == pytest.approx(70.0)
+    assert np.isnan(slopes[1]) and np.isnan(ages[1])
+
+
+def test_make_summary_data_keeps_incomplete_ids():
+    pytest.importorskip("glue")
+    from glue.core import Data
+
+    from hubbleds.utils import make_summary_data
+
+    data = Data(
+        student_id=[1, 1, 2],
+        est_dist_value=[100.0, 200.0, np.nan],
+        velocity_value=[7000.0, 14000.0, 5000.0],
+        label="Class Data",
+    )
+    summary = make_summary_data(data, input_id_field="student_id", output_id_field="id")
+    np.testing.assert_array_equal(summary["id"], [1, 2])
+    assert summary["hubble_fit_value"][0] == pytest.approx(70.0)
+    assert np.isnan(summary["hubble_fit_value"][1])
+    assert np.isnan(summary["age_value"][1])
+
+
+def test_running_range_follows_changes():
+    rng = np.random.default_rng(4)
+    values = dict(enumerate(rng.uniform(5, 20, 50)))
+    value_range = RunningRange.from_columns(values.keys(), list(values.values()))
+    for _ in range(500):
+        key = int(rng.integers(60))
+        value = None if rng.random() < 0.1 else float(rng.uniform(0, 25))
+        value_range.set(key, value)
+        if value is None:
+            values.pop(key, None)
+        else:
+            values[key] = value
+        assert len(value_range) == len(values)
+        assert value_range.low == min(values.values())
+        assert value_range.high == max(values.values())
+
+
+def test_empty_running_range_is_nan():
+    value_range = RunningRange.from_columns([1, 2], [np.nan, 3.0])
+    value_range.remove(2)
+    assert len(value_range) == 0
+    assert np.isnan(value_range.low) and np.isnan(value_range.high)
+
+
+def make_measurements(rng, students=20, per_student=5):
+    ids = np.arange(students).repeat(per_student)
+    distances = rng.uniform(10, 400, len(ids))
+    velocities = 70.0 * distances + rng.normal(0, 1500.0, len(ids))
+    return ids, distances, velocities
+
+
+def test_grouped_fit_matches_per_group_least_squares():
+    ids, distances, velocities = make_measurements(np.random.default_rng(5))
+    fits = GroupedHubbleFit(ids, distances, velocities)
+    for index, student in enumerate(fits.ids):
+        group = ids == student
+        x, y = distances[group], velocities[group]
+        slope = np.linalg.lstsq(x[:, None], y, rcond=None)[0][0]
+        assert fits.slopes[index] == pytest.approx(slope, rel=1e-12)
+        rms = np.sqrt(np.mean((y - slope * x) ** 2))
+        assert fits.rms[index] == pytest.approx(rms, rel=1e-9)
+
+
+def test_grouped_fit_matches_astropy_fit():
+    pytest.importorskip("astropy")
+    from astropy.modeling import fitting, models
+
+    ids, distances, velocities = make_measurements(np.random.default_rng(6))
+    fits = GroupedHubbleFit(ids, distances, velocities)
+    for index, student in enumerate(fits.ids):
+        group = ids == student
+        # `utils.fit_line` as it was before the closed-form fits
+        line_init = models.Linear1D(intercept=0, fixed={"intercept": True})
+        line = fitting.LinearLSQFitter()(line_init, distances[group], velocities[group])
+        assert fits.slopes[index] == pytest.approx(line.slope.value, rel=1e-9)
+
+
+@pytest.mark.parametrize("intercept", [False, True])
+@pytest.mark.parametrize("weighted", [False, True])
+def test_solve_line_matches_least_squares(intercept, weighted):
+    rng = np.random.default_rng(7)
+    x = rng.uniform(10, 400, 40)
+    y = 70.0 * x + 300.0 + rng.normal(0, 1500.0, 40)
+    weights = rng.uniform(0.5, 2.0, 40) if weighted else np.ones(40)
+
+    design = np.column_stack([x, np.ones(40)]) if intercept else x[:, None]
+    expected = np.linalg.lstsq(
+        design * weights[:, None], y * weights, rcond=None
+    )[0]
+
+    line = solve_line(x, y, weights if weighted else None, intercept=intercept)
+    assert line.slope.value == pytest.approx(expected[0], rel=1e-10)
+    if intercept:
+        assert line.intercept.value == pytest.approx(expected[1], rel=1e-8)
+    else:
+        assert line.intercept.value == 0
+    assert line(100.0) == pytest.approx(line.slope.value * 100 + line.intercept.value)
+
+
+def test_solve_line_ignores_incomplete_points():
+    line = solve_line([100.0, None, np.nan, 200.0], [7000.0, 1.0, 2.0, 14000.0])
+    assert line.slope.value == pytest.approx(70.0)
+
+
+@pytest.mark.parametrize("x, y, intercept", [
+    ([], [], False),
+    ([0.0, 0.0], [1.0, 2.0], False),
+    ([5.0], [1.0], True),
+    ([5.0, 5.0], [1.0, 2.0], True),
+])
+def test_solve_line_without_enough_points_is_none(x, y, intercept):
+    assert solve_line(x, y, intercept=intercept) is None
+
+
+@pytest.mark.parametrize("intercept", [False, True])
+def test_solve_line_matches_astropy_fit(intercept):
+    pytest.importorskip("astropy")
+    from astropy.modeling import fitting, models
+
+    rng = np.random.default_rng(8)
+    x = rng.uniform(10, 400, 40)
+    y = 70.0 * x + rng.normal(0, 1500.0, 40)
+    weights = rng.uniform(0.5, 2.0, 40)
+
+    line_init = models.Linear1D(intercept=0, fixed={"intercept": not intercept})
+    expected = fitting.LinearLSQFitter()(line_init, x, y, weights=weights)
+    line = solve_line(x, y, weights, intercept=intercept)
+    assert line.slope.value == pytest.approx(expected.slope.value, rel=1e-9)
+    assert line.intercept.value == pytest.approx(
+        expected.intercept.value, rel=1e-6, abs=1e-6
+    )
+
+
+def test_regression_follows_changes():
+    rng = np.random.default_rng(9)
+    points = {}
+    regression = GroupedRegression()
+    for _ in range(500):
+        key = int(rng.integers(40))
+        action = rng.random()
+        if action < 0.15 and key in points:
+            regression.remove(key)
+            del points[key]
+            continue
+
+        x = None if rng.random() < 0.1 else float(rng.uniform(10, 400))
+        y = float(70.0 * (x or 0) + rng.normal(0, 1500.0))
+        if action < 0.5 and key in points:
+            regression.update(key, x, y)
+            points[key] = (points[key][0], x, y)
+        else:
+            group = int(rng.integers(5))
+            regression.add(key, group, x, y)
+            points[key] = (group, x, y)
+
+    assert len(regression) == len(points)
+    groups, x, y = zip(*points.values())
+    expected = GroupedHubbleFit(groups, x, y)
+    fit_groups, slopes, ages = regression.fits()
+    np.testing.assert_array_equal(fit_groups, expected.ids)
+    np.testing.assert_allclose(slopes, expected.slopes, rtol=1e-9)
+    np.testing.assert_allclose(ages, expected.ages, rtol=1e-6)
+
+
+def test_readding_a_key_moves_its_point():
+    regression = GroupedRegression()
+    regression.add("a", 1, 100.0, 7000.0)
+    regression.add("b", 1, 100.0, 8000.0)
+    regression.add("a", 2, 100.0, 6000.0)
+
+    assert regression.slope(1) == pytest.approx(80.0)
+    assert regression.slope(2) == pytest.approx(60.0)
+    assert regression.sums(1).n == 1
+
+
+def test_removing_every_point_leaves_a_nan_fit():
+    regression = GroupedRegression()
+    regression.add("a", 1, 100.0, 7000.0)
+    regression.add("b", 1, 200.0, 14000.0)
+    regression.remove("a")
+    regression.remove("b")
+
+    assert 1 in regression
+    assert regression.sums(1).sxx == 0
+    assert np.isnan(regression.slope(1))
+    assert regression.fits()[0].size == 0
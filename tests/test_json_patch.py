@@ -0,0 +1,44 @@
+import pytest
+
+from hubbleds.json_patch import apply_patch, document_version, make_patch
+
+
+@pytest.mark.parametrize("old, new", [
+    ({"a": 1, "b": {"c": [1, 2]}}, {"a": 1, "b": {"c": [1, 2, 3]}}),
+    ({"a": 1, "b": 2}, {"b": 2, "d": {"e": None}}),
+    ({"a/b": 1, "m~n": 2}, {"a/b": 3}),
+    ({"a": 1}, {"a": 1.0}),
+    ({"a": True}, {"a": 1}),
+    ({"a": {"b": 1}}, {"a": [1]}),
+    ([1, 2], {"a": 1}),
+    ({}, {}),
+])
+def test_patch_round_trips(old, new):
+    patch = make_patch(old, new)
+    patched = apply_patch(old, patch)
+    assert patched == new
+    assert document_version(patched) == document_version(new)
+
+
+def test_unchanged_document_has_empty_patch():
+    document = {"app": {"id": 1}, "story": {"stage": "1", "values": [1, 2]}}
+    assert make_patch(document, dict(document)) == []
+
+
+def test_patch_only_touches_changed_keys():
+    old = {"app": {"id": 1}, "story": {"stage": "1", "step": 2}}
+    new = {"app": {"id": 1}, "story": {"stage": "1", "step": 3}}
+    assert make_patch(old, new) == [
+        {"op": "replace", "path": "/story/step", "value": 3}
+    ]
+
+
+def test_apply_patch_leaves_document_unchanged():
+    old = {"a": {"b": 1}}
+    apply_patch(old, make_patch(old, {"a": {"b": 2}}))
+    assert old == {"a": {"b": 1}}
+
+
+def test_apply_patch_rejects_unknown_operations():
+    with pytest.raises(ValueError):
+        apply_patch({"a": 1}, [{"op": "move", "from": "/a", "path": "/b"}])
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("glue")
+pytest.importorskip("solara")
+pytest.importorskip("cosmicds")
+
+from hubbleds.measurement_table import (  # noqa: E402
+    MeasurementTable,
+    MeasurementTableBuilder,
+)
+from hubbleds.state import StudentMeasurement  # noqa: E402
+
+
+def galaxy(galaxy_id):
+    return {
+        "id": galaxy_id,
+        "name": f"galaxy-{galaxy_id}",
+        "ra": 10.0 + galaxy_id,
+        "decl": -5.0,
+        "z": 0.01 * galaxy_id,
+        "type": "Sp",
+        "element": "H-α",
+    }
+
+
+RECORDS = [
+    {
+        "student_id": 1,
+        "class_id": 7,
+        "obs_wave_value": 6700.5,
+        "velocity_value": 8000.0,
+        "est_dist_value": 110.0,
+        "measurement_number": "first",
+        "galaxy": galaxy(101),
+    },
+    {
+        "student_id": 1,
+        "class_id": None,
+        "velocity_value": 9500.0,
+        "measurement_number": "second",
+        "galaxy": galaxy(102),
+    },
+    {"student_id": 2, "galaxy_id": 101, "est_dist_value": 95.0},
+    {"student_id": 3},
+]
+
+COLUMNS = ["student_id", "class_id", "galaxy_id", "velocity_value", "est_dist_value"]
+
+
+def assert_same_table(a, b):
+    assert len(a) == len(b)
+    for name in a.column_names:
+        if name == "galaxy":
+            continue
+        np.testing.assert_array_equal(a.column(name), b.column(name))
+
+
+def test_records_round_trip_through_models():
+    table = MeasurementTable.from_records(RECORDS)
+    models = table.to_models()
+
+    expected = [StudentMeasurement(**record) for record in RECORDS]
+    assert [m.model_dump() for m in models] == [m.model_dump() for m in expected]
+    assert models[1].class_id is None
+    assert models[0].galaxy is models[2].galaxy
+    assert models[3].galaxy is None
+
+
+def test_models_round_trip_through_table():
+    table = MeasurementTable.from_records(RECORDS)
+    assert_same_table(MeasurementTable.from_models(table.to_models()), table)
+
+
+def test_missing_values_are_nan():
+    table = MeasurementTable.from_records(RECORDS)
+    assert np.isnan(table.column("class_id")[1])
+    assert np.isnan(table.column("est_dist_value")[1])
+    assert table.values("est_dist_value") == [110.0, None, 95.0, None]
+    assert table.values("velocity_unit") == ["km / s"] * 4
+    np.testing.assert_array_equal(table.column("galaxy_id"), [101, 102, 101, 0])
+
+
+def test_builder_matches_from_records():
+    builder = MeasurementTableBuilder(chunk_size=3)
+    for record in RECORDS:
+        builder.append(record)
+    assert len(builder) == len(RECORDS)
+    assert_same_table(builder.build(), MeasurementTable.from_records(RECORDS))
+    assert len(builder) == 0
+
+
+def test_columns_round_trip():
+    table = MeasurementTable.from_records(RECORDS)
+    columns = {name: table.column(name) for name in COLUMNS}
+    rebuilt = MeasurementTable.from_columns(columns, len(table))
+    for name in COLUMNS:
+        np.testing.assert_array_equal(rebuilt.column(name), table.column(name))
+    # Columns that were not given take the field defaults
+    assert rebuilt.values("est_dist_unit") == ["Mpc"] * len(table)
+    assert rebuilt.values("obs_wave_value") == [None] * len(table)
+
+
+def test_filtering_and_grouping():
+    table = MeasurementTable.from_records(RECORDS)
+    assert len(table.for_students([1])) == 2
+    assert len(table.for_classes([7])) == 1
+    assert table.complete().values("student_id") == [1]
+
+    groups = table.group_by("student_id")
+    assert sorted(groups) == [1, 2, 3]
+    assert groups[1].values("measurement_number") == ["first", "second"]
+
+    joined = MeasurementTable.concatenate(list(groups.values()))
+    assert sorted(joined.values("student_id")) == [1, 1, 2, 3]
+    assert len(MeasurementTable.concatenate([])) == 0
+
+
+def test_with_values_sets_a_column():
+    table = MeasurementTable.from_records(RECORDS).with_values(class_id=9)
+    np.testing.assert_array_equal(table.column("class_id"), [9, 9, 9, 9])
+    with pytest.raises(ValueError):
+        table.with_values(galaxy=None)
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("solara")
+pytest.importorskip("cosmicds")
+
+from hubbleds.persistence import PersistenceScheduler  # noqa: E402
+
+DEBOUNCE = 0.1
+
+
+class Recorder:
+    """
+    Makes writers that record which of them ran.
+    """
+
+    def __init__(self):
+        self.written = []
+
+    def writer(self, name, stored=True):
+        async def write():
+            self.written.append(name)
+            return stored
+        return write
+
+
+async def start(scheduler):
+    task = asyncio.ensure_future(scheduler.run())
+    # Let `run` set up its loop and wake event
+    await asyncio.sleep(0)
+    return task
+
+
+async def stop(task):
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def test_requests_are_debounced_into_one_write():
+    scheduler = PersistenceScheduler(debounce=DEBOUNCE, max_delay=10)
+    recorder = Recorder()
+
+    async def main():
+        task = await start(scheduler)
+        for version in range(3):
+            scheduler.request("story-state", recorder.writer(version))
+            await asyncio.sleep(DEBOUNCE / 4)
+        assert recorder.written == []
+        await asyncio.sleep(2 * DEBOUNCE)
+        await stop(task)
+
+    asyncio.run(main())
+    assert recorder.written == [2]
+    stats = scheduler.stats()
+    assert stats["requests"] == 3
+    assert stats["coalesced"] == 2
+    assert stats["writes"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_different_keys_are_written_separately():
+    scheduler = PersistenceScheduler(debounce=DEBOUNCE, max_delay=10)
+    recorder = Recorder()
+
+    async def main():
+        task = await start(scheduler)
+        scheduler.request("story-state", recorder.writer("story"))
+        scheduler.request("measurements", recorder.writer("measurements"))
+        await asyncio.sleep(2 * DEBOUNCE)
+        await stop(task)
+
+    asyncio.run(main())
+    assert sorted(recorder.written) == ["measurements", "story"]
+
+
+def test_steady_requests_are_written_after_max_delay():
+    scheduler = PersistenceScheduler(debounce=DEBOUNCE, max_delay=3 * DEBOUNCE)
+    recorder = Recorder()
+
+    async def main():
+        task = await start(scheduler)
+        for version in range(12):
+            scheduler.request("story-state", recorder.writer(version))
+            await asyncio.sleep(DEBOUNCE / 2)
+        await stop(task)
+
+    asyncio.run(main())
+    # Without the bound, nothing would be written until the requests stop
+    assert len(recorder.written) >= 1
+    assert recorder.written[0] < 11
+
+
+def test_requested_flush_writes_immediately():
+    scheduler = PersistenceScheduler(debounce=10, max_delay=10)
+    recorder = Recorder()
+
+    async def main():
+        task = await start(scheduler)
+        scheduler.request("story-state", recorder.writer("story"))
+        scheduler.request_flush()
+        await asyncio.sleep(0.05)
+        assert recorder.written == ["story"]
+        await stop(task)
+
+    asyncio.run(main())
+
+
+def test_pending_writes_are_flushed_on_disconnect():
+    scheduler = PersistenceScheduler(debounce=10, max_delay=10)
+    recorder = Recorder()
+
+    async def main():
+        task = await start(scheduler)
+        scheduler.request("story-state", recorder.writer("story"))
+        scheduler.request("measurements", recorder.writer("measurements"))
+        await asyncio.sleep(0.01)
+        assert recorder.written == []
+        await stop(task)
+
+    asyncio.run(main())
+    assert sorted(recorder.written) == ["measurements", "story"]
+    assert scheduler.queue_depth == 0
+
+
+def test_failed_writes_are_counted():
+    scheduler = PersistenceScheduler(debounce=DEBOUNCE, max_delay=10)
+    recorder = Recorder()
+
+    async def fail():
+        raise ConnectionError("backend down")
+
+    async def main():
+        scheduler.request("story-state", recorder.writer("story", stored=False))
+        scheduler.request("measurements", fail)
+        return await scheduler.flush()
+
+    assert asyncio.run(main()) is False
+    stats = scheduler.stats()
+    assert stats["writes"] == 2
+    assert stats["failures"] == 2
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("requests")
+
+from hubbleds.remote import LocalAPI  # noqa: E402
+from hubbleds.transport import JSON  # noqa: E402
+
+STUDENTS = 8
+
+
+class SlowSession:
+    """
+    Stands in for the API's requests session, counting GETs. Each one takes
+    long enough for every concurrent caller to be waiting on it.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        with self._lock:
+            self.urls.append(url)
+        time.sleep(0.2)
+        return SimpleNamespace(
+            headers={"Content-Type": JSON},
+            content=json.dumps({"measurements": []}).encode(),
+            raise_for_status=lambda: None,
+        )
+
+
+def states(student_id, class_id=7):
+    global_state = SimpleNamespace(value=SimpleNamespace(
+        student=SimpleNamespace(id=student_id),
+        classroom=SimpleNamespace(class_info={"id": class_id}),
+    ))
+    local_state = SimpleNamespace(value=SimpleNamespace(story_id="hubbles_law"))
+    return global_state, local_state
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = LocalAPI()
+    api.__dict__["request_session"] = SlowSession()
+    monkeypatch.setattr(
+        api, "_set_class_measurements", lambda measurements, _: measurements
+    )
+    return api
+
+
+def fetch_concurrently(api, student_states):
+    results = [None] * len(student_states)
+    barrier = threading.Barrier(len(student_states))
+
+    def fetch(index):
+        barrier.wait()
+        results[index] = api.get_class_measurements(*student_states[index])
+
+    threads = [
+        threading.Thread(target=fetch, args=(i,)) for i in range(len(student_states))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_class_measurements_are_fetched_once_per_class(api):
+    results = fetch_concurrently(api, [states(student) for student in range(STUDENTS)])
+    assert len(api.request_session.urls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_class_measurements_of_different_classes_are_not_shared(api):
+    fetch_concurrently(api, [states(1, class_id=7), states(2, class_id=8)])
+    assert len(api.request_session.urls) == 2
@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("requests")
+pytest.importorskip("cosmicds")
+
+from hubbleds.resilience import (  # noqa: E402
+    AsyncResilientTransport,
+    BackendMetrics,
+    BackendUnavailable,
+    CircuitBreaker,
+    LastGood,
+)
+
+RESET = 0.05
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["opened"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET)
+    open_breaker(breaker)
+    time.sleep(2 * RESET)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET)
+    open_breaker(breaker)
+    time.sleep(2 * RESET)
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=RESET)
+    open_breaker(breaker)
+    time.sleep(2 * RESET)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_stale_probe_does_not_block_new_probes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET)
+    open_breaker(breaker)
+    time.sleep(2 * RESET)
+    assert breaker.allow()
+
+    # The probe never reports back
+    time.sleep(2 * RESET)
+    assert breaker.allow()
+
+
+def transport(handler, breaker, retries=2):
+    return AsyncResilientTransport(
+        httpx.MockTransport(handler), breaker, BackendMetrics(), retries
+    )
+
+
+def send(transport, method="GET"):
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.request(method, "https://api/hubbles_law/all-data")
+    return asyncio.run(main())
+
+
+def test_gets_are_retried(monkeypatch):
+    monkeypatch.setattr("hubbleds.resilience.retry_delay", lambda attempt: 0)
+    statuses = iter([503, 502, 200])
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(next(statuses))
+
+    breaker = CircuitBreaker(failure_threshold=5)
+    response = send(transport(handler, breaker))
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_writes_are_not_retried(monkeypatch):
+    monkeypatch.setattr("hubbleds.resilience.retry_delay", lambda attempt: 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    response = send(transport(handler, CircuitBreaker()), method="PUT")
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_requests_fast():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200)
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    open_breaker(breaker)
+    with pytest.raises(BackendUnavailable):
+        send(transport(handler, breaker))
+    assert calls == []
+
+
+def test_not_implemented_does_not_count_as_failure():
+    breaker = CircuitBreaker(failure_threshold=1)
+    response = send(transport(lambda request: httpx.Response(501), breaker))
+    assert response.status_code == 501
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def failing(error):
+    def func():
+        raise error
+    return func
+
+
+def test_last_good_result_is_served_on_backend_failure():
+    last_good = LastGood()
+    assert last_good.wrap("key", lambda: "value")() == "value"
+    assert last_good.wrap("key", failing(ConnectionError()))() == "value"
+    assert last_good.served == 1
+
+
+def test_last_good_result_is_not_served_for_request_errors():
+    last_good = LastGood()
+    last_good.wrap("key", lambda: "value")()
+    with pytest.raises(ValueError):
+        last_good.wrap("key", failing(ValueError()))()
+
+
+def test_last_good_results_expire():
+    last_good = LastGood(max_age=RESET)
+    last_good.wrap("key", lambda: "value")()
+    time.sleep(2 * RESET)
+    with pytest.raises(ConnectionError):
+        last_good.wrap("key", failing(ConnectionError()))()
+
+
+def test_last_good_keeps_most_recent_results():
+    last_good = LastGood(max_entries=2)
+    for key in ("a", "b", "c"):
+        last_good.wrap(key, lambda: key)()
+    with pytest.raises(ConnectionError):
+        last_good.wrap("a", failing(ConnectionError()))()
+    assert last_good.wrap("c", failing(ConnectionError()))() == "c"
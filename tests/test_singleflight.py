@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from hubbleds.singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def call_concurrently(flight, key, func, callers=CALLERS, ttl=0):
+    results = [None] * callers
+    errors = [None] * callers
+    barrier = threading.Barrier(callers)
+
+    def call(index):
+        barrier.wait()
+        try:
+            results[index] = flight.do(key, func, ttl)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def slow(value, delay=0.2):
+    def func():
+        time.sleep(delay)
+        return value
+    return func
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    value = object()
+    results, errors = call_concurrently(flight, "key", slow(value))
+
+    assert errors == [None] * CALLERS
+    assert all(result is value for result in results)
+    stats = flight.stats()
+    assert stats["executions"] == 1
+    assert stats["deduplicated"] == CALLERS - 1
+    assert stats["in_flight"] == 0
+
+
+def test_different_keys_are_not_shared():
+    flight = SingleFlight()
+    flight.do("a", lambda: 1)
+    flight.do("b", lambda: 2)
+    assert flight.stats()["executions"] == 2
+
+
+def test_errors_are_shared_and_not_kept():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("backend down")
+
+    _, errors = call_concurrently(flight, "key", fail, ttl=60)
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats()["executions"] == 1
+
+    assert flight.do("key", lambda: "recovered", 60) == "recovered"
+    assert flight.stats()["executions"] == 2
+
+
+def test_results_are_kept_for_their_ttl():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1, ttl=60) == 1
+    assert flight.do("key", lambda: 2, ttl=60) == 1
+    assert flight.stats()["cache_hits"] == 1
+
+    flight.forget("key")
+    assert flight.do("key", lambda: 3, ttl=60) == 3
+
+
+def test_results_without_ttl_are_not_kept():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats()["results"] == 0
+
+
+def test_expired_results_are_dropped():
+    flight = SingleFlight()
+    flight.do("key", lambda: 1, ttl=0.05)
+    time.sleep(0.1)
+    assert flight.do("key", lambda: 2, ttl=0.05) == 2
+
+
+def test_least_recently_used_results_are_dropped():
+    flight = SingleFlight(max_results=2)
+    flight.do("a", lambda: "a", ttl=60)
+    flight.do("b", lambda: "b", ttl=60)
+    flight.do("a", lambda: "new a", ttl=60)
+    flight.do("c", lambda: "c", ttl=60)
+
+    assert flight.stats()["results"] == 2
+    assert flight.do("a", lambda: "new a", ttl=60) == "a"
+    assert flight.do("b", lambda: "new b", ttl=60) == "new b"
+
+
+def test_async_calls_share_one_execution():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return object()
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.ado("key", fetch) for _ in range(CALLERS))
+        )
+
+    results = asyncio.run(main())
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["executions"] == 1
+
+
+def test_threads_and_coroutines_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def func():
+        started.set()
+        release.wait(5)
+        return "value"
+
+    leader = threading.Thread(target=flight.do, args=("key", func))
+    leader.start()
+    started.wait(5)
+
+    async def fetch():
+        return "other"
+
+    async def main():
+        waiter = asyncio.ensure_future(flight.ado("key", fetch))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await waiter
+
+    assert asyncio.run(main()) == "value"
+    leader.join()
+    assert flight.stats()["executions"] == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return "value"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", fetch))
+        waiter = asyncio.ensure_future(flight.ado("key", fetch))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(main()) == "value"
+
+
+def test_waiters_retry_when_the_leader_is_cancelled():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.1)
+        return "value"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("key", fetch))
+        waiter = asyncio.ensure_future(flight.ado("key", fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == "value"
+    assert flight.stats()["executions"] == 2
@@ -0,0 +1,114 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import requests
+
+from hubbleds.remote import LocalAPI
+from hubbleds.transport import (
+    ARROW_STREAM,
+    ARROW_TABLES,
+    BULK_HEADERS,
+    JSON,
+    bulk_measurements,
+    bulk_records,
+    is_arrow,
+    media_type,
+    read_bulk_payload,
+)
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
+from stub_server import CLASS_SIZE, start_server  # noqa: E402
+
+ROWS = 500
+
+
+@pytest.fixture(scope="module")
+def api_url():
+    server = start_server(ROWS)
+    yield f"http://127.0.0.1:{server.server_port}/hubbles_law"
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def json_only_api_url():
+    server = start_server(ROWS, arrow=False)
+    yield f"http://127.0.0.1:{server.server_port}/hubbles_law"
+    server.shutdown()
+
+
+def get(url, accept):
+    r = requests.get(url, headers={"Accept": accept})
+    r.raise_for_status()
+    return r
+
+
+def assert_same_measurements(a, b):
+    assert len(a) == len(b)
+    for name in (
+        "student_id", "class_id", "galaxy_id", "est_dist_value", "velocity_value"
+    ):
+        np.testing.assert_array_equal(a.column(name), b.column(name))
+
+
+def test_json_when_arrow_not_accepted(api_url):
+    r = get(f"{api_url}/class-measurements/1/2", JSON)
+    assert media_type(r.headers) == JSON
+    assert len(bulk_measurements(read_bulk_payload(r.headers, r.content))) == CLASS_SIZE
+
+
+def test_single_table_is_standard_arrow_stream(api_url):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc  # noqa: F401
+
+    r = get(f"{api_url}/class-measurements/1/2", ARROW_STREAM)
+    assert media_type(r.headers) == ARROW_STREAM
+    # Readable by any Arrow client
+    table = pa.ipc.open_stream(r.content).read_all()
+    assert table.num_rows == CLASS_SIZE
+
+
+@pytest.mark.parametrize("endpoint, expected", [
+    ("class-measurements/1/2", ARROW_STREAM),
+    ("all-data", ARROW_TABLES),
+])
+def test_arrow_matches_json(api_url, endpoint, expected):
+    pytest.importorskip("pyarrow")
+    url = f"{api_url}/{endpoint}"
+
+    arrow = get(url, f"{ARROW_STREAM}, {ARROW_TABLES}, {JSON};q=0.9")
+    assert media_type(arrow.headers) == expected
+    arrow_payload = read_bulk_payload(arrow.headers, arrow.content)
+
+    plain = get(url, JSON)
+    json_payload = read_bulk_payload(plain.headers, plain.content)
+
+    assert_same_measurements(
+        bulk_measurements(arrow_payload), bulk_measurements(json_payload)
+    )
+    if endpoint == "all-data":
+        for key in ("studentData", "classData"):
+            assert bulk_records(arrow_payload, key) == bulk_records(json_payload, key)
+
+
+def test_all_data_decodes_the_same_in_both_formats(api_url):
+    pytest.importorskip("pyarrow")
+    url = f"{api_url}/all-data"
+    arrow, plain = get(url, BULK_HEADERS["Accept"]), get(url, JSON)
+
+    arrow_payload = read_bulk_payload(arrow.headers, arrow.content)
+    json_payload = read_bulk_payload(plain.headers, plain.content)
+    arrow_data = LocalAPI._decode_all_data(arrow_payload)
+    json_data = LocalAPI._decode_all_data(json_payload)
+    assert_same_measurements(arrow_data[0], json_data[0])
+    assert arrow_data[1] == json_data[1]
+    assert arrow_data[2] == json_data[2]
+
+
+def test_falls_back_to_json(json_only_api_url):
+    r = get(f"{json_only_api_url}/all-data", BULK_HEADERS["Accept"])
+    assert not is_arrow(r.headers)
+    payload = read_bulk_payload(r.headers, r.content)
+    measurements, _, _ = LocalAPI._decode_all_data(payload)
+    assert len(measurements) > 0
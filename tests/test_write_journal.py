@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+pytest.importorskip("cosmicds")
+
+from hubbleds.write_journal import WriteJournal  # noqa: E402
+
+
+def record(journal, key, body, kind="measurement", context=None):
+    journal.record(key, kind, "PUT", f"https://api/{key}", json.dumps(body), context)
+
+
+@pytest.fixture
+def journal():
+    journal = WriteJournal("")
+    yield journal
+    journal.close()
+
+
+def test_pending_writes_are_replayed_oldest_first(journal):
+    record(journal, "a", {"value": 1})
+    record(journal, "b", {"value": 2}, kind="story-state", context={"tracker_key": [1]})
+
+    entries = journal.pending()
+    assert [entry.key for entry in entries] == ["a", "b"]
+    assert entries[1].kind == "story-state"
+    assert entries[1].context == {"tracker_key": [1]}
+    assert entries[0].context is None
+    assert json.loads(entries[0].body) == {"value": 1}
+
+
+def test_newer_write_supersedes_pending_write(journal):
+    record(journal, "a", {"value": 1})
+    record(journal, "b", {"value": 2})
+    record(journal, "a", {"value": 3})
+
+    entries = journal.pending()
+    assert [entry.key for entry in entries] == ["b", "a"]
+    assert json.loads(entries[1].body) == {"value": 3}
+    assert journal.pending_count() == 2
+
+
+def test_replay_keeps_writes_journaled_meanwhile(journal):
+    record(journal, "a", {"value": 1})
+    record(journal, "b", {"value": 2})
+    replaying = journal.pending()
+
+    # A newer write of `a` fails while the older one is being replayed
+    record(journal, "a", {"value": 3})
+    assert [entry.key for entry in journal.current(replaying)] == ["b"]
+
+    journal.replayed_entries(replaying)
+    entries = journal.pending()
+    assert [entry.key for entry in entries] == ["a"]
+    assert json.loads(entries[0].body) == {"value": 3}
+    assert journal.stats()["replayed"] == 1
+
+
+def test_rejected_replays_are_dropped(journal):
+    record(journal, "a", {"value": 1})
+    journal.replayed_entries(journal.pending(), accepted=False)
+
+    stats = journal.stats()
+    assert stats["pending"] == 0
+    assert stats["dropped"] == 1
+    assert stats["replayed"] == 0
+
+
+def test_successful_writes_discard_pending_ones(journal):
+    record(journal, "a", {"value": 1})
+    record(journal, "b", {"value": 2})
+    journal.discard(["a", "unknown"])
+    assert [entry.key for entry in journal.pending()] == ["b"]
+
+
+def test_failed_replays_are_counted(journal):
+    record(journal, "a", {"value": 1})
+    journal.attempted(journal.pending())
+    journal.attempted(journal.pending())
+    assert journal.pending()[0].attempts == 2
+
+
+def test_pending_is_limited(journal):
+    for index in range(5):
+        record(journal, str(index), {"value": index})
+    assert [entry.key for entry in journal.pending(limit=2)] == ["0", "1"]
+
+
+def test_pending_writes_survive_a_restart(tmp_path):
+    path = (tmp_path / "journal.sqlite3").as_posix()
+    journal = WriteJournal(path)
+    record(journal, "a", {"value": 1})
+    journal.close()
+
+    reopened = WriteJournal(path)
+    try:
+        entries = reopened.pending()
+        assert [entry.key for entry in entries] == ["a"]
+        assert json.loads(entries[0].body) == {"value": 1}
+    finally:
+        reopened.close()